@@ -8,8 +8,10 @@ includes a helper function `index_range` to calculate the start and end
 indexes for each page.
 """
 
-import csv
-from typing import List, Tuple
+from typing import List, Optional, Sequence, Tuple
+
+from dataset_snapshot import load_dataset
+from row_offset_index import MappedDataset
 
 
 def index_range(page: int, page_size: int) -> Tuple[int, int]:
@@ -50,31 +52,47 @@ class Server:
 
     DATA_FILE = "Popular_Baby_Names.csv"
 
-    def __init__(self):
+    def __init__(self, mapped: bool = False,
+                 workers: Optional[int] = None):
         """
         Initializes a new Server instance.
 
         This constructor initializes the dataset to `None`. The dataset
         will be loaded from the CSV file the first time it is accessed.
+
+        Args:
+            mapped (bool): Memory-map the CSV file and parse only the rows
+            that are read, using a persisted row-offset index, instead of
+            loading the whole file. Defaults to False.
+            workers (int): Parse the CSV file with this many processes when
+            it has to be parsed. Defaults to a single pass.
         """
         self.__dataset = None
+        self.__mapped = mapped
+        self.__workers = workers
 
-    def dataset(self) -> List[List]:
+    def dataset(self) -> Sequence[List]:
         """
         Cached dataset.
 
         Loads the dataset from the CSV file if it hasn't been loaded yet.
-        The dataset is cached to avoid reloading the file multiple times.
+        The dataset is cached to avoid reloading the file multiple times. Rows
+        are kept in a `ColumnarDataset`, which stores typed columns and only
+        builds the row lists that are actually accessed, and are read from
+        the dataset's binary snapshot when it matches the CSV file. In mapped
+        mode rows are parsed straight from a `MappedDataset` when they are
+        read.
 
         Returns:
-            List[List]: A list of lists where each inner list represents
+            Sequence[List]: A sequence where each item is a list representing
             a row from the dataset (excluding the header row).
         """
         if self.__dataset is None:
-            with open(self.DATA_FILE) as f:
-                reader = csv.reader(f)
-                dataset = [row for row in reader]
-            self.__dataset = dataset[1:]  # Skip the header row
+            if self.__mapped:
+                self.__dataset = MappedDataset(self.DATA_FILE)
+            else:
+                self.__dataset = load_dataset(self.DATA_FILE,
+                                              self.__workers)
 
         return self.__dataset
 
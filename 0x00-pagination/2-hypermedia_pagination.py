@@ -6,11 +6,21 @@ Advanced pagination module.
 This module extends the Server class with a `get_hyper` method that provides
 additional pagination information in the form of a dictionary. The module
 is designed to work with a dataset of popular baby names stored in a CSV file.
+Rows can be inserted, deleted and updated through the Server, and pages and
+page counts stay correct without rebuilding any index. Whole datasets can be
+streamed page by page with `iter_pages` or written out with `export`, and
+`reload` reads the CSV file again.
 """
 
 import csv
+import json
+from itertools import islice
 from math import ceil
-from typing import List, Dict
+from typing import IO, Iterator, List, Dict, Optional, Sequence
+
+from dataset_snapshot import load_dataset
+from live_index import IndexedDataset
+from row_offset_index import MappedDataset
 
 # Import the index_range function from a separate module
 index_range = __import__('0-simple_helper_function').index_range
@@ -27,41 +37,147 @@ class Server:
 
     DATA_FILE = "Popular_Baby_Names.csv"
 
-    def __init__(self):
+    def __init__(self, mapped: bool = False,
+                 workers: Optional[int] = None):
         """
         Initialize a new Server instance.
 
-        This constructor initializes the dataset to `None`. The dataset
-        will be loaded from the CSV file the first time it is accessed.
+        This constructor initializes the dataset and its indexed version to
+        `None`. The dataset will be loaded from the CSV file the first time it
+        is accessed, and indexed the first time it is changed.
+
+        Args:
+            mapped (bool): Memory-map the CSV file and parse only the rows
+            that are read, using a persisted row-offset index, instead of
+            loading the whole file. Defaults to False.
+            workers (int): Parse the CSV file with this many processes when
+            it has to be parsed. Defaults to a single pass.
         """
         self.__dataset = None
+        self.__mapped = mapped
+        self.__workers = workers
+        self.__indexed_dataset = None
 
-    def dataset(self) -> List[List]:
+    def dataset(self) -> Sequence[List]:
         """
         Cached dataset.
 
         Loads the dataset from the CSV file if it hasn't been loaded yet.
-        The dataset is cached to avoid reloading the file multiple times.
+        The dataset is cached to avoid reloading the file multiple times. Rows
+        are kept in a `ColumnarDataset`, which stores typed columns and only
+        builds the row lists that are actually accessed, and are read from
+        the dataset's binary snapshot when it matches the CSV file. In mapped
+        mode rows are parsed straight from a `MappedDataset` when they are
+        read.
 
         Returns:
-            List[List]: A list of lists where each inner list represents
+            Sequence[List]: A sequence where each item is a list representing
             a row from the dataset (excluding the header row).
         """
         if self.__dataset is None:
-            with open(self.DATA_FILE) as f:
-                reader = csv.reader(f)
-                dataset = [row for row in reader]
-            self.__dataset = dataset[1:]  # Skip the header row
+            if self.__mapped:
+                self.__dataset = MappedDataset(self.DATA_FILE)
+            else:
+                self.__dataset = load_dataset(self.DATA_FILE,
+                                              self.__workers)
 
         return self.__dataset
 
-    def get_page(self, page: int = 1, page_size: int = 10) -> List[List]:
+    def indexed_dataset(self) -> IndexedDataset:
+        """
+        Index the dataset by sorting position, starting at 0.
+
+        Creates an indexed version of the dataset where each key is the
+        original row number (starting from 0) and each value is the
+        corresponding row data. This indexed dataset is useful for maintaining
+        consistent pagination even if rows are removed.
+
+        The index is an `IndexedDataset`: it behaves like a dictionary (rows
+        are removed with `del`), reads rows from the dataset on demand, and
+        tracks the remaining row numbers in a Fenwick tree so pages can be
+        found in O(log n) however many rows were removed.
+
+        Returns:
+            IndexedDataset: A mapping from the original row number to the
+            row data.
+        """
+        if self.__indexed_dataset is None:
+            self.__indexed_dataset = IndexedDataset(self.dataset())
+        return self.__indexed_dataset
+
+    def reload(self) -> None:
+        """
+        Drop the loaded dataset, so it is read again from the CSV file.
+
+        The file is read the next time the dataset is needed, and rows
+        inserted, deleted or updated through the Server are forgotten.
+        """
+        self.__dataset = None
+        self.__indexed_dataset = None
+
+    def insert(self, row: List) -> int:
+        """
+        Add a row after every existing row.
+
+        Args:
+            row (List): The row to add.
+
+        Returns:
+            int: The row number assigned to the new row.
+        """
+        assert isinstance(row, list)
+        return self.indexed_dataset().append(row)
+
+    def delete(self, row_id: int) -> None:
+        """
+        Delete a row. The other rows keep their row numbers.
+
+        Args:
+            row_id (int): The row number of the row to delete.
+
+        Raises:
+            KeyError: If there is no such row.
+        """
+        del self.indexed_dataset()[row_id]
+
+    def update(self, row_id: int, row: List) -> None:
+        """
+        Replace the contents of a row.
+
+        Args:
+            row_id (int): The row number of the row to replace.
+            row (List): The new row.
+
+        Raises:
+            KeyError: If there is no such row.
+        """
+        assert isinstance(row, list)
+        indexed_dataset = self.indexed_dataset()
+        if row_id not in indexed_dataset:
+            raise KeyError(row_id)
+        indexed_dataset[row_id] = row
+
+    def get_page(self, page: int = 1, page_size: int = 10,
+                 filter: Optional[Dict] = None,
+                 order_by: Optional[str] = None) -> List[List]:
         """
         Retrieves a page of data from the dataset.
 
+        Pages count only the rows that have not been deleted, and locating a
+        page costs O(log n + page_size). With a `filter`, pages count only
+        the matching rows, which are looked up in per-column secondary
+        indexes built the first time a column is filtered on. With an
+        `order_by`, rows are paged in that column's order using a sort
+        permutation that is built once and kept up to date.
+
         Args:
             page (int): The page number (1-indexed). Defaults to 1.
             page_size (int): The number of items per page. Defaults to 10.
+            filter (Dict): Maps column names (or positions) to the value the
+            rows must have, e.g. `{"Gender": "FEMALE", "Year of Birth":
+            2016}`. Defaults to no filter.
+            order_by (str): The column to sort by, prefixed with "-" for
+            descending order, e.g. "-Count". Defaults to row order.
 
         Returns:
             List[List]: A list of rows corresponding to the given page. Each
@@ -74,13 +190,29 @@ class Server:
         assert page > 0 and page_size > 0
 
         start, end = index_range(page, page_size)
-        try:
+        if order_by:
+            indexed_dataset = self.indexed_dataset()
+            candidates = indexed_dataset.matching(filter) if filter else None
+            return indexed_dataset.rows_for(
+                indexed_dataset.ordered(order_by, start, end, candidates))
+
+        if filter:
+            indexed_dataset = self.indexed_dataset()
+            return indexed_dataset.rows_for(
+                indexed_dataset.matching(filter)[start:end])
+
+        if self.__indexed_dataset is None:
+            # Nothing was changed yet, so rows are still at their positions
             return self.dataset()[start:end]
-        except IndexError:
-            return []
 
-    def get_hyper(self, page: int = 1, page_size:
-                  int = 10) -> Dict[str, int or List[List] or None]:
+        indexed_dataset = self.__indexed_dataset
+        return indexed_dataset.rows_for(
+            indexed_dataset.page_at(start, page_size))
+
+    def get_hyper(self, page: int = 1, page_size: int = 10,
+                  filter: Optional[Dict] = None,
+                  order_by: Optional[str] = None
+                  ) -> Dict[str, int or List[List] or None]:
         """
         Returns a dictionary containing pagination information and the data
         for the given page.
@@ -88,6 +220,9 @@ class Server:
         Args:
             page (int): The page number (1-indexed). Defaults to 1.
             page_size (int): The number of items per page. Defaults to 10.
+            filter (Dict): Restricts the pages to matching rows, as for
+            `get_page`. `total_pages` then comes from the number of matches.
+            order_by (str): The order of the rows, as for `get_page`.
 
         Returns:
             dict: A dictionary with the following key-value pairs:
@@ -113,8 +248,13 @@ class Server:
                     "total_pages": 10
                 }
         """
-        page_data = self.get_page(page, page_size)
-        total_data = len(self.dataset())
+        page_data = self.get_page(page, page_size, filter, order_by)
+        if filter:
+            total_data = len(self.indexed_dataset().matching(filter))
+        elif self.__indexed_dataset is None:
+            total_data = len(self.dataset())
+        else:
+            total_data = len(self.__indexed_dataset)
         total_pages = ceil(total_data / page_size)
 
         return {
@@ -125,3 +265,81 @@ class Server:
             "prev_page": page - 1 if page > 1 else None,
             "total_pages": total_pages
         }
+
+    def iter_pages(self, page_size: int = 10,
+                   start: int = 1) -> Iterator[List[List]]:
+        """
+        Stream the dataset one page at a time.
+
+        Pages are read straight from the dataset (or, once rows have been
+        changed, from a single walk over the remaining row numbers), so only
+        the current page is ever materialized.
+
+        Args:
+            page_size (int): The number of items per page. Defaults to 10.
+            start (int): The first page to yield (1-indexed). Defaults to 1.
+
+        Yields:
+            List[List]: The rows of each page, in order, up to the last
+            non-empty page.
+
+        Raises:
+            AssertionError: If `page_size` or `start` are not positive
+            integers.
+        """
+        assert isinstance(page_size, int) and isinstance(start, int)
+        assert page_size > 0 and start > 0
+
+        offset, _ = index_range(start, page_size)
+        if self.__indexed_dataset is None:
+            dataset = self.dataset()
+            for begin in range(offset, len(dataset), page_size):
+                yield dataset[begin:begin + page_size]
+            return
+
+        indexed_dataset = self.__indexed_dataset
+        row_ids = indexed_dataset.live.iter_from_rank(offset)
+        while True:
+            page_ids = list(islice(row_ids, page_size))
+            if not page_ids:
+                return
+            yield indexed_dataset.rows_for(page_ids)
+
+    def export(self, fp: IO[str], format: str = "csv",
+               page_size: int = 1000) -> int:
+        """
+        Write the whole dataset to a text file in bounded memory.
+
+        Args:
+            fp (IO[str]): The file to write to. CSV output expects it to be
+            opened with `newline=""`.
+            format (str): "csv" to write the header row and every row, or
+            "ndjson" to write one JSON object per row, keyed by the header.
+            Defaults to "csv".
+            page_size (int): How many rows are materialized at a time.
+            Defaults to 1000.
+
+        Returns:
+            int: The number of rows written.
+
+        Raises:
+            ValueError: If `format` is not supported.
+        """
+        header = getattr(self.dataset(), "header", [])
+        if format == "csv":
+            writer = csv.writer(fp)
+            writer.writerow(header)
+            write = writer.writerows
+        elif format == "ndjson":
+            def write(rows):
+                """Write rows as JSON objects, one per line."""
+                fp.writelines(json.dumps(dict(zip(header, row))) + "\n"
+                              for row in rows)
+        else:
+            raise ValueError("unsupported export format: {}".format(format))
+
+        count = 0
+        for page in self.iter_pages(page_size):
+            write(page)
+            count += len(page)
+        return count
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+"""
+Asynchronous pagination module.
+
+This module provides an `AsyncServer` class that serves the same pages as
+the deletion-resilient `Server` from coroutines, without blocking the event
+loop. The dataset is loaded and indexed in a worker thread the first time
+it is needed, and every coroutine that arrives while the load is running
+waits for that same load instead of starting its own.
+"""
+
+import asyncio
+import functools
+from typing import Dict, List, Optional
+
+# Import the deletion-resilient Server class from a separate module
+Server = __import__('3-hypermedia_del_pagination').Server
+
+
+class AsyncServer:
+    """
+    Asynchronous counterpart of the pagination Server.
+
+    Cheap page lookups run directly on the event loop once the dataset is
+    loaded. Requests that may have to build a secondary or sort index first
+    (those with a `filter` or an `order_by`) run in a worker thread; the
+    indexed dataset serializes them with each other and with changes.
+    """
+
+    def __init__(self, mapped: bool = False,
+                 workers: Optional[int] = None):
+        """
+        Initialize a new AsyncServer instance.
+
+        Args:
+            mapped (bool): Memory-map the CSV file instead of loading it,
+            as for `Server`. Defaults to False.
+            workers (int): Number of processes to parse the CSV file with,
+            as for `Server`. Defaults to a single pass.
+        """
+        self.__server = Server(mapped=mapped, workers=workers)
+        self.__loading = None
+
+    @property
+    def server(self) -> Server:
+        """
+        The underlying synchronous Server.
+        """
+        return self.__server
+
+    def __load(self) -> None:
+        """
+        Load and index the dataset. Runs in a worker thread.
+        """
+        self.__server.dataset()
+        self.__server.indexed_dataset()
+
+    async def load(self) -> None:
+        """
+        Load and index the dataset, once.
+
+        The first caller starts the load in a worker thread; callers that
+        arrive before it finishes wait for the same load. A caller being
+        cancelled does not cancel the load for the others, and a failed load
+        is retried by the next caller.
+        """
+        if self.__loading is None:
+            loop = asyncio.get_running_loop()
+            self.__loading = loop.run_in_executor(None, self.__load)
+        loading = self.__loading
+        try:
+            await asyncio.shield(loading)
+        except Exception:
+            if self.__loading is loading:
+                self.__loading = None
+            raise
+
+    async def get_page(self, page: int = 1, page_size: int = 10,
+                       filter: Optional[Dict] = None,
+                       order_by: Optional[str] = None) -> List[List]:
+        """
+        Retrieves a page of data from the dataset.
+
+        Args:
+            page (int): The page number (1-indexed). Defaults to 1.
+            page_size (int): The number of items per page. Defaults to 10.
+            filter (Dict): Column values the rows must have.
+            order_by (str): The column to sort by, "-" prefixed for
+            descending order.
+
+        Returns:
+            List[List]: The rows of the page, as for `Server.get_page`.
+        """
+        await self.load()
+        if filter or order_by:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(
+                self.__server.get_page, page, page_size, filter, order_by))
+        return self.__server.get_page(page, page_size)
+
+    async def get_hyper(self, page: int = 1, page_size: int = 10,
+                        filter: Optional[Dict] = None,
+                        order_by: Optional[str] = None) -> Dict:
+        """
+        Returns a dictionary containing pagination information and the data
+        for the given page.
+
+        Args:
+            page (int): The page number (1-indexed). Defaults to 1.
+            page_size (int): The number of items per page. Defaults to 10.
+            filter (Dict): Column values the rows must have.
+            order_by (str): The column to sort by, "-" prefixed for
+            descending order.
+
+        Returns:
+            Dict: The page and its metadata, as for `Server.get_hyper`.
+        """
+        await self.load()
+        if filter or order_by:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(
+                self.__server.get_hyper, page, page_size, filter, order_by))
+        return self.__server.get_hyper(page, page_size)
+
+    async def get_hyper_index(self, index: int = None,
+                              page_size: int = 10) -> Dict:
+        """
+        Return paginated data ensuring no items are skipped.
+
+        Args:
+            index (int): The starting index for pagination.
+            page_size (int): The number of items per page. Defaults to 10.
+
+        Returns:
+            Dict: The page and its metadata, as for
+            `Server.get_hyper_index`.
+        """
+        await self.load()
+        return self.__server.get_hyper_index(index, page_size)
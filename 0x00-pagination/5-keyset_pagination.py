@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+"""
+Keyset pagination module.
+
+This module extends the deletion-resilient `Server` with `get_keyset`,
+which pages through the dataset with opaque cursor tokens instead of page
+numbers or raw indexes. A token records the dataset version it was issued
+for and the key of the last row served, and is signed so clients cannot
+alter it. Each version is an immutable snapshot of the dataset that is kept
+alive while tokens refer to it, so a client walking through the pages sees
+the rows as they were when it started, even if rows are changed or the CSV
+file is reloaded in the meantime.
+"""
+
+import os
+from typing import Dict, Optional
+
+from cursor_token import decode_cursor, encode_cursor
+from dataset_versions import VersionRegistry
+
+# Import the deletion-resilient Server class from a separate module
+DelServer = __import__('3-hypermedia_del_pagination').Server
+
+
+class Server(DelServer):
+    """
+    Server class to paginate a database of popular baby names.
+
+    This class adds keyset (seek) pagination on top of the page number and
+    index based pagination of the deletion-resilient Server.
+    """
+
+    def __init__(self, mapped: bool = False,
+                 workers: Optional[int] = None,
+                 secret: Optional[bytes] = None):
+        """
+        Initialize a new Server instance.
+
+        Args:
+            mapped (bool): Memory-map the CSV file instead of loading it,
+            as for the deletion-resilient `Server`. Defaults to False.
+            workers (int): Number of processes to parse the CSV file with.
+            Defaults to a single pass.
+            secret (bytes): The key cursor tokens are signed with. Defaults
+            to a random key, so tokens are only valid for this instance.
+        """
+        super().__init__(mapped, workers)
+        self.__secret = secret or os.urandom(32)
+        self.__versions = VersionRegistry()
+        self.__published_changes = None
+
+    def reload(self) -> None:
+        """
+        Read the CSV file again.
+
+        Cursors issued before the reload keep paging through the dataset
+        they started with; new walks see the reloaded dataset.
+        """
+        super().reload()
+        self.__published_changes = None
+
+    def current_version(self) -> int:
+        """
+        Return the version new walks start from.
+
+        A new version is published, as a snapshot of the indexed dataset,
+        the first time a walk starts after the dataset was changed.
+
+        Returns:
+            int: The version number.
+        """
+        indexed_dataset = self.indexed_dataset()
+        if (self.__versions.current is None
+                or self.__published_changes != indexed_dataset.changes):
+            self.__versions.publish(indexed_dataset.snapshot())
+            self.__published_changes = indexed_dataset.changes
+        return self.__versions.current
+
+    def get_keyset(self, cursor: Optional[str] = None, page_size: int = 10,
+                   order_by: Optional[str] = None) -> Dict:
+        """
+        Return a page of rows following a cursor.
+
+        A page costs O(log n + page_size) however deep into the dataset the
+        cursor is, once the ordering's sort permutation exists. Rows come
+        from the version the walk started on. If that version is no longer
+        kept (see `VersionRegistry`), the walk carries on after the same key
+        in the current version instead.
+
+        Args:
+            cursor (str): The `next_cursor` of the previous page, or None to
+            start a new walk from the first row.
+            page_size (int): The number of items per page. Defaults to 10.
+            order_by (str): The column to sort by, prefixed with "-" for
+            descending order, for a new walk. Cursors keep the order their
+            walk started with. Defaults to row order.
+
+        Returns:
+            Dict: A dictionary with the following key-value pairs:
+                - cursor (str or None): The cursor the page was read from.
+                - next_cursor (str or None): The cursor of the next page, or
+                None if this is the last page.
+                - version (int): The dataset version the page was read from.
+                - page_size (int): The number of items on the current page.
+                - data (List[List]): The rows of the current page.
+
+        Raises:
+            AssertionError: If `page_size` is not a positive integer.
+            ValueError: If `cursor` is not a token issued by this Server.
+        """
+        assert isinstance(page_size, int) and page_size > 0
+
+        key, reference = None, None
+        if cursor is None:
+            version = self.current_version()
+        else:
+            state = decode_cursor(cursor, self.__secret)
+            version, reference = state["v"], state["r"]
+            order_by, key = state["o"], state["k"]
+        dataset = self.__versions.get(version)
+        if dataset is None:
+            version = self.current_version()
+            dataset = self.__versions.get(version)
+
+        # Read one extra row to know whether there is a next page
+        page_indices = dataset.page_after(key, page_size + 1, order_by)
+        next_cursor = None
+        if len(page_indices) > page_size:
+            page_indices = page_indices[:page_size]
+            next_cursor = encode_cursor({
+                "v": version,
+                "r": self.__versions.acquire(version),
+                "o": order_by,
+                "k": dataset.key_of(page_indices[-1], order_by),
+            }, self.__secret)
+        if reference is not None:
+            self.__versions.release(state["v"], reference)
+        page = dataset.rows_for(page_indices)
+
+        return {
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+            'version': version,
+            'page_size': len(page),
+            'data': page
+        }
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+
+"""
+Pagination benchmark module.
+
+This module measures the pagination helpers and Server classes on datasets
+of any size. `generate` writes a synthetic CSV file by repeating the rows of
+`Popular_Baby_Names.csv`, `run` times a set of scenarios on such a file and
+prints the results as JSON, and `compare` reports the scenarios that got
+slower between two result files, so regressions can be caught by comparing
+a run against a saved baseline:
+
+    ./benchmark.py generate --rows 1000000 --output names-1e6.csv
+    ./benchmark.py run --file names-1e6.csv --output before.json
+    ./benchmark.py run --file names-1e6.csv --output after.json
+    ./benchmark.py compare before.json after.json
+
+Each scenario runs in a fresh process, so its peak resident set size (RSS)
+and its cold start are not affected by the scenarios run before it.
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Optional
+
+# Import the pagination helpers from their separate modules
+index_range = __import__('0-simple_helper_function').index_range
+Server = __import__('3-hypermedia_del_pagination').Server
+
+SOURCE_FILE = "Popular_Baby_Names.csv"
+GENERATE_CHUNK = 10000
+PERCENTILES = (50, 90, 99)
+
+
+def generate(path: str, rows: int, seed: int = 0) -> int:
+    """
+    Write a synthetic dataset of a given size.
+
+    The rows of the source file are repeated with their year of birth
+    shifted back by one for each repetition (wrapping after a century) and
+    their count randomly varied by up to 20%, so every column keeps a
+    realistic number of distinct values. The file is written in chunks, so
+    any size fits in memory.
+
+    Args:
+        path (str): Path of the CSV file to write.
+        rows (int): The number of rows to write, excluding the header.
+        seed (int): Seed of the random count variations. Defaults to 0.
+
+    Returns:
+        int: The number of rows written.
+    """
+    with open(SOURCE_FILE, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        source = [row for row in reader if len(row) == len(header)]
+
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for start in range(0, rows, GENERATE_CHUNK):
+            chunk = []
+            for i in range(start, min(start + GENERATE_CHUNK, rows)):
+                year, gender, ethnicity, name, count, rank = \
+                    source[i % len(source)]
+                count = max(1, round(int(count) * rng.uniform(0.8, 1.2)))
+                shift = i // len(source) % 100
+                chunk.append([int(year) - shift, gender,
+                              ethnicity, name, count, rank])
+            writer.writerows(chunk)
+    return rows
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    """
+    Return a percentile of sorted samples, by the nearest-rank method.
+    """
+    rank = max(1, -(-len(samples) * percent // 100))
+    return samples[int(rank) - 1]
+
+
+def peak_rss() -> int:
+    """
+    Return the peak resident set size of this process, in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def open_server(options: Dict) -> Server:
+    """
+    Create a Server reading the benchmarked file.
+    """
+    server = Server(mapped=options["mapped"], workers=options["workers"])
+    server.DATA_FILE = options["file"]
+    return server
+
+
+def remove_side_files(path: str) -> None:
+    """
+    Remove the row-offset index and the snapshot saved next to a file.
+    """
+    for suffix in (".idx", ".snap"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def timed(operation: Callable[[], object], count: int) -> List[float]:
+    """
+    Call an operation a number of times.
+
+    Returns:
+        List[float]: The latency of each call, in seconds.
+    """
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_index_range(options: Dict) -> Dict:
+    """
+    Time `index_range` on random pages.
+    """
+    rng = random.Random(options["seed"])
+    page_size = options["page_size"]
+    pages = iter([rng.randint(1, 1 << 20) for _ in range(options["ops"])])
+    return {"samples": timed(lambda: index_range(next(pages), page_size),
+                             options["ops"])}
+
+
+def bench_start(options: Dict, cold: bool) -> Dict:
+    """
+    Time loading the dataset and serving its first page.
+    """
+    def start():
+        """Serve the first page from a new Server."""
+        if cold:
+            remove_side_files(options["file"])
+        open_server(options).get_page(1, options["page_size"])
+
+    if not cold:
+        start()  # Leave the snapshot or row-offset index behind
+    return {"samples": timed(start, options["repeat"])}
+
+
+def bench_cold_start(options: Dict) -> Dict:
+    """
+    Time the first page of a Server with no saved snapshot or index.
+    """
+    return bench_start(options, True)
+
+
+def bench_warm_start(options: Dict) -> Dict:
+    """
+    Time the first page of a Server whose snapshot or index is saved.
+    """
+    return bench_start(options, False)
+
+
+def bench_random_pages(options: Dict, method: str) -> Dict:
+    """
+    Time a Server method on uniformly random pages.
+    """
+    server = open_server(options)
+    page_size = options["page_size"]
+    pages = -(-len(server.dataset()) // page_size)
+    rng = random.Random(options["seed"])
+    serve = getattr(server, method)
+    return {"samples": timed(lambda: serve(rng.randint(1, pages), page_size),
+                             options["ops"])}
+
+
+def bench_get_page(options: Dict) -> Dict:
+    """
+    Time `get_page` on random pages.
+    """
+    return bench_random_pages(options, "get_page")
+
+
+def bench_get_hyper(options: Dict) -> Dict:
+    """
+    Time `get_hyper` on random pages.
+    """
+    return bench_random_pages(options, "get_hyper")
+
+
+def bench_export(options: Dict) -> Dict:
+    """
+    Time exporting the whole dataset as CSV, discarding the output.
+    """
+    server = open_server(options)
+    server.dataset()
+    rows = []
+    with open(os.devnull, "w", newline="") as sink:
+        samples = timed(lambda: rows.append(server.export(sink)),
+                        options["repeat"])
+    return {"samples": samples, "items": sum(rows), "unit": "rows"}
+
+
+def bench_get_hyper_index(options: Dict) -> Dict:
+    """
+    Time `get_hyper_index` from random indexes after deleting rows.
+
+    A fraction of the rows, given by the `delete` option, is deleted at
+    random first; the time that takes is reported as `setup_seconds`.
+    """
+    server = open_server(options)
+    indexed_dataset = server.indexed_dataset()
+    rng = random.Random(options["seed"])
+    size = indexed_dataset.capacity
+    victims = rng.sample(range(size), int(size * options["delete"]))
+
+    started = time.perf_counter()
+    for row_id in victims:
+        server.delete(row_id)
+    setup = time.perf_counter() - started
+
+    page_size = options["page_size"]
+    samples = timed(lambda: server.get_hyper_index(rng.randrange(size),
+                                                   page_size),
+                    options["ops"])
+    return {"samples": samples, "setup_seconds": setup}
+
+
+SCENARIOS = {
+    "index_range": bench_index_range,
+    "cold_start": bench_cold_start,
+    "warm_start": bench_warm_start,
+    "get_page": bench_get_page,
+    "get_hyper": bench_get_hyper,
+    "export": bench_export,
+    "get_hyper_index": bench_get_hyper_index,
+}
+
+
+def run_scenario(name: str, options: Dict) -> Dict:
+    """
+    Run one scenario and summarize its timings.
+
+    Args:
+        name (str): A key of `SCENARIOS`.
+        options (Dict): The benchmark options.
+
+    Returns:
+        Dict: The number of operations, the total time, the throughput (in
+        operations, or rows for exports, per second), the latency
+        percentiles and the peak RSS of the process.
+    """
+    result = SCENARIOS[name](options)
+    samples = sorted(result.pop("samples"))
+    seconds = sum(samples)
+    items = result.pop("items", len(samples))
+    summary = {
+        "ops": len(samples),
+        "seconds": seconds,
+        "throughput": items / seconds if seconds else None,
+        "unit": result.pop("unit", "ops") + "/s",
+        "latency_ms": {
+            "mean": seconds / len(samples) * 1000,
+            **{"p{}".format(percent): percentile(samples, percent) * 1000
+               for percent in PERCENTILES},
+            "max": samples[-1] * 1000,
+        },
+    }
+    summary.update(result)
+    summary["peak_rss_bytes"] = peak_rss()
+    return summary
+
+
+def run(options: Dict, scenarios: List[str]) -> Dict:
+    """
+    Run scenarios, each in a new process.
+
+    Returns:
+        Dict: The options, the environment and each scenario's summary.
+    """
+    results = {}
+    for name in scenarios:
+        context = get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(run_scenario, name, options).result()
+    return {
+        "options": options,
+        "file_bytes": os.path.getsize(options["file"]),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scenarios": results,
+    }
+
+
+def compare(before: Dict, after: Dict, threshold: float) -> List[str]:
+    """
+    List the scenarios whose latency got worse between two runs.
+
+    A scenario regressed if its mean or p99 latency grew by more than
+    `threshold` (a fraction, e.g. 0.1 for 10%).
+
+    Returns:
+        List[str]: A description of each regression.
+    """
+    regressions = []
+    for name, summary in after["scenarios"].items():
+        baseline = before["scenarios"].get(name)
+        if baseline is None:
+            continue
+        for metric in ("mean", "p99"):
+            old = baseline["latency_ms"][metric]
+            new = summary["latency_ms"][metric]
+            if old and new > old * (1 + threshold):
+                regressions.append("{} {}: {:.4f} ms -> {:.4f} ms (+{:.0%})"
+                                   .format(name, metric, old, new,
+                                           new / old - 1))
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Parse the command line and run the requested command.
+
+    Returns:
+        int: The exit status; 1 if `compare` found regressions.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pagination helpers and Servers.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generator = commands.add_parser("generate",
+                                    help="write a synthetic dataset")
+    generator.add_argument("--rows", type=lambda x: int(float(x)),
+                           required=True, help="number of rows, e.g. 1e6")
+    generator.add_argument("--output", required=True)
+    generator.add_argument("--seed", type=int, default=0)
+
+    runner = commands.add_parser("run", help="time scenarios")
+    runner.add_argument("--file", default=SOURCE_FILE)
+    runner.add_argument("--scenario", action="append",
+                        choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable); default all")
+    runner.add_argument("--ops", type=int, default=1000,
+                        help="operations per random access scenario")
+    runner.add_argument("--repeat", type=int, default=3,
+                        help="repetitions of start and export scenarios")
+    runner.add_argument("--page-size", type=int, default=10)
+    runner.add_argument("--delete", type=float, default=0.5,
+                        help="fraction of rows get_hyper_index deletes")
+    runner.add_argument("--mapped", action="store_true")
+    runner.add_argument("--workers", type=int)
+    runner.add_argument("--seed", type=int, default=0)
+    runner.add_argument("--output", help="also write the JSON here")
+
+    comparer = commands.add_parser("compare",
+                                   help="report regressions between runs")
+    comparer.add_argument("before")
+    comparer.add_argument("after")
+    comparer.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        generate(args.output, args.rows, args.seed)
+        return 0
+
+    if args.command == "compare":
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        regressions = compare(before, after, args.threshold)
+        for line in regressions:
+            print(line)
+        return 1 if regressions else 0
+
+    options = {
+        "file": os.path.abspath(args.file),
+        "ops": args.ops,
+        "repeat": args.repeat,
+        "page_size": args.page_size,
+        "delete": args.delete,
+        "mapped": args.mapped,
+        "workers": args.workers,
+        "seed": args.seed,
+    }
+    report = json.dumps(run(options, args.scenario or list(SCENARIOS)),
+                        indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Columnar dataset module.
+
+This module provides a `ColumnarDataset` class that stores the rows of a CSV
+file column by column instead of as a list of lists of strings. Columns whose
+cells are all integers are kept in typed `array` buffers, and every other
+column is dictionary encoded (each distinct string is stored once and rows
+only keep a small integer code). Rows are materialized on access, so slicing
+a page only builds the lists for that page.
+"""
+
+import csv
+from array import array
+from collections.abc import Sequence
+from typing import Iterable, Iterator, List, Optional, Union
+
+
+def _smallest_typecode(low: int, high: int, typecodes: str) -> str:
+    """
+    Pick the narrowest array typecode able to hold every value in a range.
+
+    Args:
+        low (int): The smallest value to store.
+        high (int): The largest value to store.
+        typecodes (str): Candidate typecodes, narrowest first.
+
+    Returns:
+        str: The first typecode in `typecodes` that fits `low` and `high`.
+    """
+    for typecode in typecodes:
+        bits = array(typecode).itemsize * 8
+        if typecode.isupper():
+            fits = low >= 0 and high < 2 ** bits
+        else:
+            fits = -2 ** (bits - 1) <= low and high < 2 ** (bits - 1)
+        if fits:
+            return typecode
+    return typecodes[-1]
+
+
+class _ColumnBuilder:
+    """
+    Accumulates the cells of one column while a dataset is being built.
+
+    A column starts out numeric and is converted to a dictionary encoded
+    column the first time it sees a cell that is not a canonical integer
+    (one that `str(int(cell))` gives back unchanged).
+    """
+
+    def __init__(self, padding: int = 0):
+        """
+        Initialize an empty column.
+
+        Args:
+            padding (int): Number of earlier rows that do not reach this
+            column and only need a placeholder.
+        """
+        self.numbers = array('q', [0]) * padding
+        self.codes = None
+        self.lookup = None
+        self.dictionary = None
+
+    def append(self, cell: str) -> None:
+        """
+        Append one cell to the column.
+
+        Args:
+            cell (str): The raw CSV cell.
+        """
+        if self.codes is None:
+            try:
+                number = int(cell)
+            except ValueError:
+                number = None
+            if (number is not None and str(number) == cell
+                    and -2 ** 63 <= number < 2 ** 63):
+                self.numbers.append(number)
+                return
+            self._to_categorical()
+
+        code = self.lookup.get(cell)
+        if code is None:
+            code = self.lookup[cell] = len(self.dictionary)
+            self.dictionary.append(cell)
+        self.codes.append(code)
+
+    def pad(self) -> None:
+        """
+        Append a placeholder for a row that is too short for this column.
+
+        Placeholders are never read back because rows remember their width.
+        """
+        if self.codes is None:
+            self.numbers.append(0)
+        else:
+            self.codes.append(0)
+
+    def _to_categorical(self) -> None:
+        """
+        Convert the numbers collected so far into dictionary codes.
+        """
+        self.lookup = {}
+        self.dictionary = []
+        self.codes = array('L')
+        for number in self.numbers:
+            cell = str(number)
+            code = self.lookup.get(cell)
+            if code is None:
+                code = self.lookup[cell] = len(self.dictionary)
+                self.dictionary.append(cell)
+            self.codes.append(code)
+        self.numbers = None
+
+    def finish(self):
+        """
+        Compact the column into its final representation.
+
+        Returns:
+            tuple: `(values, dictionary)` where `values` is a typed array and
+            `dictionary` is the list of distinct strings, or None for a
+            numeric column.
+        """
+        if self.codes is None:
+            values = self.numbers
+            if values:
+                typecode = _smallest_typecode(min(values), max(values),
+                                              'bhiq')
+                values = array(typecode, values)
+            return values, None
+
+        typecode = _smallest_typecode(0, max(len(self.dictionary) - 1, 0),
+                                      'BHI')
+        return array(typecode, self.codes), self.dictionary
+
+
+class ColumnarDataset(Sequence):
+    """
+    Read-only, column oriented view of a CSV file.
+
+    The dataset behaves like the list of rows `csv.reader` would produce
+    (excluding the header): it supports `len`, indexing and slicing, and each
+    row comes back as a fresh list of strings. Typed values are available
+    through `value`, `row` and `column` without re-parsing any text.
+    """
+
+    def __init__(self, header: List[str], columns: List, dictionaries: List,
+                 widths: array):
+        """
+        Initialize a dataset from already encoded columns.
+
+        Use `from_rows` or `from_csv` instead of calling this directly.
+
+        Args:
+            header (List[str]): The column names.
+            columns (List[array]): One typed array per column, holding
+            numbers for numeric columns and codes for encoded ones.
+            dictionaries (List[List[str] or None]): The distinct strings of
+            each encoded column, or None for numeric columns.
+            widths (array): The number of cells in each row.
+        """
+        self.header = header
+        self._columns = columns
+        self._dictionaries = dictionaries
+        self._widths = widths
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[List[str]],
+                  header: Optional[List[str]] = None) -> "ColumnarDataset":
+        """
+        Build a dataset from an iterable of rows.
+
+        Args:
+            rows (Iterable[List[str]]): The data rows, without the header.
+            header (List[str]): The column names. Defaults to no names.
+
+        Returns:
+            ColumnarDataset: The encoded dataset.
+        """
+        builders = []
+        widths = array('L')
+        for row in rows:
+            width = len(row)
+            while len(builders) < width:
+                builders.append(_ColumnBuilder(len(widths)))
+            for builder, cell in zip(builders, row):
+                builder.append(cell)
+            for builder in builders[width:]:
+                builder.pad()
+            widths.append(width)
+
+        columns, dictionaries = [], []
+        for builder in builders:
+            values, dictionary = builder.finish()
+            columns.append(values)
+            dictionaries.append(dictionary)
+        typecode = _smallest_typecode(0, max(widths, default=0), 'BHI')
+        return cls(list(header or []), columns, dictionaries,
+                   array(typecode, widths))
+
+    @classmethod
+    def concat(cls, parts: List["ColumnarDataset"],
+               header: Optional[List[str]] = None) -> "ColumnarDataset":
+        """
+        Join datasets end to end, as if their rows had been built together.
+
+        Dictionaries are merged in order of first appearance, and a column
+        that is numeric in some parts but encoded in others is encoded.
+
+        Args:
+            parts (List[ColumnarDataset]): The datasets, in row order.
+            header (List[str]): The column names. Defaults to no names.
+
+        Returns:
+            ColumnarDataset: The joined dataset.
+        """
+        count = max((len(part._columns) for part in parts), default=0)
+        columns, dictionaries = [], []
+        for column in range(count):
+            pieces = [(part._columns[column], part._dictionaries[column])
+                      if column < len(part._columns) else (None, None)
+                      for part in parts]
+            if all(dictionary is None for _, dictionary in pieces):
+                values = array('q')
+                for part, (piece, _) in zip(parts, pieces):
+                    if piece is None:
+                        values.extend(array('q', [0]) * len(part))
+                    else:
+                        values.fromlist(piece.tolist())
+                if values:
+                    values = array(_smallest_typecode(min(values),
+                                                      max(values), 'bhiq'),
+                                   values)
+                columns.append(values)
+                dictionaries.append(None)
+                continue
+
+            lookup, dictionary, codes = {}, [], array('L')
+            for part, (piece, cells) in zip(parts, pieces):
+                if piece is None:
+                    codes.extend(array('L', [0]) * len(part))
+                    continue
+                if cells is None:
+                    cells = [str(number) for number in piece]
+                    piece = range(len(piece))
+                mapping = []
+                for cell in cells:
+                    code = lookup.get(cell)
+                    if code is None:
+                        code = lookup[cell] = len(dictionary)
+                        dictionary.append(cell)
+                    mapping.append(code)
+                codes.extend(mapping[code] for code in piece)
+            columns.append(array(_smallest_typecode(
+                0, max(len(dictionary) - 1, 0), 'BHI'), codes))
+            dictionaries.append(dictionary)
+
+        widths = array('L')
+        for part in parts:
+            widths.fromlist(part._widths.tolist())
+        typecode = _smallest_typecode(0, max(widths, default=0), 'BHI')
+        return cls(list(header or []), columns, dictionaries,
+                   array(typecode, widths))
+
+    @classmethod
+    def from_csv(cls, path: str,
+                 workers: Optional[int] = None) -> "ColumnarDataset":
+        """
+        Build a dataset from a CSV file whose first row is the header.
+
+        Args:
+            path (str): Path to the CSV file.
+            workers (int): Parse the file with this many processes (see
+            `parallel_loader`). Defaults to a single pass in this process.
+
+        Returns:
+            ColumnarDataset: The encoded dataset.
+        """
+        if workers is not None and workers > 1:
+            from parallel_loader import load_columnar
+            return load_columnar(path, workers)
+        with open(path) as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            return cls.from_rows(reader, header)
+
+    def __len__(self) -> int:
+        """
+        Return the number of rows in the dataset.
+        """
+        return len(self._widths)
+
+    def __getitem__(self, index: Union[int, slice]):
+        """
+        Materialize one row, or a list of rows for a slice.
+
+        Args:
+            index (int or slice): The row position(s), as for a list.
+
+        Returns:
+            List[str] or List[List[str]]: The requested row(s).
+        """
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("dataset index out of range")
+        return self._row(index)
+
+    def __iter__(self) -> Iterator[List[str]]:
+        """
+        Iterate over every row, materializing one at a time.
+        """
+        for i in range(len(self)):
+            yield self._row(i)
+
+    def _row(self, index: int, typed: bool = False) -> list:
+        """
+        Materialize the row at a non-negative position.
+        """
+        return [self._cell(column, index, typed)
+                for column in range(self._widths[index])]
+
+    def _cell(self, column: int, index: int, typed: bool):
+        """
+        Decode a single cell.
+        """
+        value = self._columns[column][index]
+        dictionary = self._dictionaries[column]
+        if dictionary is not None:
+            return dictionary[value]
+        return value if typed else str(value)
+
+    def column_index(self, column: Union[int, str]) -> int:
+        """
+        Resolve a column name or position to a position.
+
+        Args:
+            column (int or str): A header name or a column position.
+
+        Returns:
+            int: The column position.
+
+        Raises:
+            KeyError: If the column does not exist.
+        """
+        if isinstance(column, int):
+            if not 0 <= column < len(self._columns):
+                raise KeyError(column)
+            return column
+        try:
+            return self.header.index(column)
+        except ValueError:
+            raise KeyError(column) from None
+
+    def is_numeric(self, column: Union[int, str]) -> bool:
+        """
+        Tell whether a column is stored as integers.
+        """
+        return self._dictionaries[self.column_index(column)] is None
+
+    def column(self, column: Union[int, str]) -> array:
+        """
+        Return the raw typed array backing a column.
+
+        For numeric columns the array holds the values themselves. For
+        encoded columns it holds codes into `categories(column)`. Entries for
+        rows that are too short to have this column are placeholders.
+        """
+        return self._columns[self.column_index(column)]
+
+    def categories(self, column: Union[int, str]) -> Optional[List[str]]:
+        """
+        Return the distinct strings of an encoded column, or None.
+        """
+        return self._dictionaries[self.column_index(column)]
+
+    def cells(self, column: Union[int, str],
+              typed: bool = False) -> Iterator:
+        """
+        Iterate over every cell of one column, in row order.
+
+        Rows that are too short to have the column yield None.
+
+        Args:
+            column (int or str): A header name or a column position.
+            typed (bool): Whether numeric cells come back as `int`.
+        """
+        column = self.column_index(column)
+        values = self._columns[column]
+        dictionary = self._dictionaries[column]
+        for width, value in zip(self._widths, values):
+            if width <= column:
+                yield None
+            elif dictionary is not None:
+                yield dictionary[value]
+            else:
+                yield value if typed else str(value)
+
+    def width(self, index: int) -> int:
+        """
+        Return the number of cells in a row.
+        """
+        return self._widths[index]
+
+    def row(self, index: int, typed: bool = True) -> list:
+        """
+        Materialize one row, with integers for numeric columns by default.
+
+        Args:
+            index (int): The row position.
+            typed (bool): Whether numeric cells come back as `int`.
+
+        Returns:
+            list: The row's cells.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("dataset index out of range")
+        return self._row(index, typed)
+
+    def value(self, index: int, column: Union[int, str], typed: bool = True):
+        """
+        Return a single cell, or None if the row is too short to have it.
+
+        Args:
+            index (int): The row position.
+            column (int or str): A header name or a column position.
+            typed (bool): Whether a numeric cell comes back as `int`.
+        """
+        column = self.column_index(column)
+        if column >= self._widths[index]:
+            return None
+        return self._cell(column, index, typed)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Cursor token module.
+
+This module turns pagination cursors into opaque tokens and back. A token
+is the URL-safe base64 encoding of an HMAC-SHA256 tag followed by the
+cursor as compact JSON, so clients can keep a cursor and send it back but
+cannot forge one or change what it points to.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+from typing import Dict
+
+TAG_SIZE = 16
+
+
+def _tag(secret: bytes, payload: bytes) -> bytes:
+    """
+    Return the truncated HMAC-SHA256 tag of a payload.
+    """
+    return hmac.new(secret, payload, hashlib.sha256).digest()[:TAG_SIZE]
+
+
+def encode_cursor(cursor: Dict, secret: bytes) -> str:
+    """
+    Sign a cursor and encode it as a token.
+
+    Args:
+        cursor (Dict): The cursor. It must be serializable as JSON.
+        secret (bytes): The signing key.
+
+    Returns:
+        str: The token, made of URL-safe characters only.
+    """
+    payload = json.dumps(cursor, separators=(",", ":")).encode()
+    token = base64.urlsafe_b64encode(_tag(secret, payload) + payload)
+    return token.rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(token: str, secret: bytes) -> Dict:
+    """
+    Check a token's signature and decode the cursor in it.
+
+    Args:
+        token (str): A token returned by `encode_cursor`.
+        secret (bytes): The key the token was signed with.
+
+    Returns:
+        Dict: The cursor.
+
+    Raises:
+        ValueError: If the token is malformed or was not signed with
+        `secret`.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError("invalid cursor") from None
+    tag, payload = raw[:TAG_SIZE], raw[TAG_SIZE:]
+    if not hmac.compare_digest(tag, _tag(secret, payload)):
+        raise ValueError("invalid cursor")
+    return json.loads(payload)
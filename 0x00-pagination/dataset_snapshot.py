@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Dataset snapshot module.
+
+This module saves a parsed `ColumnarDataset` to a binary snapshot file next
+to its CSV file and loads it back by memory-mapping it, so processes that
+start later skip CSV parsing and share the snapshot's pages through the
+operating system's page cache.
+
+A snapshot file is laid out as:
+    - a fixed header: magic, format version, SHA-256 of the CSV contents,
+      the CSV's modification time and size, and the metadata length;
+    - JSON metadata: column names, dictionaries, and where each typed
+      buffer starts;
+    - the raw column and row-width buffers, each aligned to 8 bytes.
+
+A snapshot is fresh when the CSV's contents hash to the recorded digest. The
+recorded modification time and size let an untouched CSV skip hashing.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Optional
+
+from columnar_dataset import ColumnarDataset
+
+MAGIC = b"CDSNAP\0\0"
+VERSION = 1
+HEADER = struct.Struct("<8sI32sqQQ")
+ALIGNMENT = 8
+
+
+def snapshot_path(path: str) -> str:
+    """
+    Return where the snapshot of a CSV file is stored.
+    """
+    return path + ".snap"
+
+
+def content_hash(path: str) -> bytes:
+    """
+    Compute the SHA-256 digest of a file's contents.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        bytes: The 32-byte digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def _aligned(offset: int) -> int:
+    """
+    Round an offset up to the next multiple of `ALIGNMENT`.
+    """
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_snapshot(dataset: ColumnarDataset, path: str,
+                  digest: Optional[bytes] = None) -> None:
+    """
+    Write the snapshot of a dataset parsed from a CSV file.
+
+    The snapshot is written to a temporary file that is then renamed over
+    the old one, so concurrent readers only ever see complete snapshots.
+
+    Args:
+        dataset (ColumnarDataset): The dataset parsed from `path`.
+        path (str): Path to the CSV file the dataset was parsed from.
+        digest (bytes): The CSV's content hash, if already computed.
+    """
+    stat = os.stat(path)
+    if digest is None:
+        digest = content_hash(path)
+
+    buffers = [dataset._widths] + list(dataset._columns)
+    layout, offset = [], 0
+    for buffer in buffers:
+        length = len(buffer) * buffer.itemsize
+        layout.append({"typecode": memoryview(buffer).format,
+                       "offset": offset,
+                       "length": len(buffer), "itemsize": buffer.itemsize})
+        offset = _aligned(offset + length)
+    meta = json.dumps({
+        "byteorder": sys.byteorder,
+        "header": dataset.header,
+        "widths": layout[0],
+        "columns": layout[1:],
+        "dictionaries": dataset._dictionaries,
+    }).encode("utf-8")
+
+    target = snapshot_path(path)
+    temporary = "{}.{}.tmp".format(target, os.getpid())
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, digest, stat.st_mtime_ns,
+                            stat.st_size, len(meta)))
+        f.write(meta)
+        start = _aligned(HEADER.size + len(meta))
+        for buffer, entry in zip(buffers, layout):
+            f.write(b"\0" * (start + entry["offset"] - f.tell()))
+            f.write(bytes(buffer))
+    os.replace(temporary, target)
+
+
+def load_snapshot(path: str) -> Optional[ColumnarDataset]:
+    """
+    Load the snapshot of a CSV file if it matches the file's contents.
+
+    Column buffers are memory-mapped views over the snapshot file rather
+    than copies, so every process loading the same snapshot shares them.
+
+    Args:
+        path (str): Path to the CSV file (not to the snapshot).
+
+    Returns:
+        ColumnarDataset or None: The dataset, or None if the snapshot is
+        missing, unreadable, from another format version or stale.
+    """
+    try:
+        stat = os.stat(path)
+        with open(snapshot_path(path), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, version, digest, mtime_ns, size, meta_length = \
+            HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION:
+            return None
+        if ((mtime_ns, size) != (stat.st_mtime_ns, stat.st_size)
+                and digest != content_hash(path)):
+            return None
+        meta = json.loads(mapped[HEADER.size:HEADER.size + meta_length])
+        if meta["byteorder"] != sys.byteorder:
+            return None
+        start = _aligned(HEADER.size + meta_length)
+        view = memoryview(mapped)
+
+        def buffer(entry):
+            """Return a typed view over one stored buffer."""
+            if array(entry["typecode"]).itemsize != entry["itemsize"]:
+                raise ValueError("incompatible item size")
+            begin = start + entry["offset"]
+            end = begin + entry["length"] * entry["itemsize"]
+            if end > len(mapped):
+                raise ValueError("truncated snapshot")
+            return view[begin:end].cast(entry["typecode"])
+
+        widths = buffer(meta["widths"])
+        columns = [buffer(entry) for entry in meta["columns"]]
+    except (struct.error, ValueError, KeyError, TypeError, OSError):
+        return None
+    return ColumnarDataset(meta["header"], columns, meta["dictionaries"],
+                           widths)
+
+
+def load_dataset(path: str, workers: Optional[int] = None
+                 ) -> ColumnarDataset:
+    """
+    Load a CSV file as a `ColumnarDataset`, going through its snapshot.
+
+    A fresh snapshot is memory-mapped directly. Otherwise the CSV file is
+    parsed and a new snapshot is written for the next process; failing to
+    write it (for example in a read-only directory) is not an error.
+
+    Args:
+        path (str): Path to the CSV file.
+        workers (int): Number of processes to parse the CSV file with when
+        there is no fresh snapshot. Defaults to a single pass.
+
+    Returns:
+        ColumnarDataset: The dataset.
+    """
+    dataset = load_snapshot(path)
+    if dataset is None:
+        dataset = ColumnarDataset.from_csv(path, workers)
+        try:
+            save_snapshot(dataset, path)
+        except OSError:
+            pass
+    return dataset
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Dataset versions module.
+
+This module provides `VersionRegistry`, which numbers the successive
+versions of a dataset and keeps each one alive while something still
+refers to it, such as a pagination cursor that was handed out but not yet
+used. Versions are meant to be immutable snapshots, so every reader of a
+version sees the same rows however the dataset changes afterwards.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+
+class VersionRegistry:
+    """
+    Reference-counted versions of a dataset.
+
+    The current version is always kept. An older version is dropped as soon
+    as its last reference is released, and at most `MAX_RETAINED` older
+    versions are kept at all: past that, the one whose references were
+    least recently acquired is dropped even though it is still referenced,
+    since its references most likely belong to cursors that were abandoned.
+    """
+
+    MAX_RETAINED = 16
+
+    def __init__(self):
+        """
+        Initialize an empty registry.
+        """
+        self._versions = OrderedDict()
+        self._references: Dict[int, Set[int]] = {}
+        self._next_reference = 0
+        self.current: Optional[int] = None
+
+    def __len__(self) -> int:
+        """
+        Return the number of versions kept.
+        """
+        return len(self._versions)
+
+    def get(self, version: int):
+        """
+        Return the dataset of a version, or None if it was dropped.
+        """
+        return self._versions.get(version)
+
+    def publish(self, dataset) -> int:
+        """
+        Add a dataset as the new current version.
+
+        Returns:
+            int: The new version's number.
+        """
+        version = 0 if self.current is None else self.current + 1
+        previous, self.current = self.current, version
+        self._versions[version] = dataset
+        self._references[version] = set()
+        if previous is not None and not self._references[previous]:
+            self._drop(previous)
+        while len(self._versions) > self.MAX_RETAINED + 1:
+            # Drop the least recently used version that is not current
+            self._drop(next(old for old in self._versions
+                            if old != self.current))
+        return version
+
+    def acquire(self, version: int) -> int:
+        """
+        Add a reference to a version, keeping it alive.
+
+        Returns:
+            int: The reference, to hand back to `release`.
+
+        Raises:
+            KeyError: If the version was dropped.
+        """
+        references = self._references[version]
+        self._versions.move_to_end(version)
+        self._next_reference += 1
+        references.add(self._next_reference)
+        return self._next_reference
+
+    def release(self, version: int, reference: int) -> None:
+        """
+        Remove a reference to a version, dropping the version if it was the
+        last one and the version is not current. Releasing a reference that
+        was already released, or one of a dropped version, does nothing.
+        """
+        references = self._references.get(version)
+        if references is None:
+            return
+        references.discard(reference)
+        if not references and version != self.current:
+            self._drop(version)
+
+    def references(self, version: int) -> int:
+        """
+        Return the number of references to a version.
+        """
+        return len(self._references.get(version, ()))
+
+    def _drop(self, version: int) -> None:
+        """
+        Forget a version.
+        """
+        del self._versions[version]
+        del self._references[version]
@@ -0,0 +1,614 @@
+#!/usr/bin/env python3
+"""
+Live row index module.
+
+This module keeps track of which rows of a dataset are still present after
+deletions. A `LiveIndex` is a Fenwick (binary indexed) tree over one live
+flag per row id, so counting the live rows before an id and finding the
+k-th live row both take O(log n) however sparse the ids have become. An
+`IndexedDataset` wraps a dataset in a dictionary-like mapping from row id to
+row that keeps its `LiveIndex`, and any secondary or sort indexes built on
+it, up to date.
+"""
+
+import threading
+from array import array
+from collections.abc import MutableMapping
+from functools import wraps
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from secondary_index import SecondaryIndex, cell, intersect
+from sort_index import SortIndex, parse_order, top_ids
+
+
+def synchronized(method):
+    """
+    Make an IndexedDataset method hold the mapping's lock.
+    """
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        """
+        Call the method holding the lock.
+        """
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+class LiveIndex:
+    """
+    Fenwick tree over the live flags of a contiguous range of row ids.
+
+    Row ids run from 0 to `capacity - 1`. Every id starts out live.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Initialize an index where every id below `capacity` is live.
+
+        Args:
+            capacity (int): The number of row ids.
+        """
+        self._flags = bytearray(b"\1") * capacity
+        # For an all-ones array, node i of the tree covers lowbit(i) ids
+        self._tree = array('q', (i & -i for i in range(capacity + 1)))
+        self._live = capacity
+
+    def __len__(self) -> int:
+        """
+        Return the number of live ids.
+        """
+        return self._live
+
+    def copy(self) -> "LiveIndex":
+        """
+        Return an independent copy of the index.
+        """
+        copy = LiveIndex(0)
+        copy._flags = self._flags[:]
+        copy._tree = self._tree[:]
+        copy._live = self._live
+        return copy
+
+    def __contains__(self, row_id) -> bool:
+        """
+        Tell whether an id is live.
+        """
+        return (isinstance(row_id, int) and 0 <= row_id < len(self._flags)
+                and self._flags[row_id] == 1)
+
+    @property
+    def capacity(self) -> int:
+        """
+        The number of ids ever assigned, live or not.
+        """
+        return len(self._flags)
+
+    def _add(self, row_id: int, delta: int) -> None:
+        """
+        Add `delta` to the count of one id.
+        """
+        tree = self._tree
+        i = row_id + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def kill(self, row_id: int) -> bool:
+        """
+        Mark an id as deleted.
+
+        Returns:
+            bool: False if the id was not live.
+        """
+        if row_id not in self:
+            return False
+        self._flags[row_id] = 0
+        self._add(row_id, -1)
+        self._live -= 1
+        return True
+
+    def revive(self, row_id: int) -> bool:
+        """
+        Mark a deleted id below `capacity` as live again.
+
+        Returns:
+            bool: False if the id was already live or out of range.
+        """
+        if not 0 <= row_id < len(self._flags) or self._flags[row_id]:
+            return False
+        self._flags[row_id] = 1
+        self._add(row_id, 1)
+        self._live += 1
+        return True
+
+    def rank(self, row_id: int) -> int:
+        """
+        Count the live ids strictly below `row_id`.
+        """
+        tree = self._tree
+        i = min(max(row_id, 0), len(self._flags))
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def select(self, k: int) -> int:
+        """
+        Return the k-th live id (0-based), in increasing id order.
+
+        Raises:
+            IndexError: If there are not more than `k` live ids.
+        """
+        if not 0 <= k < self._live:
+            raise IndexError("live index out of range")
+        tree = self._tree
+        position = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            nxt = position + step
+            if nxt < len(tree) and tree[nxt] <= k:
+                position = nxt
+                k -= tree[nxt]
+            step >>= 1
+        return position
+
+    def append(self) -> int:
+        """
+        Assign the next id and mark it live, in O(log n).
+
+        Returns:
+            int: The new id, equal to the previous `capacity`.
+        """
+        row_id = len(self._flags)
+        i = row_id + 1
+        # Node i covers ids i - lowbit(i) to i - 1, all already counted
+        # except the new one
+        self._tree.append(1 + self.rank(row_id) - self.rank(i - (i & -i)))
+        self._flags.append(1)
+        self._live += 1
+        return row_id
+
+    def iter_from(self, row_id: int = 0) -> Iterator[int]:
+        """
+        Iterate over the live ids greater than or equal to `row_id`.
+        """
+        return self.iter_from_rank(self.rank(row_id))
+
+    def iter_from_rank(self, k: int) -> Iterator[int]:
+        """
+        Iterate over the live ids, starting with the k-th one (0-based).
+
+        Runs of consecutive live ids are walked directly, and a Fenwick
+        search is only needed to jump over each gap left by deletions.
+        """
+        flags = self._flags
+        k = max(k, 0)
+        while k < self._live:
+            current = self.select(k)
+            while True:
+                yield current
+                k += 1
+                current += 1
+                if current >= len(flags) or not flags[current]:
+                    break
+
+
+class IndexedDataset(MutableMapping):
+    """
+    Mapping from row id to row over a dataset, with O(log n) paging.
+
+    Row ids are the rows' positions in the underlying dataset, and appended
+    rows get the next unused id. Deleting an id (`del indexed[i]`) removes the
+    row from the mapping without renumbering any other row, and assigning to
+    a deleted id brings it back. Replaced and appended rows are kept in a
+    small overlay; the underlying dataset is never modified.
+
+    Secondary indexes are built on first use by `index_on` and `matching`,
+    and sort permutations by `ordered`; both are then updated by every
+    change made through the mapping.
+
+    `snapshot` returns a copy that later changes do not affect. The two
+    share every structure until one of them is changed, which copies the
+    shared structures first (copy-on-write).
+
+    Changes, snapshots, and the lookups that build and cache indexes hold
+    a lock, so threads can page through the mapping while others change
+    it. Plain lookups by id or by position do not lock.
+    """
+
+    MATCH_CACHE_SIZE = 64
+    TOP_K_LIMIT = 1000
+
+    def __init__(self, rows: Sequence[List]):
+        """
+        Index every row of a dataset by its position.
+
+        Args:
+            rows (Sequence[List]): The dataset. It is never modified.
+        """
+        self._rows = rows
+        self._overlay = {}
+        self._indexes = {}
+        self._matches = {}
+        self._orders = {}
+        self._order_requests = {}
+        self._shared = False
+        self._lock = threading.RLock()
+        self.changes = 0
+        self.live = LiveIndex(len(rows))
+
+    @property
+    def capacity(self) -> int:
+        """
+        The number of row ids ever assigned, live or not.
+        """
+        return self.live.capacity
+
+    def __getitem__(self, row_id: int) -> List:
+        """
+        Return the row with the given id.
+
+        Raises:
+            KeyError: If the id is not live.
+        """
+        if row_id not in self.live:
+            raise KeyError(row_id)
+        if row_id in self._overlay:
+            return self._overlay[row_id]
+        return self._rows[row_id]
+
+    @synchronized
+    def __setitem__(self, row_id: int, row: List) -> None:
+        """
+        Replace the row with the given id, reviving it if it was deleted.
+
+        Raises:
+            KeyError: If the id was never assigned by the dataset.
+        """
+        if not isinstance(row_id, int) or not 0 <= row_id < self.capacity:
+            raise KeyError(row_id)
+        self._unshare()
+        old = None
+        if (self._indexes or self._orders) and row_id in self.live:
+            old = self[row_id]
+        self._overlay[row_id] = row
+        self.live.revive(row_id)
+        self._reindex(row_id, old, row)
+
+    @synchronized
+    def __delitem__(self, row_id: int) -> None:
+        """
+        Delete the row with the given id.
+
+        Raises:
+            KeyError: If the id is not live.
+        """
+        old = self[row_id] if self._indexes or self._orders else None
+        if row_id in self.live:
+            self._unshare()
+        if not self.live.kill(row_id):
+            raise KeyError(row_id)
+        self._overlay.pop(row_id, None)
+        self._reindex(row_id, old, None)
+
+    def __contains__(self, row_id) -> bool:
+        """
+        Tell whether an id is live.
+        """
+        return row_id in self.live
+
+    def __len__(self) -> int:
+        """
+        Return the number of live rows.
+        """
+        return len(self.live)
+
+    def __iter__(self) -> Iterator[int]:
+        """
+        Iterate over the live row ids in increasing order.
+        """
+        return self.live.iter_from(0)
+
+    def rows_for(self, row_ids: List[int]) -> List[List]:
+        """
+        Return the rows of several live ids, in the given order.
+
+        Consecutive ids that have not been replaced are read from the
+        underlying dataset with a single slice, which lets lazy datasets
+        parse a whole run at once.
+        """
+        rows, run_start, run_end = [], None, None
+        for row_id in row_ids:
+            if row_id in self._overlay:
+                if run_start is not None:
+                    rows.extend(self._rows[run_start:run_end])
+                    run_start = None
+                rows.append(self._overlay[row_id])
+            elif run_start is not None and row_id == run_end:
+                run_end += 1
+            else:
+                if run_start is not None:
+                    rows.extend(self._rows[run_start:run_end])
+                run_start, run_end = row_id, row_id + 1
+        if run_start is not None:
+            rows.extend(self._rows[run_start:run_end])
+        return rows
+
+    @synchronized
+    def append(self, row: List) -> int:
+        """
+        Add a row under a new id, after every existing one.
+
+        Returns:
+            int: The new row's id.
+        """
+        self._unshare()
+        row_id = self.live.append()
+        self._overlay[row_id] = row
+        self._reindex(row_id, None, row)
+        return row_id
+
+    def page_at(self, offset: int, page_size: int) -> List[int]:
+        """
+        Return the ids of the live rows at positions `offset` to
+        `offset + page_size - 1`, counting only live rows.
+        """
+        return list(islice(self.live.iter_from_rank(offset), page_size))
+
+    def page_from(self, row_id: int, page_size: int) -> List[int]:
+        """
+        Return the ids of the first `page_size` live rows from `row_id` on.
+        """
+        return list(islice(self.live.iter_from(row_id), page_size))
+
+    @synchronized
+    def page_after(self, key, page_size: int,
+                   order_by: Optional[str] = None) -> List[int]:
+        """
+        Return the ids of the first `page_size` live rows after a key.
+
+        In row order the key is a row id. In an `order_by` order it is the
+        `[cell, row_id]` pair returned by `key_of`, and the rows are read
+        from the ordering's permutation, built on first use. Either way the
+        page costs O(log n + page_size) and does not depend on how many rows
+        come before it.
+
+        Args:
+            key: The key of the last row of the previous page, or None to
+            start from the first row. The row need not be live any more.
+            page_size (int): The number of ids to return.
+            order_by (str): A column name, prefixed with "-" for descending
+            order. Defaults to row order.
+
+        Returns:
+            List[int]: The row ids of the page.
+        """
+        if not order_by:
+            return self.page_from(0 if key is None else key + 1, page_size)
+        if key is not None:
+            key = tuple(key)
+        return self.sort_index(order_by).after(key, page_size)
+
+    def key_of(self, row_id: int, order_by: Optional[str] = None):
+        """
+        Return the key of a live row for `page_after`.
+        """
+        if not order_by:
+            return row_id
+        column = self.column_index(parse_order(order_by)[0])
+        return [self._value(row_id, column), row_id]
+
+    @synchronized
+    def snapshot(self) -> "IndexedDataset":
+        """
+        Return a copy of the mapping that later changes do not affect.
+
+        The copy shares the row flags, the replaced rows and every index
+        with this mapping, so it is taken in O(number of indexes). The first
+        change to either of them afterwards copies those structures.
+        """
+        copy = IndexedDataset.__new__(IndexedDataset)
+        copy._rows = self._rows
+        copy._overlay = self._overlay
+        copy._indexes = dict(self._indexes)
+        copy._matches = {}
+        copy._orders = {key: order.copy(copy._reader(order.column), True)
+                        for key, order in self._orders.items()}
+        copy._order_requests = dict(self._order_requests)
+        copy.changes = self.changes
+        copy.live = self.live
+        copy._lock = threading.RLock()
+        copy._shared = self._shared = True
+        return copy
+
+    def _unshare(self) -> None:
+        """
+        Copy the structures shared with a snapshot, before a change.
+        """
+        if not self._shared:
+            return
+        self.live = self.live.copy()
+        self._overlay = dict(self._overlay)
+        self._indexes = {column: index.copy()
+                         for column, index in self._indexes.items()}
+        self._orders = {key: order.copy(self._reader(order.column))
+                        for key, order in self._orders.items()}
+        self._shared = False
+
+    def _reindex(self, row_id: int, old: Optional[List],
+                 new: Optional[List]) -> None:
+        """
+        Update the secondary and sort indexes after a row changed.
+        """
+        self.changes += 1
+        for index in self._indexes.values():
+            if old is not None:
+                index.remove(row_id, old)
+            if new is not None:
+                index.add(row_id, new)
+        for order in self._orders.values():
+            if old is not None:
+                order.remove(row_id, cell(old, order.column))
+            if new is not None:
+                order.add(row_id, cell(new, order.column))
+        self._matches.clear()
+
+    def column_index(self, column: Union[int, str]) -> int:
+        """
+        Resolve a column name or position to a position.
+
+        Raises:
+            KeyError: If the dataset has no such column.
+        """
+        finder = getattr(self._rows, "column_index", None)
+        if finder is not None:
+            return finder(column)
+        if isinstance(column, int):
+            return column
+        raise KeyError(column)
+
+    def _cells(self, column: int,
+               typed: bool = False) -> Iterator[Tuple[int, Optional[str]]]:
+        """
+        Yield `(row_id, cell)` for every live row.
+
+        With `typed`, cells of the underlying dataset may come back as
+        `int`; replaced and appended rows always yield their own cells.
+        """
+        overlay, live = self._overlay, self.live
+        cells = getattr(self._rows, "cells", None)
+        if cells is not None:
+            base = cells(column, typed)
+        else:
+            base = (cell(row, column) for row in self._rows)
+        for row_id, value in enumerate(base):
+            if row_id in live and row_id not in overlay:
+                yield row_id, value
+        for row_id, row in overlay.items():
+            yield row_id, cell(row, column)
+
+    @synchronized
+    def index_on(self, column: Union[int, str]) -> SecondaryIndex:
+        """
+        Return the secondary index of a column, building it on first use.
+
+        Args:
+            column (int or str): A header name or a column position.
+        """
+        column = self.column_index(column)
+        index = self._indexes.get(column)
+        if index is None:
+            index = SecondaryIndex.build(self._cells(column), column)
+            self._indexes[column] = index
+        return index
+
+    @synchronized
+    def matching(self, filter: Dict[Union[int, str], object]) -> Sequence[int]:
+        """
+        Return the sorted ids of the live rows matching every filter entry.
+
+        A single-column filter returns the column's postings list itself.
+        Filters on several columns intersect the postings lists and keep
+        the result until the next change.
+
+        Args:
+            filter (Dict): Maps a column (name or position) to the value its
+            cells must equal. Values are compared as text, so 2016 and
+            "2016" are the same filter.
+
+        Returns:
+            Sequence[int]: The matching row ids. It must not be modified.
+        """
+        terms = sorted((self.column_index(column), str(value))
+                       for column, value in filter.items())
+        if len(terms) == 1:
+            column, value = terms[0]
+            return self.index_on(column).postings(value)
+
+        key = tuple(terms)
+        matches = self._matches.get(key)
+        if matches is None:
+            matches = intersect([self.index_on(column).postings(value)
+                                 for column, value in terms])
+            if len(self._matches) >= self.MATCH_CACHE_SIZE:
+                del self._matches[next(iter(self._matches))]
+            self._matches[key] = matches
+        return matches
+
+    def _value(self, row_id: int, column: int):
+        """
+        Return the cell of a live row, typed when the dataset can.
+        """
+        value = getattr(self._rows, "value", None)
+        if value is None or row_id in self._overlay:
+            return cell(self[row_id], column)
+        return value(row_id, column)
+
+    def _reader(self, column: int):
+        """
+        Return a function giving the cell of a live row in a column.
+        """
+        return lambda row_id: self._value(row_id, column)
+
+    @synchronized
+    def sort_index(self, order_by: str) -> SortIndex:
+        """
+        Return the permutation of an ordering, building it on first use.
+
+        Args:
+            order_by (str): A column name, prefixed with "-" for descending
+            order.
+        """
+        column, descending = parse_order(order_by)
+        column = self.column_index(column)
+        order = self._orders.get((column, descending))
+        if order is None:
+            order = self._orders[column, descending] = SortIndex.build(
+                self._cells(column, True), column, descending,
+                self._reader(column))
+        return order
+
+    @synchronized
+    def ordered(self, order_by: str, start: int, end: int,
+                candidates: Optional[Sequence[int]] = None) -> List[int]:
+        """
+        Return a window of the live row ids sorted by a column.
+
+        The first request for an ordering that ends within `TOP_K_LIMIT`
+        rows is answered with a heap selection. Later requests build the
+        ordering's permutation once and slice it, and changes update it in
+        place.
+
+        Args:
+            order_by (str): A column name, prefixed with "-" for descending
+            order.
+            start (int): Position of the first id to return.
+            end (int): Position after the last id to return.
+            candidates (Sequence[int]): Restrict the ordering to these ids,
+            e.g. the result of `matching`. Defaults to every live row.
+
+        Returns:
+            List[int]: The row ids at positions `start` to `end - 1`.
+        """
+        column, descending = parse_order(order_by)
+        column = self.column_index(column)
+        if candidates is not None:
+            values = ((row_id, self._value(row_id, column))
+                      for row_id in candidates)
+            if end <= self.TOP_K_LIMIT:
+                return top_ids(values, end, descending)[start:]
+            order = SortIndex.build(values, column, descending, None)
+            return order.window(start, end)
+
+        key = (column, descending)
+        order = self._orders.get(key)
+        if order is None:
+            requests = self._order_requests.get(key, 0) + 1
+            self._order_requests[key] = requests
+            if requests == 1 and end <= self.TOP_K_LIMIT:
+                return top_ids(self._cells(column, True), end,
+                               descending)[start:]
+            order = self.sort_index(order_by)
+        return order.window(start, end)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Row offset index module.
+
+This module lets a CSV file be paginated without parsing it up front. A
+`RowOffsetIndex` records the byte offset at which every record starts and is
+persisted next to the CSV file, so it is only rebuilt when the file changes.
+A `MappedDataset` memory-maps the CSV file and uses the index to parse just
+the rows that are requested.
+"""
+
+import csv
+import io
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import Sequence
+from typing import Iterator, List, Optional, Union
+
+
+class RowOffsetIndex:
+    """
+    Byte offsets of the records of a CSV file.
+
+    `offsets[0]` is where the header starts, `offsets[i + 1]` is where data
+    row `i` starts, and the last entry is the end of the file, so data row
+    `i` spans `offsets[i + 1]:offsets[i + 2]`.
+
+    The index is stored in a small binary file (see `index_path`) holding a
+    magic string, the CSV file's modification time and size, and the raw
+    offsets. A stored index whose recorded time or size no longer matches the
+    CSV file is ignored and rebuilt.
+    """
+
+    MAGIC = b"ROWIDX1\0"
+    HEADER = struct.Struct("<8sqQQ")
+
+    def __init__(self, offsets: array, mtime_ns: int, size: int):
+        """
+        Initialize an index from already computed offsets.
+
+        Args:
+            offsets (array): The record offsets, typecode 'Q'.
+            mtime_ns (int): Modification time of the indexed CSV file.
+            size (int): Size in bytes of the indexed CSV file.
+        """
+        self.offsets = offsets
+        self.mtime_ns = mtime_ns
+        self.size = size
+
+    def __len__(self) -> int:
+        """
+        Return the number of data rows (the header is not counted).
+        """
+        return max(len(self.offsets) - 2, 0)
+
+    @staticmethod
+    def index_path(path: str) -> str:
+        """
+        Return where the index of a CSV file is persisted.
+        """
+        return path + ".idx"
+
+    @classmethod
+    def build(cls, path: str) -> "RowOffsetIndex":
+        """
+        Scan a CSV file and record where each record starts.
+
+        Records end at a newline that is not inside a quoted field, which is
+        tracked by the parity of the quote characters seen so far (an escaped
+        quote is written as two quotes and so keeps the parity).
+
+        Args:
+            path (str): Path to the CSV file.
+
+        Returns:
+            RowOffsetIndex: The freshly built index.
+        """
+        stat = os.stat(path)
+        offsets = array('Q')
+        position = 0
+        quoted = False
+        with open(path, "rb") as f:
+            for line in f:
+                if not quoted:
+                    offsets.append(position)
+                if line.count(b'"') % 2:
+                    quoted = not quoted
+                position += len(line)
+        offsets.append(position)
+        if len(offsets) == 1:
+            offsets.append(position)  # An empty file still has a header
+        return cls(offsets, stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["RowOffsetIndex"]:
+        """
+        Load the persisted index of a CSV file if it is still valid.
+
+        Args:
+            path (str): Path to the CSV file (not to the index).
+
+        Returns:
+            RowOffsetIndex or None: The index, or None if it is missing,
+            unreadable or stale.
+        """
+        try:
+            stat = os.stat(path)
+            with open(cls.index_path(path), "rb") as f:
+                magic, mtime_ns, size, count = cls.HEADER.unpack(
+                    f.read(cls.HEADER.size))
+                if (magic != cls.MAGIC or mtime_ns != stat.st_mtime_ns
+                        or size != stat.st_size):
+                    return None
+                offsets = array('Q')
+                offsets.fromfile(f, count)
+        except (OSError, EOFError, struct.error):
+            return None
+        return cls(offsets, mtime_ns, size)
+
+    def save(self, path: str) -> None:
+        """
+        Persist the index next to its CSV file.
+
+        The index is written to a temporary file that is then renamed over
+        the old one, so readers never see a partial index.
+
+        Args:
+            path (str): Path to the CSV file (not to the index).
+        """
+        target = self.index_path(path)
+        temporary = "{}.{}.tmp".format(target, os.getpid())
+        with open(temporary, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.mtime_ns, self.size,
+                                     len(self.offsets)))
+            self.offsets.tofile(f)
+        os.replace(temporary, target)
+
+    @classmethod
+    def open(cls, path: str) -> "RowOffsetIndex":
+        """
+        Load the persisted index of a CSV file, rebuilding it if needed.
+
+        Failing to persist a rebuilt index (for example in a read-only
+        directory) is not an error; the index is then only kept in memory.
+
+        Args:
+            path (str): Path to the CSV file.
+
+        Returns:
+            RowOffsetIndex: An index matching the current file.
+        """
+        index = cls.load(path)
+        if index is None:
+            index = cls.build(path)
+            try:
+                index.save(path)
+            except OSError:
+                pass
+        return index
+
+
+class MappedDataset(Sequence):
+    """
+    Lazily parsed, memory-mapped view of a CSV file.
+
+    The dataset behaves like the list of rows `csv.reader` would produce
+    (excluding the header), but only the bytes of the rows that are accessed
+    are ever decoded and parsed. Cold start costs one index lookup when the
+    persisted index is fresh.
+    """
+
+    def __init__(self, path: str, index: Optional[RowOffsetIndex] = None):
+        """
+        Map a CSV file for reading.
+
+        Args:
+            path (str): Path to the CSV file.
+            index (RowOffsetIndex): The file's index. Defaults to the
+            persisted one, rebuilt if stale.
+        """
+        self.path = path
+        if index is None:
+            index = RowOffsetIndex.open(path)
+        self.index = index
+        self._offsets = self.index.offsets
+        self._map = None
+        if self.index.size:
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self._parse(0, 1)
+        self.header = header[0] if header else []
+
+    def close(self) -> None:
+        """
+        Release the memory map.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _parse(self, start: int, end: int) -> List[List[str]]:
+        """
+        Parse the records between two record positions.
+
+        Positions count the header as record 0. The bytes are decoded the
+        same way `open` would, so rows match a plain `csv.reader` pass.
+        """
+        if self._map is None or start >= end:
+            return []
+        chunk = self._map[self._offsets[start]:self._offsets[end]]
+        with io.TextIOWrapper(io.BytesIO(chunk)) as f:
+            return list(csv.reader(f))
+
+    def __len__(self) -> int:
+        """
+        Return the number of rows in the dataset.
+        """
+        return len(self.index)
+
+    def __getitem__(self, index: Union[int, slice]):
+        """
+        Parse one row, or a list of rows for a slice.
+
+        Args:
+            index (int or slice): The row position(s), as for a list.
+
+        Returns:
+            List[str] or List[List[str]]: The requested row(s).
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self._parse(start + 1, max(stop, start) + 1)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("dataset index out of range")
+        return self._parse(index + 1, index + 2)[0]
+
+    def __iter__(self) -> Iterator[List[str]]:
+        """
+        Iterate over every row, parsing a bounded batch at a time.
+        """
+        batch = 1024
+        for start in range(0, len(self), batch):
+            yield from self[start:start + batch]
+
+    def column_index(self, column: Union[int, str]) -> int:
+        """
+        Resolve a column name or position to a position.
+
+        Raises:
+            KeyError: If the column is not in the header.
+        """
+        if isinstance(column, int):
+            return column
+        try:
+            return self.header.index(column)
+        except ValueError:
+            raise KeyError(column) from None
+
+    def cells(self, column: Union[int, str],
+              typed: bool = False) -> Iterator:
+        """
+        Iterate over every cell of one column, in row order.
+
+        Rows that are too short to have the column yield None.
+        """
+        column = self.column_index(column)
+        for row in self:
+            if column >= len(row):
+                yield None
+            else:
+                yield _typed(row[column]) if typed else row[column]
+
+    def row(self, index: int, typed: bool = True) -> list:
+        """
+        Parse one row, turning integer cells into `int` by default.
+
+        Args:
+            index (int): The row position.
+            typed (bool): Whether canonical integer cells become `int`.
+        """
+        row = self[index]
+        return [_typed(cell) for cell in row] if typed else row
+
+    def value(self, index: int, column: Union[int, str], typed: bool = True):
+        """
+        Return a single cell, or None if the row is too short to have it.
+        """
+        row = self[index]
+        column = self.column_index(column)
+        if column >= len(row):
+            return None
+        return _typed(row[column]) if typed else row[column]
+
+
+def _typed(cell: str):
+    """
+    Turn a canonical integer cell into an `int`, leaving others unchanged.
+    """
+    try:
+        number = int(cell)
+    except ValueError:
+        return cell
+    return number if str(number) == cell else cell
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Secondary index module.
+
+This module provides `SecondaryIndex`, which maps each value of one column
+to the sorted array of row ids holding that value (its postings list), and
+`intersect`, which combines postings lists for filters on several columns.
+A filtered page is then a slice of a postings list, so it costs time in
+proportion to the page and the matches rather than to the whole dataset.
+"""
+
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+def cell(row: List, column: int) -> Optional[str]:
+    """
+    Return a row's cell in a column, or None if the row is too short.
+    """
+    return row[column] if column < len(row) else None
+
+
+class SecondaryIndex:
+    """
+    Postings lists of one column, kept sorted by row id.
+
+    Cells are indexed by their text, as found in the rows. Rows that are too
+    short to have the column are not indexed.
+    """
+
+    def __init__(self, column: int, postings: Dict[str, array]):
+        """
+        Initialize an index from already built postings lists.
+
+        Use `build` instead of calling this directly.
+
+        Args:
+            column (int): The indexed column's position.
+            postings (Dict[str, array]): Sorted row ids by cell value.
+        """
+        self.column = column
+        self._postings = postings
+
+    @classmethod
+    def build(cls, values: Iterable[Tuple[int, Optional[str]]],
+              column: int) -> "SecondaryIndex":
+        """
+        Build an index from `(row_id, value)` pairs.
+
+        Args:
+            values (Iterable[Tuple[int, str]]): The cells of the column. Row
+            ids may come in any order; None values are skipped.
+            column (int): The indexed column's position.
+
+        Returns:
+            SecondaryIndex: The index.
+        """
+        postings = {}
+        unsorted = set()
+        for row_id, value in values:
+            if value is None:
+                continue
+            ids = postings.get(value)
+            if ids is None:
+                ids = postings[value] = array('q')
+            elif ids[-1] > row_id:
+                unsorted.add(value)
+            ids.append(row_id)
+        for value in unsorted:
+            postings[value] = array('q', sorted(postings[value]))
+        return cls(column, postings)
+
+    def postings(self, value: str) -> Sequence[int]:
+        """
+        Return the sorted ids of the rows holding a value.
+        """
+        return self._postings.get(value, array('q'))
+
+    def values(self) -> List[str]:
+        """
+        Return the distinct values present in the column.
+        """
+        return [value for value, ids in self._postings.items() if ids]
+
+    def copy(self) -> "SecondaryIndex":
+        """
+        Return an independent copy of the index.
+        """
+        return SecondaryIndex(self.column, {value: ids[:] for value, ids
+                                            in self._postings.items()})
+
+    def add(self, row_id: int, row: List) -> None:
+        """
+        Index a row that was added or replaced.
+        """
+        value = cell(row, self.column)
+        if value is None:
+            return
+        ids = self._postings.setdefault(value, array('q'))
+        if not ids or ids[-1] < row_id:
+            ids.append(row_id)  # New rows always get the largest id
+        else:
+            position = bisect_left(ids, row_id)
+            if position == len(ids) or ids[position] != row_id:
+                ids.insert(position, row_id)
+
+    def remove(self, row_id: int, row: List) -> None:
+        """
+        Stop indexing a row that was deleted or replaced.
+        """
+        ids = self._postings.get(cell(row, self.column))
+        if not ids:
+            return
+        position = bisect_left(ids, row_id)
+        if position < len(ids) and ids[position] == row_id:
+            del ids[position]
+
+
+def intersect(lists: List[Sequence[int]]) -> Sequence[int]:
+    """
+    Intersect sorted postings lists.
+
+    The shortest list drives the walk and each other list is searched with
+    a forward-moving binary search, so the cost is about
+    O(len(shortest) * log(len(longest))).
+
+    Args:
+        lists (List[Sequence[int]]): Sorted row id lists.
+
+    Returns:
+        Sequence[int]: The sorted ids present in every list.
+    """
+    if not lists:
+        return array('q')
+    lists = sorted(lists, key=len)
+    if len(lists) == 1:
+        return lists[0]
+    result = array('q')
+    lows = [0] * len(lists)
+    for row_id in lists[0]:
+        for i in range(1, len(lists)):
+            other = lists[i]
+            lows[i] = bisect_left(other, row_id, lows[i])
+            if lows[i] == len(other):
+                return result
+            if other[lows[i]] != row_id:
+                break
+        else:
+            result.append(row_id)
+    return result
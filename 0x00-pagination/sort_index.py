@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Sort index module.
+
+This module provides `SortIndex`, a precomputed permutation of the live row
+ids of a dataset ordered by one column, so a page of a sorted listing is a
+slice of an array instead of a sort of the whole dataset. It also provides
+`top_ids`, a heap based partial selection for the first rows of an ordering
+that has no permutation yet.
+
+Cells are compared by value: integers numerically, and before any text.
+Rows that are too short to have the column compare lower than everything
+else. Rows with equal cells keep their row id order in both directions.
+"""
+
+import heapq
+from array import array
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+
+def parse_order(order_by: str) -> Tuple[str, bool]:
+    """
+    Split an `order_by` specification into a column and a direction.
+
+    Args:
+        order_by (str): A column name, prefixed with "-" to sort in
+        descending order (e.g. "-Count").
+
+    Returns:
+        Tuple[str, bool]: The column name and whether the order descends.
+    """
+    if order_by.startswith("-"):
+        return order_by[1:], True
+    return order_by, False
+
+
+def value_key(value: Optional[Union[int, str]]) -> tuple:
+    """
+    Turn a cell into a key that orders cells by value.
+
+    Args:
+        value (int or str or None): The cell, None if the row is too short.
+
+    Returns:
+        tuple: A key comparable with the key of any other cell.
+    """
+    if value is None:
+        return (0, 0, "")
+    if isinstance(value, str):
+        try:
+            number = int(value)
+        except ValueError:
+            return (2, 0, value)
+        if str(number) != value:
+            return (2, 0, value)
+        value = number
+    return (1, value, "")
+
+
+def row_key(value: Optional[Union[int, str]], row_id: int,
+            descending: bool) -> tuple:
+    """
+    Return the key under which a row is stored in a permutation.
+
+    Permutations are stored in ascending key order. Descending orders are
+    read backwards, so their ties are keyed on the negated row id to still
+    come out in row id order.
+    """
+    return (value_key(value), -row_id if descending else row_id)
+
+
+def bisect_ids(ids: array, target: tuple, key: Callable[[int], tuple],
+               right: bool = False) -> int:
+    """
+    Return where `target` goes in a permutation sorted by `key`.
+
+    It works like `bisect_left`, or `bisect_right` if `right` is set, with
+    their `key` argument, which only exists from Python 3.10.
+    """
+    low, high = 0, len(ids)
+    while low < high:
+        middle = (low + high) // 2
+        other = key(ids[middle])
+        if other < target or (right and other == target):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class SortIndex:
+    """
+    Live row ids of a dataset, ordered by one column.
+    """
+
+    def __init__(self, column: int, descending: bool, ids: array,
+                 value_of: Callable[[int], Optional[Union[int, str]]]):
+        """
+        Initialize an index from an already sorted permutation.
+
+        Use `build` instead of calling this directly.
+
+        Args:
+            column (int): The sorted column's position.
+            descending (bool): Whether the order descends.
+            ids (array): The row ids, in ascending stored key order.
+            value_of (Callable): Returns the current cell of a live row.
+        """
+        self.column = column
+        self.descending = descending
+        self._ids = ids
+        self._value_of = value_of
+
+    @classmethod
+    def build(cls, values: Iterable[Tuple[int, Optional[Union[int, str]]]],
+              column: int, descending: bool,
+              value_of: Callable[[int], Optional[Union[int, str]]]
+              ) -> "SortIndex":
+        """
+        Sort `(row_id, value)` pairs into a permutation.
+
+        Args:
+            values (Iterable[Tuple[int, object]]): The cells of the column
+            for every live row.
+            column (int): The sorted column's position.
+            descending (bool): Whether the order descends.
+            value_of (Callable): Returns the current cell of a live row,
+            used to keep the permutation sorted as rows change.
+
+        Returns:
+            SortIndex: The index.
+        """
+        keyed = sorted((row_key(value, row_id, descending), row_id)
+                       for row_id, value in values)
+        return cls(column, descending, array('q', (row_id for _, row_id
+                                                   in keyed)), value_of)
+
+    def __len__(self) -> int:
+        """
+        Return the number of rows in the permutation.
+        """
+        return len(self._ids)
+
+    def _key(self, row_id: int) -> tuple:
+        """
+        Return the stored key of a row from its current cell.
+        """
+        return row_key(self._value_of(row_id), row_id, self.descending)
+
+    def window(self, start: int, end: int) -> List[int]:
+        """
+        Return the row ids at positions `start` to `end - 1` of the order.
+        """
+        if not self.descending:
+            return list(self._ids[start:end])
+        size = len(self._ids)
+        return list(reversed(self._ids[max(size - end, 0):
+                                       max(size - start, 0)]))
+
+    def after(self, key: Optional[Tuple[Optional[Union[int, str]], int]],
+              count: int) -> List[int]:
+        """
+        Return the first `count` row ids of the order that come after a key.
+
+        Args:
+            key (tuple): A `(cell, row_id)` pair, as it was when the row was
+            read, or None to start from the first row. The row need not be
+            in the permutation any more.
+            count (int): How many ids to return.
+
+        Returns:
+            List[int]: The row ids, found with an O(log n) binary search.
+        """
+        if key is None:
+            return self.window(0, count)
+        value, row_id = key
+        target = row_key(value, row_id, self.descending)
+        if not self.descending:
+            position = bisect_ids(self._ids, target, self._key, right=True)
+            return list(self._ids[position:position + count])
+        position = bisect_ids(self._ids, target, self._key)
+        return list(reversed(self._ids[max(position - count, 0):position]))
+
+    def copy(self, value_of: Callable[[int], Optional[Union[int, str]]],
+             shared: bool = False) -> "SortIndex":
+        """
+        Return a copy of the index that reads cells with `value_of`.
+
+        Args:
+            value_of (Callable): Returns the current cell of a live row.
+            shared (bool): Reuse the permutation instead of copying it. It
+            must then not be changed through either index.
+        """
+        ids = self._ids if shared else self._ids[:]
+        return SortIndex(self.column, self.descending, ids, value_of)
+
+    def add(self, row_id: int, value: Optional[Union[int, str]]) -> None:
+        """
+        Insert a row that was added or replaced, in O(log n) comparisons.
+        """
+        target = row_key(value, row_id, self.descending)
+        position = bisect_ids(
+            self._ids, target,
+            lambda other: target if other == row_id else self._key(other),
+            right=True)
+        self._ids.insert(position, row_id)
+
+    def remove(self, row_id: int, value: Optional[Union[int, str]]) -> None:
+        """
+        Remove a row that was deleted or replaced.
+
+        Args:
+            row_id (int): The row's id.
+            value (int or str or None): The row's cell before the change.
+        """
+        target = row_key(value, row_id, self.descending)
+        position = bisect_ids(
+            self._ids, target,
+            lambda other: target if other == row_id else self._key(other))
+        if position < len(self._ids) and self._ids[position] == row_id:
+            del self._ids[position]
+
+
+def top_ids(values: Iterable[Tuple[int, Optional[Union[int, str]]]],
+            count: int, descending: bool) -> List[int]:
+    """
+    Select the first row ids of an ordering without sorting every row.
+
+    Args:
+        values (Iterable[Tuple[int, object]]): `(row_id, cell)` pairs.
+        count (int): How many ids to return.
+        descending (bool): Whether the order descends.
+
+    Returns:
+        List[int]: The first `count` row ids of the ordering.
+    """
+    select = heapq.nlargest if descending else heapq.nsmallest
+    best = select(count, values,
+                  key=lambda pair: row_key(pair[1], pair[0], descending))
+    return [row_id for row_id, _ in best]
@@ -5,7 +5,7 @@ Basic caching module.
 This module defines a basic caching system that allows storing
 and retrieving items in memory using a dictionary.
 """
-from base_caching import BaseCaching
+from base_caching import BaseCaching, instrumented, synchronized
 
 
 class BasicCache(BaseCaching):
@@ -18,7 +18,41 @@ class BasicCache(BaseCaching):
     eviction policy when the cache reaches a certain size.
     """
 
-    def put(self, key, item):
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None,
+                 ttl=None, clock=None, listener=None, sample_every=None):
+        """
+        Initializes the cache.
+
+        It takes the arguments of BaseCaching, but holds any number of
+        items of any size: `max_items` is stored but never enforced, and
+        byte limits are refused rather than silently ignored.
+
+        Args:
+            max_items (int): Not enforced. Defaults to
+            BaseCaching.MAX_ITEMS.
+            max_bytes (int): Must be None.
+            sizeof (callable): Must be None.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, for TTLs.
+            Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item the cache removes. Defaults to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
+
+        Raises:
+            ValueError: If `max_bytes` or `sizeof` is given.
+        """
+        if max_bytes is not None or sizeof is not None:
+            raise ValueError("BasicCache has no size limit: max_bytes and "
+                             "sizeof do not apply")
+        super().__init__(max_items, None, None, ttl, clock, listener,
+                         sample_every)
+
+    @synchronized
+    @instrumented
+    def put(self, key, item, ttl=None):
         """
         Adds an item to the cache.
 
@@ -27,15 +61,23 @@ class BasicCache(BaseCaching):
         Args:
             key (str): The key under which the item is to be stored.
             item (any): The item to store in the cache.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
 
         Returns:
             None
         """
         if key is None or item is None:
             return
+
+        # Expired items go first, before any other item is discarded
+        self.purge_expired()
         # Store the item in the cache using the provided key
         self.cache_data[key] = item
+        self._set_expiry(key, ttl)
 
+    @synchronized
+    @instrumented
     def get(self, key):
         """
         Retrieves an item from the cache by its key.
@@ -50,6 +92,26 @@ class BasicCache(BaseCaching):
             any: The item associated with the key, or None if the key is not
             found.
         """
+        # Expired items are removed when they are looked up
+        if key in self.cache_data and self._expired(key):
+            return None
+
         # Retrieve and return the item from the cache if it exists, or None
         # if not found
         return self.cache_data.get(key, None)
+
+    def _make_room_many(self, items):
+        """
+        Makes no room for a batch of items: the basic cache has no size
+        limit.
+        """
+
+    def _restore_record(self, key, item, ttl, data):
+        """
+        Restores an item from a snapshot: the basic cache has no size
+        limit, so every item fits.
+        """
+        self.cache_data[key] = item
+        if ttl is not None:
+            self._set_expiry(key, ttl)
+        return True
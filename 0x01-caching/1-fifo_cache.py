@@ -7,7 +7,7 @@ This module defines a caching system that follows the First-In First-Out
 the oldest item (the first one added) is removed.
 """
 from collections import OrderedDict
-from base_caching import BaseCaching
+from base_caching import BaseCaching, instrumented, synchronized
 
 
 class FIFOCache(BaseCaching):
@@ -20,28 +20,51 @@ class FIFOCache(BaseCaching):
     items, the oldest (first-added) item is removed.
     """
 
-    def __init__(self):
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None,
+                 ttl=None, clock=None, listener=None, sample_every=None):
         """
         Initializes the FIFO cache.
 
         The cache is implemented using an OrderedDict to preserve the insertion
         order, which is essential for the FIFO behavior.
+
+        Args:
+            max_items (int): Maximum number of items. Defaults to
+            BaseCaching.MAX_ITEMS.
+            max_bytes (int): Maximum total size of the entries, in bytes.
+            Defaults to no limit.
+            sizeof (callable): Size estimator called as `sizeof(key, item)`,
+            e.g. `base_caching.deep_size`. Defaults to
+            `base_caching.shallow_size`.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, for TTLs.
+            Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item the cache removes. Defaults to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
         """
-        super().__init__()
+        super().__init__(max_items, max_bytes, sizeof, ttl, clock, listener,
+                         sample_every)
         # Use an OrderedDict to maintain the insertion order of items
         self.cache_data = OrderedDict()
 
-    def put(self, key, item):
+    @synchronized
+    @instrumented
+    def put(self, key, item, ttl=None):
         """
         Adds an item to the cache.
 
         If the `key` or `item` is None, this method does nothing. If the cache
-        exceeds its size limit (as defined by BaseCaching.MAX_ITEMS), the
-        first-added item is discarded.
+        would exceed its size limits (`max_items` items, and `max_bytes` bytes
+        if set), the first-added items are discarded until the item fits.
 
         Args:
             key (str): The key under which the item is to be stored.
             item (any): The item to store in the cache.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
 
         Returns:
             None
@@ -49,17 +72,20 @@ class FIFOCache(BaseCaching):
         if key is None or item is None:
             return
 
+        # Expired items go first, before any other item is discarded
+        self.purge_expired()
+
+        # Discard the first items added until the item fits
+        if not self._make_room(key, item):
+            return
+        self._set_expiry(key, ttl)
+
         # Add the item to the cache, replacing any existing item with the same
         # key
         self.cache_data[key] = item
 
-        # If the number of items exceeds the maximum allowed, discard the first
-        # item added
-        if len(self.cache_data) > BaseCaching.MAX_ITEMS:
-            # popitem(False) removes the first item added in the dictionary
-            first_key, _ = self.cache_data.popitem(last=False)
-            print("DISCARD:", first_key)
-
+    @synchronized
+    @instrumented
     def get(self, key):
         """
         Retrieves an item from the cache by its key.
@@ -74,6 +100,16 @@ class FIFOCache(BaseCaching):
             any: The item associated with the key, or None if the key is not
             found.
         """
+        # Expired items are removed when they are looked up
+        if key in self.cache_data and self._expired(key):
+            return None
+
         # Retrieve and return the item from the cache if it exists, or None if
         # not found
         return self.cache_data.get(key, None)
+
+    def _victim(self, key):
+        """
+        Returns the first-added key other than `key`.
+        """
+        return next(k for k in self.cache_data if k != key)
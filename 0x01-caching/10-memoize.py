@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Memoization Module.
+
+This module defines the `cached` decorator, which remembers the results of
+a function in one of the caches of this project, so an expensive call (a
+page of a dataset, a locale lookup) can be kept with whichever eviction
+policy suits it instead of the fixed LRU of `functools.lru_cache`.
+"""
+import asyncio
+import threading
+from functools import wraps
+from inspect import iscoroutinefunction, unwrap
+
+LFUCache = __import__('100-lfu_cache').LFUCache
+
+# Types whose values are used as keys directly when passed alone
+FAST_TYPES = {int, str}
+
+
+class Sentinel():
+    """
+    Sentinel class.
+
+    This class makes the unique markers stored in the caches by `cached`.
+    A sentinel is pickled by name, so the keys and results of a snapshot
+    restored in another process hold the same sentinels.
+    """
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        """
+        Initializes the sentinel.
+
+        Args:
+            name (str): The name of the module variable holding it.
+        """
+        self.name = name
+
+    def __reduce__(self):
+        """
+        Pickles the sentinel as a reference to its module variable.
+        """
+        return self.name
+
+    def __repr__(self):
+        """
+        Returns the name of the sentinel.
+        """
+        return self.name
+
+
+# Separates the positional from the keyword arguments in a key
+KWARGS_MARK = Sentinel("KWARGS_MARK")
+# Stands for a None result, since the caches do not store None
+NONE = Sentinel("NONE")
+
+
+class HashedKey(list):
+    """
+    HashedKey class.
+
+    This class holds the arguments of a call as a cache key, and computes
+    their hash once: the caches look a key up several times per request.
+    The hash is computed again when a key is unpickled, since str hashes
+    differ between processes.
+    """
+
+    __slots__ = ("hash_value",)
+
+    def __init__(self, values):
+        """
+        Initializes the key.
+
+        Args:
+            values (tuple): The arguments making up the key.
+        """
+        self[:] = values
+        self.hash_value = hash(values)
+
+    def __hash__(self):
+        """
+        Returns the hash computed when the key was built.
+        """
+        return self.hash_value
+
+    def __reduce__(self):
+        """
+        Pickles the key as its arguments, to be hashed again when loaded.
+        """
+        return HashedKey, (tuple(self),)
+
+
+def make_key(args, kwargs, typed=False):
+    """
+    Builds the cache key of a call.
+
+    Args:
+        args (tuple): The positional arguments.
+        kwargs (dict): The keyword arguments.
+        typed (bool): Whether arguments of different types, such as 1 and
+        1.0, make different keys.
+
+    Returns:
+        The argument itself for a single int or str argument, or a
+        HashedKey of all of them.
+    """
+    key = args
+    if kwargs:
+        key += (KWARGS_MARK,)
+        for item in kwargs.items():
+            key += item
+    if typed:
+        key += tuple(type(value) for value in args)
+        if kwargs:
+            key += tuple(type(value) for value in kwargs.values())
+    elif len(key) == 1 and type(key[0]) in FAST_TYPES:
+        return key[0]
+    return HashedKey(key)
+
+
+class Flight():
+    """
+    Flight class.
+
+    This class is the call computing a missing result, which the other
+    threads asking for the same key wait for instead of calling the
+    function again.
+    """
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        """
+        Initializes the flight.
+        """
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def cached(policy=LFUCache, capacity=None, ttl=None, typed=False):
+    """
+    Memoizes a function in a cache of the given policy.
+
+    Calls with the same arguments return the cached result while it is in
+    the cache. When several threads, or several tasks of an event loop,
+    miss on the same key at once, the function runs once and they all get
+    its result or its exception. Coroutine functions are supported; their
+    results, not their coroutines, are cached.
+
+    The decorated function has the attributes:
+      - cache: the cache instance
+      - cache_info(): its `statistics()`, plus "coalesced", the number of
+        misses that waited for a call already running
+      - cache_clear(): replaces the cache with an empty one
+
+    It can be used bare, as `@cached`, or as `@cached(LRUCache, 128)`.
+
+    Args:
+        policy (type): The cache class, e.g. LRUCache or TinyLFUCache.
+        Defaults to LFUCache.
+        capacity (int): Maximum number of results. Defaults to the
+        policy's default.
+        ttl (float): Seconds a result stays valid. Defaults to forever.
+        typed (bool): Whether arguments of different types, such as 1 and
+        1.0, are cached separately. Defaults to False.
+
+    Returns:
+        callable: The decorator, or the decorated function when used bare.
+    """
+    if callable(policy) and not isinstance(policy, type):
+        # Used bare: `policy` is the decorated function
+        return cached()(policy)
+
+    def decorator(func):
+        """
+        Wraps `func` with its own cache.
+        """
+        cache = policy(max_items=capacity, ttl=ttl)
+        pending = {}
+        lock = threading.Lock()
+        coalesced = [0]
+
+        def peek(key):
+            """
+            Looks a key up again, without counting it in the statistics.
+            """
+            with cache.lock:
+                return unwrap(type(cache).get)(cache, key)
+
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                """
+                Returns the cached result, or awaits the function.
+                """
+                key = make_key(args, kwargs, typed)
+                item = cache.get(key)
+                if item is not None:
+                    return None if item is NONE else item
+
+                loop = asyncio.get_running_loop()
+                with lock:
+                    # The call may have finished since the lookup
+                    item = peek(key)
+                    if item is None:
+                        future = pending.get(key)
+                        leader = (future is None
+                                  or future.get_loop() is not loop)
+                        if leader:
+                            future = pending[key] = loop.create_future()
+                        else:
+                            coalesced[0] += 1
+                if item is not None:
+                    return None if item is NONE else item
+                if not leader:
+                    try:
+                        # A waiter being cancelled must not cancel the call
+                        return await asyncio.shield(future)
+                    except asyncio.CancelledError:
+                        if not future.done():
+                            raise
+                    # The call was cancelled, not this waiter: make another
+                    return await wrapper(*args, **kwargs)
+
+                try:
+                    result = await func(*args, **kwargs)
+                    cache.put(key, NONE if result is None else result)
+                except BaseException as error:
+                    future.set_exception(error)
+                    # Nobody may be waiting to retrieve it
+                    future.exception()
+                    raise
+                else:
+                    future.set_result(result)
+                    return result
+                finally:
+                    with lock:
+                        if pending.get(key) is future:
+                            del pending[key]
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                """
+                Returns the cached result, or calls the function.
+                """
+                key = make_key(args, kwargs, typed)
+                item = cache.get(key)
+                if item is not None:
+                    return None if item is NONE else item
+
+                with lock:
+                    # The call may have finished since the lookup
+                    item = peek(key)
+                    if item is None:
+                        flight = pending.get(key)
+                        leader = flight is None
+                        if leader:
+                            flight = pending[key] = Flight()
+                        else:
+                            coalesced[0] += 1
+                if item is not None:
+                    return None if item is NONE else item
+                if not leader:
+                    flight.done.wait()
+                    if flight.error is not None:
+                        raise flight.error
+                    return flight.result
+
+                try:
+                    result = func(*args, **kwargs)
+                    cache.put(key, NONE if result is None else result)
+                    flight.result = result
+                    return result
+                except BaseException as error:
+                    flight.error = error
+                    raise
+                finally:
+                    with lock:
+                        del pending[key]
+                    flight.done.set()
+
+        def cache_info():
+            """
+            Returns the statistics of the cache.
+            """
+            info = cache.statistics()
+            info["coalesced"] = coalesced[0]
+            return info
+
+        def cache_clear():
+            """
+            Replaces the cache with an empty one, with new statistics.
+            """
+            nonlocal cache
+            cache = wrapper.cache = policy(max_items=capacity, ttl=ttl)
+
+        wrapper.cache = cache
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
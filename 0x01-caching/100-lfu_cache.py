@@ -6,7 +6,7 @@ This module defines a caching system that follows the Least Frequently Used
 (LFU) eviction policy. When the cache exceeds the maximum allowed items,
 the least frequently used item is removed.
 """
-from base_caching import BaseCaching
+from base_caching import BaseCaching, instrumented, synchronized
 from collections import OrderedDict
 
 
@@ -18,30 +18,83 @@ class LFUCache(BaseCaching):
     eviction policy. When the cache exceeds its maximum allowed number of items
     the least frequently used item is removed. In case of a tie, the Least
     Recently Used (LRU) item among the least frequently used is removed.
+
+    Keys are grouped in buckets by access frequency. Each bucket is an
+    OrderedDict kept in recency order (least recently used first), and the
+    lowest frequency with a non-empty bucket is tracked, so `put` and `get`
+    both run in constant time whatever the cache size.
     """
 
-    def __init__(self):
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None,
+                 ttl=None, clock=None, listener=None, sample_every=None):
         """
         Initializes the cache.
+
+        Args:
+            max_items (int): Maximum number of items. Defaults to
+            BaseCaching.MAX_ITEMS.
+            max_bytes (int): Maximum total size of the entries, in bytes.
+            Defaults to no limit.
+            sizeof (callable): Size estimator called as `sizeof(key, item)`,
+            e.g. `base_caching.deep_size`. Defaults to
+            `base_caching.shallow_size`.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, for TTLs.
+            Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item the cache removes. Defaults to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
         """
-        super().__init__()
-        # OrderedDict to maintain the order of key access (Least Recently Used)
-        self.lru_order_cache = OrderedDict()
+        super().__init__(max_items, max_bytes, sizeof, ttl, clock, listener,
+                         sample_every)
         # Dictionary to track the frequency of access for each key
         self.frequency_tracker = {}
+        # Keys by frequency, each bucket ordered from least to most recently
+        # used
+        self.frequency_buckets = {}
+        # Lowest frequency of any key in the cache
+        self.min_frequency = 0
 
-    def put(self, key, item):
+    def _touch(self, key):
+        """
+        Counts one more access to a key in the cache.
+
+        The key moves from its frequency bucket to the end (most recently
+        used position) of the next one.
+
+        Args:
+            key (str): The key that was accessed.
+        """
+        frequency = self.frequency_tracker[key]
+        bucket = self.frequency_buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self.frequency_buckets[frequency]
+            if self.min_frequency == frequency:
+                self.min_frequency = frequency + 1
+        self.frequency_tracker[key] = frequency + 1
+        buckets = self.frequency_buckets
+        buckets.setdefault(frequency + 1, OrderedDict())[key] = None
+
+    @synchronized
+    @instrumented
+    def put(self, key, item, ttl=None):
         """
         Adds an item to the cache using the LFU algorithm.
 
-        If the cache is full, the least frequently used (LFU) item will be
-        removed. If there is a tie (multiple items have the same minimum
+        If the cache is full (`max_items` items, or `max_bytes` bytes if set),
+        the least frequently used (LFU) items will be removed until the item
+        fits. If there is a tie (multiple items have the same minimum
         frequency), the Least Recently Used (LRU) item among them will be
-        removed.
+        removed first.
 
         Args:
             key (str): The key to store the item under.
             item (any): The value to be associated with the key.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
 
         Returns:
             None
@@ -49,61 +102,36 @@ class LFUCache(BaseCaching):
         if key is None or item is None:
             return
 
-        # If the key is already in the cache, remove it first to update its
-        # value
-        if key in self.lru_order_cache:
-            del self.lru_order_cache[key]
-
-        # Check if the cache exceeds the maximum allowed items
-        if len(self.lru_order_cache) >= BaseCaching.MAX_ITEMS:
-            # Find the minimum frequency in the frequency tracker
-            min_frequency = min(self.frequency_tracker.values())
-            # List all keys that have the minimum frequency
-            least_frequent_keys = [k for k, v in self.frequency_tracker.items()
-                                   if v == min_frequency]
-
-            # If there's exactly one LFU key, discard it
-            if len(least_frequent_keys) == 1:
-                least_frequent_key = least_frequent_keys[0]
-                print("DISCARD:", least_frequent_key)
-                # Remove from LRU cache
-                self.lru_order_cache.pop(least_frequent_key)
-                # Remove from frequency tracker
-                del self.frequency_tracker[least_frequent_key]
-
-            # If there are multiple LFU keys, discard the Least Recently Used
-            # (LRU) one
-            else:
-                for lru_key, _ in list(self.lru_order_cache.items()):
-                    if lru_key in least_frequent_keys:
-                        print("DISCARD:", lru_key)
-                        # Remove from LRU cache
-                        self.lru_order_cache.pop(lru_key)
-                        # Remove from frequency tracker
-                        del self.frequency_tracker[lru_key]
-                        break
-
-        # Add the new key-value pair to the LRU cache
-        self.lru_order_cache[key] = item
-        # Move to the end to mark it as recently used
-        self.lru_order_cache.move_to_end(key)
-
-        # Update the frequency count in the frequency tracker
-        if key in self.frequency_tracker:
-            self.frequency_tracker[key] += 1
-        else:
-            self.frequency_tracker[key] = 1
-
-        # Update the main cache data dictionary
-        self.cache_data = dict(self.lru_order_cache)
+        # Expired items go first, before any other item is discarded
+        self.purge_expired()
+
+        # Discard the least recently used of the least frequent keys until
+        # the item fits
+        if not self._make_room(key, item):
+            return
+        self._set_expiry(key, ttl)
 
+        # If the key is already in the cache, update its value and count the
+        # access
+        if key in self.cache_data:
+            self.cache_data[key] = item
+            self._touch(key)
+            return
+
+        # Add the new key-value pair with a frequency of 1
+        self.cache_data[key] = item
+        self.frequency_tracker[key] = 1
+        self.frequency_buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_frequency = 1
+
+    @synchronized
+    @instrumented
     def get(self, key):
         """
         Retrieves an item from the cache by its key.
 
-        If the key exists in the cache, its frequency is incremented.
-        The item is also moved to the end of the LRU cache to mark it as
-        recently used.
+        If the key exists in the cache, its frequency is incremented and it
+        becomes the most recently used key of its new frequency.
 
         Args:
             key (str): The key of the item to retrieve.
@@ -112,17 +140,89 @@ class LFUCache(BaseCaching):
             any: The value associated with the key, or None if the key is not
             found.
         """
-        if key is None or key not in self.lru_order_cache:
+        if (key is None or key not in self.cache_data
+                or self._expired(key)):
             return None
 
-        # Move the key to the end of the LRU cache to mark it as recently used
-        value = self.lru_order_cache[key]
-        self.lru_order_cache.move_to_end(key)
+        # Increment the access frequency
+        self._touch(key)
+        return self.cache_data[key]
 
-        # Increment the access frequency in the frequency tracker
-        if key in self.frequency_tracker:
-            self.frequency_tracker[key] += 1
-        else:
-            self.frequency_tracker[key] = 1
+    @synchronized
+    def get_many(self, keys):
+        """
+        Retrieves the items of several keys at once, counting an
+        access to each one found.
 
-        return value
+        Args:
+            keys (iterable): The keys to look up.
+
+        Returns:
+            dict: The items found, by key. Missing and expired keys are left
+            out.
+        """
+        cache_data, expiries = self.cache_data, self.expiries
+        found = {}
+        hits = misses = 0
+        for key in keys:
+            if key not in cache_data or (key in expiries
+                                         and self._expired(key)):
+                misses += 1
+                continue
+            self._touch(key)
+            found[key] = cache_data[key]
+            hits += 1
+        self.stats.hits += hits
+        self.stats.misses += misses
+        return found
+
+    def _victim(self, key):
+        """
+        Returns the least recently used of the least frequent keys, other
+        than `key`.
+        """
+        # Discards may have emptied the lowest bucket
+        if self.min_frequency not in self.frequency_buckets:
+            self.min_frequency = min(self.frequency_buckets)
+        for candidate in self.frequency_buckets[self.min_frequency]:
+            if candidate != key:
+                return candidate
+        for frequency in sorted(self.frequency_buckets):
+            for candidate in self.frequency_buckets[frequency]:
+                if candidate != key:
+                    return candidate
+        return None
+
+    def _snapshot_entries(self):
+        """
+        Yields the items with their frequencies, the most frequent first
+        and, for each frequency, the most recently used first.
+        """
+        buckets = self.frequency_buckets
+        for frequency in sorted(buckets, reverse=True):
+            for key in reversed(buckets[frequency]):
+                yield key, self.cache_data[key], frequency
+
+    def _restore_entry(self, key, item, frequency):
+        """
+        Stores an item from a snapshot as the least recently used key of
+        its frequency.
+        """
+        if not self.cache_data or frequency < self.min_frequency:
+            self.min_frequency = frequency
+        self.cache_data[key] = item
+        self.frequency_tracker[key] = frequency
+        bucket = self.frequency_buckets.setdefault(frequency, OrderedDict())
+        bucket[key] = None
+        bucket.move_to_end(key, last=False)
+
+    def _remove(self, key):
+        """
+        Removes a key from the cache and from its frequency bucket.
+        """
+        super()._remove(key)
+        frequency = self.frequency_tracker.pop(key)
+        bucket = self.frequency_buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self.frequency_buckets[frequency]
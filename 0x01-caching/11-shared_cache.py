@@ -0,0 +1,778 @@
+#!/usr/bin/env python3
+"""
+Shared-Memory Caching Module.
+
+This module defines a cache kept in a `multiprocessing.shared_memory`
+segment, so the worker processes of one host (e.g. the gunicorn workers of
+the i18n apps or of the pagination Server) share one warm cache instead of
+each filling its own. It holds bytes under str or bytes keys, in entries of
+fixed size, and evicts with CLOCK, an approximation of LRU.
+"""
+import fcntl
+import math
+import os
+import secrets
+import struct
+import tempfile
+import threading
+import weakref
+from collections.abc import MutableMapping
+from hashlib import blake2b
+from multiprocessing import resource_tracker, shared_memory
+
+from base_caching import BaseCaching, instrumented, synchronized
+
+# Start of every segment
+SEGMENT_MAGIC = b"ALXSHM01"
+# Layout of a segment: maximum number of items, maximum key and item sizes,
+# and number of buckets of the hash table
+HEADER = struct.Struct("<8sIIII")
+# State of a segment, after its header: clock hand, number of items, first
+# free entry and earliest deadline
+STATE = struct.Struct("<iiid")
+# Entry, followed by its key and item: key hash, deadline, next free entry,
+# key length, item length, key type, whether it is used and referenced
+ENTRY = struct.Struct("<QdiIIBBB")
+# Offsets of the ENTRY fields changed on their own
+DEADLINE_FIELD = 8
+NEXT_FIELD = 16
+ITEM_LENGTH_FIELD = 24
+USED_FIELD = 29
+REFERENCED_FIELD = 30
+INT = struct.Struct("<i")
+UINT = struct.Struct("<I")
+FLOAT = struct.Struct("<d")
+# Entry number standing for no entry
+NIL = -1
+# Types of keys
+BYTES, STR = 0, 1
+# The ProcessLock of each lock file in this process, and the lock guarding
+# them
+process_locks = {}
+process_locks_lock = threading.Lock()
+
+
+def align(size):
+    """
+    Rounds a size up to a multiple of 8 bytes.
+    """
+    return (size + 7) & ~7
+
+
+def encode_key(key):
+    """
+    Returns the type and the bytes of a key, or (None, None) if it is
+    neither str nor bytes.
+    """
+    if isinstance(key, str):
+        return STR, key.encode("utf-8")
+    if isinstance(key, bytes):
+        return BYTES, key
+    return None, None
+
+
+def remove_segment(segment, lock_path, owner=None):
+    """
+    Destroys a segment and its lock file, unless `owner` is the id of
+    another process than this one.
+    """
+    if owner is not None and owner != os.getpid():
+        return
+    # Registered again, since SharedMemory.unlink unregisters it
+    resource_tracker.register(segment._name, "shared_memory")
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    try:
+        os.unlink(lock_path)
+    except FileNotFoundError:
+        pass
+
+
+def state_field(offset, codec):
+    """
+    Returns a property reading and writing a field of a table's STATE.
+    """
+    def read(self):
+        """
+        Returns the value of the field.
+        """
+        return codec.unpack_from(self.buf, HEADER.size + offset)[0]
+
+    def write(self, value):
+        """
+        Sets the value of the field.
+        """
+        codec.pack_into(self.buf, HEADER.size + offset, value)
+    return property(read, write)
+
+
+class ProcessLock():
+    """
+    ProcessLock class.
+
+    This class is a reentrant lock held by one thread of one process at a
+    time: a threading.RLock between the threads of a process, and an fcntl
+    lock on a file between processes. fcntl locks belong to a process, so a
+    child forked from a process holding one does not hold it.
+
+    For the same reason, two locks on one file in a process would not
+    exclude each other, and closing either would drop the other's hold:
+    `open` gives every user of a file in the process the same lock, whose
+    file is closed when its last user closes it.
+    """
+
+    def __init__(self, path):
+        """
+        Initializes the lock. Use `open` instead, to share it.
+
+        Args:
+            path (str): The lock file, created if it does not exist.
+        """
+        self.path = path
+        self.thread_lock = threading.RLock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Number of times the holding thread acquired the lock
+        self.depth = 0
+        # Number of users that opened the lock and did not close it
+        self.users = 0
+
+    @classmethod
+    def open(cls, path):
+        """
+        Returns the lock of a file in this process, creating it for its
+        first user.
+
+        Args:
+            path (str): The lock file, created if it does not exist.
+
+        Returns:
+            ProcessLock: The lock, to `close` once done with it.
+        """
+        path = os.path.abspath(path)
+        with process_locks_lock:
+            lock = process_locks.get(path)
+            if lock is None:
+                lock = process_locks[path] = cls(path)
+            lock.users += 1
+            return lock
+
+    def acquire(self):
+        """
+        Waits for the lock and takes it.
+        """
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            try:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            except BaseException:
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+        return True
+
+    def release(self):
+        """
+        Releases the lock, once for every `acquire`.
+        """
+        self.depth -= 1
+        if self.depth == 0:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+    def close(self):
+        """
+        Gives up the lock, closing its file once no user of the process is
+        left.
+        """
+        with process_locks_lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if process_locks.get(self.path) is self:
+                del process_locks[self.path]
+        os.close(self.fd)
+
+    def __enter__(self):
+        """
+        Acquires the lock for a `with` block.
+        """
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        """
+        Releases the lock at the end of a `with` block.
+        """
+        self.release()
+
+
+class SharedTable(MutableMapping):
+    """
+    SharedTable class.
+
+    This class is a mapping of str or bytes keys to bytes items, stored in
+    a shared memory buffer laid out as:
+      - a HEADER, starting with SEGMENT_MAGIC, and the STATE
+      - the buckets of an open-addressing hash table of entry numbers, probed
+        linearly and kept at most half full, like the one of SlotTable
+      - `max_items` entries: an ENTRY, then room for a key of `key_size`
+        bytes and an item of `item_size` bytes
+    Keys are hashed with BLAKE2b, since `hash` gives str and bytes a
+    different value in every process. Free entries are chained through
+    their next field.
+
+    It does not lock: SharedCache holds its lock around every call.
+    """
+
+    hand = state_field(0, INT)
+    size = state_field(4, INT)
+    free = state_field(8, INT)
+    next_expiry = state_field(12, FLOAT)
+
+    def __init__(self, buf):
+        """
+        Initializes the table over a buffer laid out by `create`.
+
+        Args:
+            buf (memoryview): The buffer of the segment.
+
+        Raises:
+            ValueError: If the buffer does not hold a table.
+        """
+        magic, max_items, key_size, item_size, buckets = \
+            HEADER.unpack_from(buf, 0)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError("the segment does not hold a cache")
+        self.buf = buf
+        self.max_items = max_items
+        self.key_size = key_size
+        self.item_size = item_size
+        self.buckets, self.table_offset, self.entries_offset, self.stride = \
+            self.layout(max_items, key_size, item_size)
+
+    @staticmethod
+    def layout(max_items, key_size, item_size):
+        """
+        Returns the number of buckets, the offsets of the hash table and
+        of the entries, and the size of an entry, for a table of the given
+        limits.
+        """
+        buckets = 1 << (2 * max(max_items, 1) - 1).bit_length()
+        table_offset = align(HEADER.size + STATE.size)
+        entries_offset = table_offset + INT.size * buckets
+        stride = align(ENTRY.size + key_size + item_size)
+        return buckets, table_offset, entries_offset, stride
+
+    @classmethod
+    def nbytes(cls, max_items, key_size, item_size):
+        """
+        Returns the size of the buffer holding a table of the given limits.
+        """
+        _, _, entries_offset, stride = cls.layout(max_items, key_size,
+                                                  item_size)
+        return entries_offset + max_items * stride
+
+    @classmethod
+    def create(cls, buf, max_items, key_size, item_size):
+        """
+        Lays out an empty table in a buffer of `nbytes` bytes.
+
+        Returns:
+            SharedTable: The table.
+        """
+        buckets, table_offset, entries_offset, stride = \
+            cls.layout(max_items, key_size, item_size)
+        HEADER.pack_into(buf, 0, SEGMENT_MAGIC, max_items, key_size,
+                         item_size, buckets)
+        STATE.pack_into(buf, HEADER.size, NIL, 0, 0 if max_items else NIL,
+                        math.inf)
+        # Every bucket holds NIL, whose bytes are all ones
+        buf[table_offset:entries_offset] = b"\xff" * (entries_offset
+                                                      - table_offset)
+        for entry in range(max_items):
+            following = entry + 1 if entry + 1 < max_items else NIL
+            ENTRY.pack_into(buf, entries_offset + entry * stride, 0,
+                            math.inf, following, 0, 0, 0, 0, 0)
+        return cls(buf)
+
+    def release(self):
+        """
+        Drops the buffer, once its segment is closed.
+        """
+        self.buf = None
+
+    def __len__(self):
+        """
+        Returns the number of items.
+        """
+        return self.size
+
+    def __contains__(self, key):
+        """
+        Tells whether a key is in the table.
+        """
+        return self.entry(key) != NIL
+
+    def __getitem__(self, key):
+        """
+        Returns the item of a key, raising KeyError if it is missing.
+        """
+        entry = self.entry(key)
+        if entry == NIL:
+            raise KeyError(key)
+        return self.item(entry)
+
+    def __setitem__(self, key, item):
+        """
+        Sets the item of a key, taking a free entry if the key is new.
+        """
+        kind, data = encode_key(key)
+        if kind is None:
+            raise TypeError("keys must be str or bytes")
+        if len(data) > self.key_size or len(item) > self.item_size:
+            raise ValueError("the key or the item is too large")
+        digest = self._digest(kind, data)
+        index = self._index(kind, data, digest)
+        entry = self._bucket(index)
+        if entry == NIL:
+            entry = self.free
+            if entry == NIL:
+                raise ValueError("the table is full")
+            self.free = INT.unpack_from(self.buf,
+                                        self._offset(entry) + NEXT_FIELD)[0]
+            ENTRY.pack_into(self.buf, self._offset(entry), digest, math.inf,
+                            NIL, len(data), 0, kind, 1, 1)
+            start = self._offset(entry) + ENTRY.size
+            self.buf[start:start + len(data)] = data
+            self._set_bucket(index, entry)
+            self.size += 1
+        offset = self._offset(entry)
+        start = offset + ENTRY.size + self.key_size
+        self.buf[start:start + len(item)] = item
+        UINT.pack_into(self.buf, offset + ITEM_LENGTH_FIELD, len(item))
+        self.buf[offset + REFERENCED_FIELD] = 1
+
+    def __delitem__(self, key):
+        """
+        Removes a key and its item, raising KeyError if it is missing.
+        """
+        kind, data = encode_key(key)
+        index = NIL
+        if kind is not None:
+            index = self._index(kind, data, self._digest(kind, data))
+        entry = NIL if index == NIL else self._bucket(index)
+        if entry == NIL:
+            raise KeyError(key)
+        self._vacate(index)
+        offset = self._offset(entry)
+        self.buf[offset + USED_FIELD] = 0
+        INT.pack_into(self.buf, offset + NEXT_FIELD, self.free)
+        self.free = entry
+        self.size -= 1
+
+    def __iter__(self):
+        """
+        Yields the keys, in entry order.
+        """
+        for entry in self.entries():
+            yield self.key(entry)
+
+    def fits(self, key, item):
+        """
+        Tells whether a key of str or bytes and an item of bytes fit in an
+        entry.
+        """
+        _, data = encode_key(key)
+        return len(data) <= self.key_size and len(item) <= self.item_size
+
+    def entry(self, key):
+        """
+        Returns the entry number of a key, or NIL if it is not cached.
+        """
+        kind, data = encode_key(key)
+        if kind is None:
+            return NIL
+        return self._bucket(self._index(kind, data,
+                                        self._digest(kind, data)))
+
+    def entries(self):
+        """
+        Yields the numbers of the used entries.
+        """
+        buf, offset, stride = self.buf, self.entries_offset, self.stride
+        for entry in range(self.max_items):
+            if buf[offset + entry * stride + USED_FIELD]:
+                yield entry
+
+    def used(self, entry):
+        """
+        Tells whether an entry holds an item.
+        """
+        return self.buf[self._offset(entry) + USED_FIELD] == 1
+
+    def key(self, entry):
+        """
+        Returns the key of an entry.
+        """
+        offset = self._offset(entry)
+        fields = ENTRY.unpack_from(self.buf, offset)
+        start = offset + ENTRY.size
+        data = bytes(self.buf[start:start + fields[3]])
+        return data.decode("utf-8") if fields[5] == STR else data
+
+    def item(self, entry):
+        """
+        Returns the item of an entry.
+        """
+        offset = self._offset(entry)
+        length = UINT.unpack_from(self.buf, offset + ITEM_LENGTH_FIELD)[0]
+        start = offset + ENTRY.size + self.key_size
+        return bytes(self.buf[start:start + length])
+
+    def deadline(self, entry):
+        """
+        Returns the deadline of an entry, infinite if it never expires.
+        """
+        return FLOAT.unpack_from(self.buf,
+                                 self._offset(entry) + DEADLINE_FIELD)[0]
+
+    def set_deadline(self, entry, deadline):
+        """
+        Sets the deadline of an entry.
+        """
+        FLOAT.pack_into(self.buf, self._offset(entry) + DEADLINE_FIELD,
+                        deadline)
+
+    def referenced(self, entry):
+        """
+        Tells whether an entry was used since the clock hand last passed.
+        """
+        return self.buf[self._offset(entry) + REFERENCED_FIELD] == 1
+
+    def reference(self, entry, referenced=True):
+        """
+        Sets or clears the referenced bit of an entry.
+        """
+        self.buf[self._offset(entry) + REFERENCED_FIELD] = int(referenced)
+
+    def _bucket(self, index):
+        """
+        Returns the entry number in a bucket of the hash table.
+        """
+        return INT.unpack_from(self.buf, self.table_offset
+                               + INT.size * index)[0]
+
+    def _set_bucket(self, index, entry):
+        """
+        Puts an entry number in a bucket of the hash table.
+        """
+        INT.pack_into(self.buf, self.table_offset + INT.size * index, entry)
+
+    def _offset(self, entry):
+        """
+        Returns the offset of an entry in the buffer.
+        """
+        return self.entries_offset + entry * self.stride
+
+    @staticmethod
+    def _digest(kind, data):
+        """
+        Returns the hash of a key, the same in every process.
+        """
+        digest = blake2b(data, digest_size=8, person=bytes((kind,)))
+        return int.from_bytes(digest.digest(), "little")
+
+    def _index(self, kind, data, digest):
+        """
+        Returns the index of `table` holding the entry of a key, or of the
+        empty bucket ending its probe sequence.
+        """
+        buf = self.buf
+        mask = self.buckets - 1
+        index = digest & mask
+        entry = self._bucket(index)
+        while entry != NIL:
+            offset = self._offset(entry)
+            fields = ENTRY.unpack_from(buf, offset)
+            if fields[0] == digest and fields[5] == kind:
+                start = offset + ENTRY.size
+                if buf[start:start + fields[3]] == data:
+                    break
+            index = (index + 1) & mask
+            entry = self._bucket(index)
+        return index
+
+    def _vacate(self, index):
+        """
+        Empties a bucket of `table`, moving back the buckets after it that
+        could no longer be found past the gap.
+        """
+        mask = self.buckets - 1
+        hole = index
+        index = (index + 1) & mask
+        entry = self._bucket(index)
+        while entry != NIL:
+            home = ENTRY.unpack_from(self.buf, self._offset(entry))[0] & mask
+            # The entry may fill the hole if it lies between home and here
+            if (index - home) & mask >= (index - hole) & mask:
+                self._set_bucket(hole, entry)
+                hole = index
+            index = (index + 1) & mask
+            entry = self._bucket(index)
+        self._set_bucket(hole, NIL)
+
+
+class SharedCache(BaseCaching):
+    """
+    SharedCache class.
+
+    This class implements a cache shared by the processes of a host. The
+    first process creating a cache of a given `name` allocates its segment;
+    the others attach to it. Each of them then sees the items put by all,
+    and discards items for all with the CLOCK policy: the entries form a
+    circle swept by a hand, which takes the first entry not used since it
+    last passed, or expired, and spares the others once.
+
+    Items must be bytes, of at most `item_size` bytes, under str or bytes
+    keys of at most `key_size` bytes once encoded; larger ones are rejected
+    like items larger than `max_bytes` by the other caches. Every call
+    holds a ProcessLock, shared by all the processes through a lock file.
+
+    A segment given a `name` outlives the processes using it until
+    `unlink` is called. A segment of a random name is destroyed with the
+    cache that created it, or when its process exits; processes forked
+    from it can attach to it meanwhile.
+    `stats` and the listener are those of the process, and only see the
+    calls it makes.
+    """
+
+    def __init__(self, name=None, max_items=None, key_size=64,
+                 item_size=1024, ttl=None, clock=None, listener=None,
+                 sample_every=None):
+        """
+        Initializes the cache, creating its segment or attaching to it.
+
+        When the segment already exists, its own `max_items`, `key_size`
+        and `item_size` are used instead of the ones given.
+
+        Args:
+            name (str): Name of the segment, which the other processes use
+            to attach to it. Defaults to a new random name, see `name`, for
+            a segment destroyed with the cache.
+            max_items (int): Maximum number of items. Defaults to
+            BaseCaching.MAX_ITEMS.
+            key_size (int): Maximum size of an encoded key, in bytes.
+            Defaults to 64.
+            item_size (int): Maximum size of an item, in bytes. Defaults to
+            1024.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, the same
+            in every process, for TTLs. Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item this process removes. Defaults to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
+        """
+        super().__init__(max_items, None, None, ttl, clock, listener,
+                         sample_every)
+        self.name = name or "alx_cache_" + secrets.token_hex(8)
+        self.lock = ProcessLock.open(os.path.join(tempfile.gettempdir(),
+                                                  self.name + ".lock"))
+        # Holding the lock, no process attaches before the table is laid out
+        with self.lock:
+            try:
+                size = SharedTable.nbytes(self.max_items, key_size,
+                                          item_size)
+                self.segment = shared_memory.SharedMemory(
+                    self.name, create=True, size=size)
+                self.cache_data = SharedTable.create(
+                    self.segment.buf, self.max_items, key_size, item_size)
+            except FileExistsError:
+                self.segment = shared_memory.SharedMemory(self.name)
+                self.cache_data = SharedTable(self.segment.buf)
+            # Keep the segment when this process exits, for the others. The
+            # processes may share one tracker, which must see registrations
+            # and unregistrations of the name alternate.
+            resource_tracker.unregister(self.segment._name, "shared_memory")
+        self.max_items = self.cache_data.max_items
+        self.finalizer = None
+        if name is None:
+            # No other process can find the segment by its name, so none
+            # would ever unlink it
+            self.finalizer = weakref.finalize(
+                self, remove_segment, self.segment, self.lock.path,
+                os.getpid())
+
+    @synchronized
+    @instrumented
+    def put(self, key, item, ttl=None):
+        """
+        Adds an item to the cache.
+
+        If the cache is full, the items the clock hand stops at are
+        discarded until the item fits.
+
+        Args:
+            key (str): The key to store the item under, str or bytes.
+            item (bytes): The value to be associated with the key.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
+
+        Returns:
+            None
+
+        Raises:
+            TypeError: If the key is not str or bytes, or the item not
+            bytes.
+        """
+        if key is None or item is None:
+            return
+        if not isinstance(key, (str, bytes)):
+            raise TypeError("SharedCache keys must be str or bytes")
+        if not isinstance(item, (bytes, bytearray, memoryview)):
+            raise TypeError("SharedCache items must be bytes")
+        item = bytes(item)
+
+        # Expired items go first, before any other item is discarded
+        self.purge_expired()
+
+        if not self.cache_data.fits(key, item):
+            if key in self.cache_data:
+                self._discard(key, "rejected")
+            return
+        if not self._make_room(key, item):
+            return
+        self.cache_data[key] = item
+        self._set_expiry(key, ttl)
+
+    @synchronized
+    @instrumented
+    def get(self, key):
+        """
+        Retrieves an item from the cache by its key, marking it as used for
+        the clock hand.
+
+        Args:
+            key (str): The key of the item to retrieve.
+
+        Returns:
+            bytes: The value associated with the key, or None if the key is
+            not found.
+        """
+        table = self.cache_data
+        entry = table.entry(key)
+        if entry == NIL:
+            return None
+        # Expired items are removed when they are looked up
+        if table.deadline(entry) <= self.clock():
+            self._expire(key)
+            return None
+        table.reference(entry)
+        return table.item(entry)
+
+    def purge_expired(self):
+        """
+        Removes every expired item.
+
+        The segment keeps the earliest deadline, so the entries are only
+        scanned once an item expired.
+
+        Returns:
+            int: The number of items removed.
+        """
+        table = self.cache_data
+        if table.next_expiry > self.clock():
+            return 0
+        with self.lock:
+            now = self.clock()
+            expired = []
+            earliest = math.inf
+            for entry in table.entries():
+                deadline = table.deadline(entry)
+                if deadline <= now:
+                    expired.append(table.key(entry))
+                elif deadline < earliest:
+                    earliest = deadline
+            table.next_expiry = earliest
+            for key in expired:
+                self._expire(key)
+            return len(expired)
+
+    def close(self):
+        """
+        Detaches this process from the cache, which the other processes
+        keep using.
+        """
+        self.stop_reaper()
+        with self.lock:
+            self.cache_data.release()
+            self.segment.close()
+        self.lock.close()
+
+    def unlink(self):
+        """
+        Destroys the segment and its lock file, once every process is done
+        with the cache. It may be called before or after `close`; processes
+        still attached keep their view of the segment.
+        """
+        if self.finalizer is not None:
+            self.finalizer.detach()
+        remove_segment(self.segment, self.lock.path)
+
+    def _set_expiry(self, key, ttl=None):
+        """
+        Stores the deadline of a key that was just put, from `ttl` or the
+        default TTL, in its entry.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        deadline = math.inf if ttl is None else self.clock() + ttl
+        table = self.cache_data
+        table.set_deadline(table.entry(key), deadline)
+        if deadline < table.next_expiry:
+            table.next_expiry = deadline
+
+    def _victim(self, key):
+        """
+        Returns the key the clock hand stops at, other than `key`.
+        """
+        table = self.cache_data
+        now = self.clock()
+        hand = table.hand
+        while True:
+            hand = (hand + 1) % table.max_items
+            if not table.used(hand):
+                continue
+            if table.referenced(hand) and table.deadline(hand) > now:
+                # Spared once: taken next time unless used again
+                table.reference(hand, False)
+                continue
+            victim = table.key(hand)
+            if victim != key:
+                table.hand = hand
+                return victim
+
+    def _snapshot_records(self):
+        """
+        Yields the records of the items, in entry order, with the time
+        they have left from the deadlines of the segment.
+        """
+        table = self.cache_data
+        now = self.clock()
+        for entry in table.entries():
+            deadline = table.deadline(entry)
+            if deadline == math.inf:
+                yield table.key(entry), table.item(entry), None, None
+            elif deadline > now:
+                yield (table.key(entry), table.item(entry), deadline - now,
+                       None)
+
+    def _restore_record(self, key, item, ttl, data):
+        """
+        Restores an item if it fits in an entry and the cache has room.
+        """
+        if not self.cache_data.fits(key, item):
+            return False
+        return super()._restore_record(key, item, ttl, data)
@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""
+Tiered Caching Module.
+
+This module defines a two-tier cache: any of the caches of this project
+holds the items in memory, and the items it evicts are written to a log
+file on local disk instead of being lost, from which they are read back
+when asked for again. The cache can then hold more items than fit in
+memory, for expensive values that are cheaper to read from disk than to
+compute again.
+"""
+import heapq
+import os
+import pickle
+import tempfile
+import threading
+import weakref
+from collections import ChainMap
+from collections.abc import MutableMapping
+
+from base_caching import BaseCaching, instrumented, synchronized
+
+LRUCache = __import__('3-lru_cache').LRUCache
+
+# Garbage in a log never triggers a compaction below this many bytes
+COMPACT_MIN_BYTES = 1 << 20
+
+
+def close_log(handle, path):
+    """
+    Closes the file of a log and deletes it.
+    """
+    os.close(handle[0])
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class DiskLog(MutableMapping):
+    """
+    DiskLog class.
+
+    This class is a mapping kept in an append-only file: every item written
+    is pickled at the end of the file, and `index` maps each key to the
+    offset and size of its record, and its deadline. Replacing or removing
+    an item only changes the index, leaving its old record as garbage in
+    the file.
+
+    When the garbage outweighs the live records (and COMPACT_MIN_BYTES), a
+    background thread copies the live records to a new file, without
+    holding `lock` but for the final swap, which also copies the records
+    written in the meantime. `close` stops it, so the log can be closed
+    while holding `lock`. The index keeps keys in the order they were
+    written, oldest first.
+
+    The file is scratch space of the process: it is emptied when the log
+    is opened, and deleted when it is closed or garbage collected.
+    """
+
+    def __init__(self, path=None, lock=None):
+        """
+        Initializes the log.
+
+        Args:
+            path (str): The file to write. Defaults to a new temporary
+            file.
+            lock (threading.RLock): The lock its users hold around every
+            call, which compactions take to swap files. Defaults to a new
+            one.
+        """
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="tiered-", suffix=".log")
+        else:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        self.path = path
+        self.lock = lock or threading.RLock()
+        # The descriptor is boxed so the finalizer sees it change
+        self.handle = [fd]
+        self.finalizer = weakref.finalize(self, close_log, self.handle,
+                                          path)
+        self.index = {}
+        self.end = 0
+        self.live_bytes = 0
+        self.compactor = None
+        self.closing = threading.Event()
+        self.compactions = 0
+
+    def __len__(self):
+        """
+        Returns the number of items.
+        """
+        return len(self.index)
+
+    def __contains__(self, key):
+        """
+        Tells whether a key is in the log.
+        """
+        return key in self.index
+
+    def __iter__(self):
+        """
+        Yields the keys, from the oldest written.
+        """
+        return iter(self.index)
+
+    def __getitem__(self, key):
+        """
+        Reads the item of a key, raising KeyError if it is missing.
+        """
+        found = self.read(key)
+        if found is None:
+            raise KeyError(key)
+        return found[0]
+
+    def __setitem__(self, key, item):
+        """
+        Appends an item that never expires.
+        """
+        self.write(key, item)
+
+    def __delitem__(self, key):
+        """
+        Removes a key, leaving its record as garbage.
+        """
+        _, size, _ = self.index.pop(key)
+        self.live_bytes -= size
+        self._maybe_compact()
+
+    def read(self, key):
+        """
+        Reads the item of a key from the file.
+
+        Returns:
+            tuple: The item and its deadline, or None if the key is not in
+            the log.
+        """
+        record = self.index.get(key)
+        if record is None:
+            return None
+        offset, size, deadline = record
+        return pickle.loads(os.pread(self.handle[0], size, offset)), deadline
+
+    def write(self, key, item, deadline=None):
+        """
+        Appends an item to the file, replacing any record of its key.
+
+        Args:
+            key (any): The key of the item.
+            item (any): The item, which must be picklable.
+            deadline (float): When the item expires. Defaults to never.
+        """
+        data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        os.pwrite(self.handle[0], data, self.end)
+        old = self.index.pop(key, None)
+        if old is not None:
+            self.live_bytes -= old[1]
+        self.index[key] = (self.end, len(data), deadline)
+        self.end += len(data)
+        self.live_bytes += len(data)
+        self._maybe_compact()
+
+    def close(self):
+        """
+        Stops a running compaction, then closes and deletes the file.
+        """
+        # A compaction waiting for the lock gives up instead of swapping
+        self.closing.set()
+        compactor = self.compactor
+        if compactor is not None:
+            compactor.join()
+        with self.lock:
+            self.finalizer()
+            self.index.clear()
+
+    def _maybe_compact(self):
+        """
+        Starts a compaction if the garbage outweighs the live records.
+        """
+        garbage = self.end - self.live_bytes
+        if (self.compactor is None and not self.closing.is_set()
+                and garbage > COMPACT_MIN_BYTES
+                and garbage > self.live_bytes):
+            self.compactor = threading.Thread(target=self._compact,
+                                              name="log-compactor",
+                                              daemon=True)
+            self.compactor.start()
+
+    def _acquire(self):
+        """
+        Waits for the lock until `close` is called.
+
+        Returns:
+            bool: Whether the lock was taken.
+        """
+        while not self.lock.acquire(timeout=0.05):
+            if self.closing.is_set():
+                return False
+        if self.closing.is_set():
+            self.lock.release()
+            return False
+        return True
+
+    def _compact(self):
+        """
+        Copies the live records to a new file and swaps it in, unless the
+        log is closed meanwhile.
+        """
+        if not self._acquire():
+            self.compactor = None
+            return
+        try:
+            index = dict(self.index)
+            fd = self.handle[0]
+        finally:
+            self.lock.release()
+        path = self.path + ".compact"
+        new_fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        swapped = False
+        try:
+            # The records indexed now are never overwritten: copy them
+            # without the lock
+            moved = {}
+            end = 0
+            for key, (offset, size, _) in index.items():
+                if self.closing.is_set():
+                    return
+                os.pwrite(new_fd, os.pread(fd, size, offset), end)
+                moved[key] = (offset, end)
+                end += size
+
+            if not self._acquire():
+                return
+            try:
+                # Records removed during the copy are garbage of the file
+                live = 0
+                new_index = {}
+                for key, (offset, size, deadline) in self.index.items():
+                    old_offset, new_offset = moved.get(key, (None, None))
+                    if old_offset != offset:
+                        # Written during the copy
+                        os.pwrite(new_fd, os.pread(fd, size, offset), end)
+                        new_offset = end
+                        end += size
+                    new_index[key] = (new_offset, size, deadline)
+                    live += size
+                os.replace(path, self.path)
+                self.index = new_index
+                self.handle[0] = new_fd
+                swapped = True
+                os.close(fd)
+                self.end = end
+                self.live_bytes = live
+                self.compactions += 1
+            finally:
+                self.lock.release()
+        except OSError:
+            pass
+        finally:
+            if not swapped:
+                os.close(new_fd)
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            self.compactor = None
+
+class TieredCache(BaseCaching):
+    """
+    TieredCache class.
+
+    This class implements a cache in two tiers:
+      - L1, an instance of any cache class of this project, in memory
+      - L2, a DiskLog receiving the items L1 evicts, and the items too
+        large for L1 (`max_bytes`)
+    A key is in one tier at a time. An item found in L2 is promoted back to
+    L1, which may evict others to L2 in turn. Items keep their deadline
+    across tiers; the deadlines of L2 go on `expiry_heap`, so
+    `purge_expired` finds its expired items without scanning it. L2 drops
+    the oldest written items when it holds more than `disk_bytes`, if set.
+
+    `stats` counts the calls to the whole cache, and the items leaving it:
+    expired from either tier, evicted from L2, or that could not be
+    pickled. `statistics` adds the hits and the size of each tier.
+    """
+
+    def __init__(self, policy=LRUCache, path=None, max_items=None,
+                 max_bytes=None, sizeof=None, ttl=None, clock=None,
+                 listener=None, sample_every=None, disk_bytes=None):
+        """
+        Initializes the cache.
+
+        Args:
+            policy (type): The cache class of L1, e.g. LRUCache or
+            ARCCache. Defaults to LRUCache.
+            path (str): The file of L2, emptied now and deleted on `close`.
+            Defaults to a new temporary file.
+            max_items (int): Maximum number of items in L1. Defaults to
+            BaseCaching.MAX_ITEMS.
+            max_bytes (int): Maximum total size of the entries in L1, in
+            bytes. Defaults to no limit.
+            sizeof (callable): Size estimator called as `sizeof(key, item)`.
+            Defaults to `base_caching.shallow_size`.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, for TTLs.
+            Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item leaving the cache. Defaults to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
+            disk_bytes (int): Maximum size of the items in L2, as pickled.
+            Defaults to no limit.
+        """
+        super().__init__(max_items, max_bytes, sizeof, ttl, clock, listener,
+                         sample_every)
+        self.l1 = policy(max_items=max_items, max_bytes=max_bytes,
+                         sizeof=sizeof, ttl=ttl, clock=self.clock,
+                         listener=self._spill)
+        self.l2 = DiskLog(path, self.lock)
+        self.disk_bytes = disk_bytes
+        # Deadlines of the items of L1, to take along to L2
+        self.deadlines = {}
+        self.l2_hits = 0
+        self.spills = 0
+        # A live view of the items of both tiers
+        self.cache_data = ChainMap(self.l1.cache_data, self.l2)
+
+    @synchronized
+    @instrumented
+    def put(self, key, item, ttl=None):
+        """
+        Adds an item to L1, or to L2 if it is too large for L1.
+
+        Args:
+            key (str): The key to store the item under.
+            item (any): The value to be associated with the key. It must be
+            picklable to be moved to L2.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
+
+        Returns:
+            None
+        """
+        if key is None or item is None:
+            return
+
+        if key in self.l2:
+            del self.l2[key]
+        self.l1.put(key, item, ttl)
+        self._set_deadline(key, ttl)
+        if key not in self.l1.cache_data:
+            self._write(key, item)
+
+    @synchronized
+    @instrumented
+    def get(self, key):
+        """
+        Retrieves an item from the cache by its key, moving it to L1 if it
+        is found in L2.
+
+        Args:
+            key (str): The key of the item to retrieve.
+
+        Returns:
+            any: The value associated with the key, or None if the key is not
+            found.
+        """
+        if key is None:
+            return None
+
+        item = self.l1.get(key)
+        if item is not None or key not in self.l2:
+            return item
+
+        item, deadline = self.l2.read(key)
+        del self.l2[key]
+        now = self.clock()
+        if deadline is not None and deadline <= now:
+            self._drop(key, item, "expired")
+            return None
+        self.l2_hits += 1
+        self.l1.put(key, item, None if deadline is None else deadline - now)
+        if key in self.l1.cache_data:
+            if deadline is not None:
+                self.deadlines[key] = deadline
+        else:
+            self.l2.write(key, item, deadline)
+            self._watch(key, deadline)
+        return item
+
+    def statistics(self):
+        """
+        Returns a snapshot of `stats`, with the hits, items and bytes of
+        each tier.
+
+        Returns:
+            dict: See `CacheStats.snapshot`, plus "size" and "bytes" of
+            L1, and "tiers": for "l1" and "l2", their "hits", "size" and
+            "bytes" (as pickled for L2), and for L2 the "spills" from L1,
+            "file_bytes" including garbage, and "compactions".
+        """
+        snapshot = self.stats.snapshot()
+        size = len(self.l1.cache_data)
+        snapshot["size"] = size + len(self.l2)
+        snapshot["bytes"] = self.l1.used_bytes
+        snapshot["tiers"] = {
+            "l1": {
+                "hits": self.l1.stats.hits,
+                "size": size,
+                "bytes": self.l1.used_bytes,
+            },
+            "l2": {
+                "hits": self.l2_hits,
+                "size": len(self.l2),
+                "bytes": self.l2.live_bytes,
+                "spills": self.spills,
+                "file_bytes": self.l2.end,
+                "compactions": self.l2.compactions,
+            },
+        }
+        return snapshot
+
+    def purge_expired(self):
+        """
+        Removes every expired item of both tiers.
+
+        The expired items of L2 are popped from `expiry_heap`, so each
+        removal costs O(log n) and L2 is not scanned.
+
+        Returns:
+            int: The number of items removed.
+        """
+        with self.lock:
+            removed = self.l1.purge_expired()
+            heap = self.expiry_heap
+            now = self.clock()
+            l2 = self.l2
+            while heap and heap[0][0] <= now:
+                deadline, _, key = heapq.heappop(heap)
+                record = l2.index.get(key)
+                # The item may have left L2, or been written again, since
+                if record is None or record[2] != deadline:
+                    continue
+                item = l2[key] if self.listener is not None else None
+                del l2[key]
+                self._drop(key, item, "expired")
+                removed += 1
+            return removed
+
+    def close(self):
+        """
+        Stops the expiry reaper and deletes the file of L2.
+        """
+        self.stop_reaper()
+        self.l2.close()
+
+    def _make_room_many(self, items):
+        """
+        Makes no room for a batch of items: L1 makes room for each item
+        itself, evicting to L2.
+        """
+
+    def _set_deadline(self, key, ttl=None):
+        """
+        Records the deadline of an item just put in L1, from `ttl` or the
+        default TTL.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            self.deadlines.pop(key, None)
+        else:
+            self.deadlines[key] = self.clock() + ttl
+
+    def _spill(self, key, item, reason):
+        """
+        Receives the items L1 removes: evicted ones go to L2, expired ones
+        leave the cache.
+        """
+        if reason == "evicted":
+            self._write(key, item)
+        elif reason == "expired":
+            self._drop(key, item, reason)
+        # A rejected item is being replaced by `put`, which stores the new
+        # one in L2
+
+    def _write(self, key, item):
+        """
+        Moves an item out of L1 into L2, with its deadline, then drops the
+        oldest items of L2 beyond `disk_bytes`.
+        """
+        deadline = self.deadlines.pop(key, None)
+        try:
+            self.l2.write(key, item, deadline)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self._drop(key, item, "evicted")
+            return
+        self.spills += 1
+        self._watch(key, deadline)
+        l2 = self.l2
+        while self.disk_bytes is not None and l2.live_bytes > self.disk_bytes:
+            oldest = next(iter(l2))
+            dropped = l2[oldest] if self.listener is not None else None
+            del l2[oldest]
+            self._drop(oldest, dropped, "evicted")
+
+    def _watch(self, key, deadline):
+        """
+        Pushes the deadline of an item just written to L2 on the expiry
+        heap.
+        """
+        if deadline is None:
+            return
+        heap = self.expiry_heap
+        heapq.heappush(heap, (deadline, next(self.expiry_order), key))
+        # Drop outdated deadlines once they make up most of the heap
+        if len(heap) > 2 * len(self.l2) + 64:
+            heap[:] = [(deadline, next(self.expiry_order), key)
+                       for key, (_, _, deadline) in self.l2.index.items()
+                       if deadline is not None]
+            heapq.heapify(heap)
+
+    def _drop(self, key, item, reason):
+        """
+        Reports an item leaving the cache to `stats` and the listener.
+        """
+        self.deadlines.pop(key, None)
+        evictions = self.stats.evictions
+        evictions[reason] = evictions.get(reason, 0) + 1
+        if self.listener is not None:
+            self.listener(key, item, reason)
+
+    def _policy(self):
+        """
+        Returns the policy of L1, whose items a snapshot holds. L2 is
+        scratch space and is not saved.
+        """
+        return type(self.l1)
+
+    def _snapshot_state(self):
+        """
+        Returns the state of L1.
+        """
+        return self.l1._snapshot_state()
+
+    def _restore_state(self, state):
+        """
+        Applies a state of L1.
+        """
+        self.l1._restore_state(state)
+
+    def _snapshot_records(self):
+        """
+        Yields the records of L1.
+        """
+        return self.l1._snapshot_records()
+
+    def _restore_record(self, key, item, ttl, data):
+        """
+        Restores an item in L1, with its deadline.
+        """
+        if not self.l1._restore_record(key, item, ttl, data):
+            return False
+        if ttl is not None:
+            self.deadlines[key] = self.clock() + ttl
+        return True
@@ -8,7 +8,7 @@ the least recently used item is removed.
 """
 from collections import OrderedDict
 
-from base_caching import BaseCaching
+from base_caching import BaseCaching, instrumented, synchronized
 
 
 class LRUCache(BaseCaching):
@@ -21,7 +21,8 @@ class LRUCache(BaseCaching):
     allowed number of items.
     """
 
-    def __init__(self):
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None,
+                 ttl=None, clock=None, listener=None, sample_every=None):
         """
         Initializes the cache.
 
@@ -29,21 +30,44 @@ class LRUCache(BaseCaching):
         maintains the order in which items are added. The oldest item
         (i.e., the least recently used) is stored at the end of the OrderedDict
         and the newest (i.e., most recently used) at the beginning.
+
+        Args:
+            max_items (int): Maximum number of items. Defaults to
+            BaseCaching.MAX_ITEMS.
+            max_bytes (int): Maximum total size of the entries, in bytes.
+            Defaults to no limit.
+            sizeof (callable): Size estimator called as `sizeof(key, item)`,
+            e.g. `base_caching.deep_size`. Defaults to
+            `base_caching.shallow_size`.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, for TTLs.
+            Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item the cache removes. Defaults to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
         """
-        super().__init__()
+        super().__init__(max_items, max_bytes, sizeof, ttl, clock, listener,
+                         sample_every)
         self.cache_data = OrderedDict()
 
-    def put(self, key, item):
+    @synchronized
+    @instrumented
+    def put(self, key, item, ttl=None):
         """
         Adds an item to the cache.
 
         If the key is already in the cache, it will be updated and moved to the
-        most recently used (MRU) position. If the cache exceeds its size limit,
-        the least recently used (LRU) item will be removed.
+        most recently used (MRU) position. If the cache would exceed its size
+        limits (`max_items` items, and `max_bytes` bytes if set), the least
+        recently used (LRU) items will be removed until the item fits.
 
         Args:
             key (str): The key to store the item under.
             item (any): The value to be associated with the key.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
 
         Returns:
             None
@@ -51,14 +75,15 @@ class LRUCache(BaseCaching):
         if key is None or item is None:
             return
 
-        # If the key is new and cache exceeds its max size, remove the least
-        # recently used (LRU) item
-        if key not in self.cache_data:
-            if len(self.cache_data) + 1 > BaseCaching.MAX_ITEMS:
-                # Remove the least recently used item (last entry)
-                lru_key, _ = self.cache_data.popitem(last=True)
-                print("DISCARD:", lru_key)
+        # Expired items go first, before any other item is discarded
+        self.purge_expired()
+
+        # If the cache is full, remove the least recently used (LRU) items
+        if not self._make_room(key, item):
+            return
+        self._set_expiry(key, ttl)
 
+        if key not in self.cache_data:
             # Add the new key-value pair to the cache and move it to the most
             # recently used (front) position
             self.cache_data[key] = item
@@ -72,6 +97,8 @@ class LRUCache(BaseCaching):
             # position
             self.cache_data.move_to_end(key, last=False)
 
+    @synchronized
+    @instrumented
     def get(self, key):
         """
         Retrieves an item from the cache by its key.
@@ -87,8 +114,46 @@ class LRUCache(BaseCaching):
             any: The value associated with the key, or None if the key is not
             found.
         """
+        # Expired items are removed when they are looked up
+        if key in self.cache_data and self._expired(key):
+            return None
+
         if key is not None and key in self.cache_data:
             # Move the key to the most recently used (front) position
             self.cache_data.move_to_end(key, last=False)
         # Return the value associated with the key (or None if not found)
         return self.cache_data.get(key, None)
+
+    @synchronized
+    def get_many(self, keys):
+        """
+        Retrieves the items of several keys at once, moving each one
+        found to the most recently used position in turn.
+
+        Args:
+            keys (iterable): The keys to look up.
+
+        Returns:
+            dict: The items found, by key. Missing and expired keys are left
+            out.
+        """
+        cache_data, expiries = self.cache_data, self.expiries
+        found = {}
+        hits = misses = 0
+        for key in keys:
+            if key not in cache_data or (key in expiries
+                                         and self._expired(key)):
+                misses += 1
+                continue
+            cache_data.move_to_end(key, last=False)
+            found[key] = cache_data[key]
+            hits += 1
+        self.stats.hits += hits
+        self.stats.misses += misses
+        return found
+
+    def _victim(self, key):
+        """
+        Returns the least recently used key other than `key`.
+        """
+        return next(k for k in reversed(self.cache_data) if k != key)
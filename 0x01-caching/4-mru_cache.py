@@ -7,7 +7,7 @@ This module defines a caching system that follows the Most Recently Used
 the most recently used item is removed.
 """
 from collections import OrderedDict
-from base_caching import BaseCaching
+from base_caching import BaseCaching, instrumented, synchronized
 
 
 class MRUCache(BaseCaching):
@@ -20,7 +20,8 @@ class MRUCache(BaseCaching):
     removed.
     """
 
-    def __init__(self):
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None,
+                 ttl=None, clock=None, listener=None, sample_every=None):
         """
         Initializes the cache.
 
@@ -28,21 +29,44 @@ class MRUCache(BaseCaching):
         maintains the order in which items are added. The most recently
         used (MRU) item is stored at the front, and the least recently
         used at the back.
+
+        Args:
+            max_items (int): Maximum number of items. Defaults to
+            BaseCaching.MAX_ITEMS.
+            max_bytes (int): Maximum total size of the entries, in bytes.
+            Defaults to no limit.
+            sizeof (callable): Size estimator called as `sizeof(key, item)`,
+            e.g. `base_caching.deep_size`. Defaults to
+            `base_caching.shallow_size`.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, for TTLs.
+            Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item the cache removes. Defaults to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
         """
-        super().__init__()
+        super().__init__(max_items, max_bytes, sizeof, ttl, clock, listener,
+                         sample_every)
         self.cache_data = OrderedDict()
 
-    def put(self, key, item):
+    @synchronized
+    @instrumented
+    def put(self, key, item, ttl=None):
         """
         Adds an item to the cache.
 
         If the key is already in the cache, its value is updated and moved to
-        the most recently used (MRU) position. If the cache exceeds its size
-        limit, the most recently used (MRU) item will be removed.
+        the most recently used (MRU) position. If the cache would exceed its
+        size limits (`max_items` items, and `max_bytes` bytes if set), the most
+        recently used (MRU) items will be removed until the item fits.
 
         Args:
             key (str): The key to store the item under.
             item (any): The value to be associated with the key.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
 
         Returns:
             None
@@ -50,14 +74,15 @@ class MRUCache(BaseCaching):
         if key is None or item is None:
             return
 
-        # If the key is new and cache exceeds its max size, remove the most
-        # recently used (MRU) item
+        # Expired items go first, before any other item is discarded
+        self.purge_expired()
+
+        # If the cache is full, remove the most recently used (MRU) items
+        if not self._make_room(key, item):
+            return
+        self._set_expiry(key, ttl)
+
         if key not in self.cache_data:
-            if len(self.cache_data) + 1 > BaseCaching.MAX_ITEMS:
-                # Remove the most recently used item
-                # (the first item in OrderedDict)
-                mru_key, _ = self.cache_data.popitem(last=False)
-                print("DISCARD:", mru_key)
 
             # Add the new key-value pair to the cache and move it to the most
             # recently used (front) position
@@ -69,6 +94,8 @@ class MRUCache(BaseCaching):
             # If the key already exists, update its value
             self.cache_data[key] = item
 
+    @synchronized
+    @instrumented
     def get(self, key):
         """
         Retrieves an item from the cache by its key.
@@ -84,8 +111,46 @@ class MRUCache(BaseCaching):
             any: The value associated with the key, or None if the key is not
             found.
         """
+        # Expired items are removed when they are looked up
+        if key in self.cache_data and self._expired(key):
+            return None
+
         if key is not None and key in self.cache_data:
             # Move the key to the most recently used (front) position
             self.cache_data.move_to_end(key, last=False)
         # Return the value associated with the key (or None if not found)
         return self.cache_data.get(key, None)
+
+    @synchronized
+    def get_many(self, keys):
+        """
+        Retrieves the items of several keys at once, moving each one
+        found to the most recently used position in turn.
+
+        Args:
+            keys (iterable): The keys to look up.
+
+        Returns:
+            dict: The items found, by key. Missing and expired keys are left
+            out.
+        """
+        cache_data, expiries = self.cache_data, self.expiries
+        found = {}
+        hits = misses = 0
+        for key in keys:
+            if key not in cache_data or (key in expiries
+                                         and self._expired(key)):
+                misses += 1
+                continue
+            cache_data.move_to_end(key, last=False)
+            found[key] = cache_data[key]
+            hits += 1
+        self.stats.hits += hits
+        self.stats.misses += misses
+        return found
+
+    def _victim(self, key):
+        """
+        Returns the most recently used key other than `key`.
+        """
+        return next(k for k in self.cache_data if k != key)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Sharded Caching Module.
+
+This module defines a thread-safe cache that splits its keys across several
+independent shards. Each shard is an ordinary cache running one of the
+existing eviction policies behind its own lock, so threads working on keys
+of different shards never wait for each other.
+"""
+from collections import ChainMap, defaultdict, deque
+from inspect import unwrap
+from threading import Lock
+
+from base_caching import BaseCaching, instrumented
+
+LRUCache = __import__('3-lru_cache').LRUCache
+
+
+class ShardedCache(BaseCaching):
+    """
+    ShardedCache class.
+
+    This class implements a thread-safe cache on top of the single-threaded
+    caches of this module. A key always goes to the same shard, chosen from
+    its hash, and the capacity is divided evenly between the shards; each
+    shard evicts with its own policy when it is full.
+
+    Writes take the shard's lock. Reads do not: the item is looked up
+    directly, and the key is queued in the shard's read buffer. The buffer
+    is replayed through the policy's `get` (which updates its recency or
+    frequency information) under the lock, either by the next write to the
+    shard or by a read that finds `READ_BUFFER_SIZE` keys queued and the
+    lock free. When reads outpace replays, the oldest queued reads are
+    dropped; the policy's bookkeeping is then only approximate, never
+    corrupted.
+
+    Hits, misses, insertions and updates are counted in `stats` without
+    locking either, so concurrent calls may lose a few counts; evictions
+    are counted exactly by the shards and added up by `statistics`.
+    """
+
+    SHARDS = 16
+    READ_BUFFER_SIZE = 64
+
+    def __init__(self, policy=LRUCache, shards=None, max_items=None,
+                 max_bytes=None, sizeof=None, ttl=None, clock=None,
+                 listener=None, sample_every=None):
+        """
+        Initializes the cache.
+
+        Args:
+            policy (type): The cache class each shard is an instance of,
+            e.g. LRUCache or LFUCache. Defaults to LRUCache.
+            shards (int): Number of shards, lowered to `max_items` if it
+            is larger, so that no shard is left without room. Defaults to
+            SHARDS.
+            max_items (int): Maximum number of items in the whole cache.
+            Defaults to BaseCaching.MAX_ITEMS.
+            max_bytes (int): Maximum total size of the entries, in bytes.
+            Defaults to no limit.
+            sizeof (callable): Size estimator called as `sizeof(key, item)`.
+            Defaults to `base_caching.shallow_size`.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, for TTLs.
+            Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item a shard removes, holding that shard's lock. Defaults
+            to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
+        """
+        super().__init__(max_items, max_bytes, sizeof, ttl, clock, listener,
+                         sample_every)
+        count = min(shards or self.SHARDS, max(self.max_items, 1))
+        self.shards = []
+        for i in range(count):
+            shard_bytes = None
+            if max_bytes is not None:
+                shard_bytes = (max_bytes + i) // count
+            self.shards.append(policy((self.max_items + i) // count,
+                                      shard_bytes, sizeof, ttl, self.clock,
+                                      listener))
+        self.locks = [Lock() for _ in self.shards]
+        self.read_buffers = [deque(maxlen=4 * self.READ_BUFFER_SIZE)
+                             for _ in self.shards]
+        # A live view of every shard's items
+        self.cache_data = ChainMap(*(shard.cache_data
+                                     for shard in self.shards))
+
+    def _shard_index(self, key):
+        """
+        Returns the index of the shard holding a key.
+        """
+        return hash(key) % len(self.shards)
+
+    def _drain(self, index):
+        """
+        Replays the reads queued for a shard. The shard's lock must be held.
+        """
+        shard, buffer = self.shards[index], self.read_buffers[index]
+        while buffer:
+            shard.get(buffer.popleft())
+
+    @instrumented
+    def put(self, key, item, ttl=None):
+        """
+        Adds an item to the cache.
+
+        The item goes to its key's shard, which discards items with its own
+        policy if it is full.
+
+        Args:
+            key (str): The key to store the item under.
+            item (any): The value to be associated with the key.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
+
+        Returns:
+            None
+        """
+        if key is None or item is None:
+            return
+
+        index = self._shard_index(key)
+        with self.locks[index]:
+            self._drain(index)
+            self.shards[index].put(key, item, ttl)
+
+    @instrumented
+    def get(self, key):
+        """
+        Retrieves an item from the cache by its key, without locking.
+
+        An expired item is not returned; it is removed by the next write to
+        its shard or by `purge_expired`.
+
+        Args:
+            key (str): The key of the item to retrieve.
+
+        Returns:
+            any: The value associated with the key, or None if the key is not
+            found.
+        """
+        if key is None:
+            return None
+
+        index = self._shard_index(key)
+        shard = self.shards[index]
+        item = shard.cache_data.get(key)
+        if item is None:
+            return None
+        deadline = shard.expiries.get(key)
+        if deadline is not None and deadline <= self.clock():
+            return None
+
+        buffer = self.read_buffers[index]
+        buffer.append(key)
+        if len(buffer) >= self.READ_BUFFER_SIZE:
+            lock = self.locks[index]
+            # Leave the replay to the current holder if the lock is taken
+            if lock.acquire(blocking=False):
+                try:
+                    self._drain(index)
+                finally:
+                    lock.release()
+        return item
+
+    def get_many(self, keys):
+        """
+        Retrieves the items of several keys at once, without locking.
+
+        Args:
+            keys (iterable): The keys to look up.
+
+        Returns:
+            dict: The items found, by key. Missing and expired keys are left
+            out.
+        """
+        get = unwrap(type(self).get)
+        found = {}
+        misses = 0
+        for key in keys:
+            item = get(self, key)
+            if item is None:
+                misses += 1
+            else:
+                found[key] = item
+        self.stats.hits += len(found)
+        self.stats.misses += misses
+        return found
+
+    def put_many(self, mapping, ttl=None):
+        """
+        Adds several items at once, taking each shard's lock once for all
+        the items of the batch it holds.
+
+        Args:
+            mapping (dict): The items to add, by key. Pairs with a None key
+            or item are skipped.
+            ttl (float): Seconds the items stay valid. Defaults to the
+            cache's default TTL.
+        """
+        batches = defaultdict(dict)
+        for key, item in dict(mapping).items():
+            if key is not None and item is not None:
+                batches[self._shard_index(key)][key] = item
+        for index, batch in batches.items():
+            shard = self.shards[index]
+            with self.locks[index]:
+                self._drain(index)
+                insertions = shard.stats.insertions
+                updates = shard.stats.updates
+                shard.put_many(batch, ttl)
+                self.stats.insertions += shard.stats.insertions - insertions
+                self.stats.updates += shard.stats.updates - updates
+
+    def statistics(self):
+        """
+        Returns a snapshot of `stats`, with the evictions, items and bytes
+        of every shard added up.
+
+        Returns:
+            dict: See `CacheStats.snapshot`, plus "size" and "bytes".
+        """
+        snapshot = self.stats.snapshot()
+        evictions = snapshot["evictions"]
+        for shard in self.shards:
+            for reason, number in dict(shard.stats.evictions).items():
+                evictions[reason] = evictions.get(reason, 0) + number
+        snapshot["size"] = sum(len(shard.cache_data) for shard in self.shards)
+        snapshot["bytes"] = sum(shard.used_bytes for shard in self.shards)
+        return snapshot
+
+    def purge_expired(self):
+        """
+        Removes every expired item, one shard at a time.
+
+        Returns:
+            int: The number of items removed.
+        """
+        removed = 0
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                removed += shard.purge_expired()
+        return removed
+
+    def _policy(self):
+        """
+        Returns the policy of the shards, whose items a snapshot holds.
+        """
+        return type(self.shards[0])
+
+    def _snapshot_records(self):
+        """
+        Yields the records of every shard, holding each shard's lock in
+        turn. The shards' own state, such as ARC ghosts, is not saved.
+        """
+        for index, shard in enumerate(self.shards):
+            with self.locks[index]:
+                self._drain(index)
+                yield from shard._snapshot_records()
+
+    def _restore_record(self, key, item, ttl, data):
+        """
+        Restores an item in the shard of its key, which may differ from
+        the shard it was saved from.
+        """
+        index = self._shard_index(key)
+        with self.locks[index]:
+            return self.shards[index]._restore_record(key, item, ttl, data)
+
+    def print_cache(self):
+        """
+        Prints the cache, holding every shard's lock so it is consistent.
+        """
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            super().print_cache()
+        finally:
+            for lock in self.locks:
+                lock.release()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Window TinyLFU (W-TinyLFU) Caching Module.
+
+This module defines a caching system that decides which items are worth
+keeping from an approximate count of how often every key was requested,
+including keys that are no longer (or never were) in the cache. One-off
+requests, such as a scan over every page of a dataset, are not requested
+again and are not admitted past a small window, so they cannot flush the
+frequently used items the way they flush an LRU or LFU cache.
+"""
+from collections import OrderedDict
+
+from base_caching import BaseCaching, instrumented, synchronized
+
+MASK64 = (1 << 64) - 1
+# Odd multipliers giving each row of the sketch its own hash function
+SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F,
+         0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+# Maps every counter value to half of it, to age the sketch in one pass
+HALVE = bytes(value >> 1 for value in range(256))
+
+
+class CountMinSketch():
+    """
+    CountMinSketch class.
+
+    This class estimates how many times each key was recorded, in a fixed
+    amount of memory. Each key is counted in one counter per row, chosen by
+    the row's hash function, and its estimate is the smallest of them. The
+    estimate is never below the true count, and is rarely far above it when
+    the sketch is wider than the number of keys in use.
+
+    Recording a key only increments the smallest of its counters
+    (conservative update): the others already count other keys too, and
+    leaving them alone keeps the estimates of rare keys close to their
+    true count. Counters saturate at 15. Once `sample_size` keys have been
+    recorded all counters are halved, so the counts follow changes in
+    popularity instead of growing forever.
+    """
+
+    MAX_COUNT = 15
+
+    def __init__(self, width):
+        """
+        Initializes the sketch.
+
+        Args:
+            width (int): Minimum number of counters per row. It is rounded
+            up to a power of two.
+        """
+        self.bits = max(4, (width - 1).bit_length())
+        self.width = 1 << self.bits
+        self.table = bytearray(len(SEEDS) * self.width)
+        self.sample_size = 10 * self.width
+        self.additions = 0
+
+    def _indexes(self, key):
+        """
+        Returns the position of a key's counter in each row.
+        """
+        h = hash(key) & MASK64
+        h ^= h >> 32
+        shift = 64 - self.bits
+        return [row * self.width + (((h * seed) & MASK64) >> shift)
+                for row, seed in enumerate(SEEDS)]
+
+    def increment(self, key):
+        """
+        Records one occurrence of a key.
+        """
+        table = self.table
+        indexes = self._indexes(key)
+        count = min(table[index] for index in indexes)
+        if count < self.MAX_COUNT:
+            for index in indexes:
+                if table[index] == count:
+                    table[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.table = bytearray(table.translate(HALVE))
+            self.additions //= 2
+
+    def estimate(self, key):
+        """
+        Returns the estimated number of occurrences of a key.
+        """
+        table = self.table
+        return min(table[index] for index in self._indexes(key))
+
+
+class TinyLFUCache(BaseCaching):
+    """
+    TinyLFUCache class.
+
+    This class implements the W-TinyLFU eviction policy. New items enter an
+    LRU window holding about 1% of the capacity. Items leaving the window
+    compete for a place in the main region with the item the main region
+    would evict next: the one whose key was requested more often, according
+    to a `CountMinSketch` of recent requests, stays and the other one is
+    discarded.
+
+    The main region is a segmented LRU: items enter its probation segment,
+    move to its protected segment (about 80% of the region) when they are
+    requested again, and fall back to probation when pushed out of the
+    protected segment. Only probation items are evicted, so items that were
+    requested at least twice are protected from a burst of new ones.
+
+    The sketch has `SKETCH_RATIO` counters per row for each item of the
+    capacity, since the keys requested are usually many times more than
+    the keys cached, and a narrower sketch lets one-off keys look as
+    frequent as the main region's victims.
+    """
+
+    WINDOW_RATIO = 0.01
+    PROTECTED_RATIO = 0.8
+    SKETCH_RATIO = 8
+
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None,
+                 ttl=None, clock=None, listener=None, sample_every=None):
+        """
+        Initializes the cache.
+
+        Args:
+            max_items (int): Maximum number of items. Defaults to
+            BaseCaching.MAX_ITEMS.
+            max_bytes (int): Maximum total size of the entries, in bytes.
+            Defaults to no limit.
+            sizeof (callable): Size estimator called as `sizeof(key, item)`.
+            Defaults to `base_caching.shallow_size`.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, for TTLs.
+            Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item the cache removes. Defaults to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
+        """
+        super().__init__(max_items, max_bytes, sizeof, ttl, clock, listener,
+                         sample_every)
+        self.window_size = max(1, int(self.max_items * self.WINDOW_RATIO))
+        main_size = max(self.max_items - self.window_size, 0)
+        self.protected_size = int(main_size * self.PROTECTED_RATIO)
+        self.main_size = main_size
+        # Keys of each segment, from least to most recently used
+        self.window = OrderedDict()
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.sketch = CountMinSketch(self.SKETCH_RATIO
+                                     * max(self.max_items, 1))
+
+    @synchronized
+    @instrumented
+    def put(self, key, item, ttl=None):
+        """
+        Adds an item to the cache.
+
+        A new item enters the window. If that pushes the window's least
+        recently used item out, it is admitted to the main region only if
+        its key is requested more often than the key of the main region's
+        next victim; the loser is discarded. With a `max_bytes` budget,
+        probation, then window, then protected items are discarded, least
+        recently used first, until the entries fit.
+
+        Args:
+            key (str): The key to store the item under.
+            item (any): The value to be associated with the key.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
+
+        Returns:
+            None
+        """
+        if key is None or item is None:
+            return
+
+        # Expired items go first, before any other item is discarded
+        self.purge_expired()
+
+        self.sketch.increment(key)
+        size = 0
+        if self.max_bytes is not None:
+            size = self.sizeof(key, item)
+        if self.max_items < 1 or (self.max_bytes is not None
+                                  and size > self.max_bytes):
+            if key in self.cache_data:
+                self._discard(key, "rejected")
+            return
+        self._set_expiry(key, ttl)
+
+        if key in self.cache_data:
+            self.cache_data[key] = item
+            self._hit(key)
+        else:
+            self.cache_data[key] = item
+            self.window[key] = None
+            if len(self.window) > self.window_size:
+                self._admit(self.window.popitem(last=False)[0])
+
+        if self.max_bytes is not None:
+            self.used_bytes += size - self.item_sizes.get(key, 0)
+            self.item_sizes[key] = size
+            while self.used_bytes > self.max_bytes:
+                self._discard(self._victim(key))
+
+    @synchronized
+    @instrumented
+    def get(self, key):
+        """
+        Retrieves an item from the cache by its key.
+
+        Every request is recorded in the frequency sketch, found or not. A
+        found item becomes the most recently used of its segment, and a
+        probation item is promoted to the protected segment.
+
+        Args:
+            key (str): The key of the item to retrieve.
+
+        Returns:
+            any: The value associated with the key, or None if the key is not
+            found.
+        """
+        if key is None:
+            return None
+
+        self.sketch.increment(key)
+        if key not in self.cache_data or self._expired(key):
+            return None
+        self._hit(key)
+        return self.cache_data[key]
+
+    def _hit(self, key):
+        """
+        Updates the segments after a request for a cached key.
+        """
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.protected:
+            self.protected.move_to_end(key)
+        else:
+            del self.probation[key]
+            self.protected[key] = None
+            if len(self.protected) > self.protected_size:
+                demoted, _ = self.protected.popitem(last=False)
+                self.probation[demoted] = None
+
+    def _admit(self, candidate):
+        """
+        Moves a key out of the window into the main region, if it wins its
+        place against the main region's next victim.
+        """
+        if len(self.probation) + len(self.protected) < self.main_size:
+            self.probation[candidate] = None
+            return
+        if not self.probation:
+            # There is no main region at all in a one-item cache
+            self._discard(candidate)
+            return
+
+        victim = next(iter(self.probation))
+        if self.sketch.estimate(candidate) > self.sketch.estimate(victim):
+            self._discard(victim)
+            self.probation[candidate] = None
+        else:
+            self._discard(candidate)
+
+    def _make_room_many(self, items):
+        """
+        Makes no room ahead of a batch of items: each of them must win its
+        own place in the main region, so `put` decides what to discard.
+        """
+
+    def _victim(self, key):
+        """
+        Returns the next key to discard to meet the byte budget, other
+        than `key`.
+        """
+        for segment in (self.probation, self.window, self.protected):
+            for candidate in segment:
+                if candidate != key:
+                    return candidate
+        return None
+
+    def _snapshot_entries(self):
+        """
+        Yields the items with their segment and estimated frequency: the
+        protected segment first, then probation, then the window, each
+        from its most recently used item.
+        """
+        for name in ("protected", "probation", "window"):
+            for key in reversed(getattr(self, name)):
+                yield (key, self.cache_data[key],
+                       (name, self.sketch.estimate(key)))
+
+    def _restore_entry(self, key, item, data):
+        """
+        Stores an item from a snapshot as the least recently used of its
+        segment. The sketch is not saved, since keys hash differently in
+        another process: the item's estimated frequency is counted again.
+        """
+        name, estimate = data
+        segment = getattr(self, name)
+        self.cache_data[key] = item
+        segment[key] = None
+        segment.move_to_end(key, last=False)
+        for _ in range(estimate):
+            self.sketch.increment(key)
+
+    def _restore_state(self, state):
+        """
+        Moves the least recently used restored items to probation when
+        the window or the protected segment is smaller than in the
+        snapshot.
+        """
+        while len(self.protected) > self.protected_size:
+            demoted, _ = self.protected.popitem(last=False)
+            self.probation[demoted] = None
+        while len(self.window) > self.window_size:
+            moved, _ = self.window.popitem(last=False)
+            self.probation[moved] = None
+
+    def _remove(self, key):
+        """
+        Removes a key from the cache and from its segment, if it is still
+        in one.
+        """
+        super()._remove(key)
+        for segment in (self.window, self.probation, self.protected):
+            if key in segment:
+                del segment[key]
+                return
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Adaptive Replacement Cache (ARC) Module.
+
+This module defines a caching system that balances recency against
+frequency on its own. It keeps the items requested once apart from the
+items requested more than once, and remembers the keys it recently
+discarded from each group: a request for a remembered key shows which of
+the two groups was given too little room, and moves the split between them
+accordingly.
+"""
+from collections import OrderedDict
+
+from base_caching import BaseCaching, instrumented, synchronized
+
+
+class ARCCache(BaseCaching):
+    """
+    ARCCache class.
+
+    This class implements the ARC eviction policy of Megiddo and Modha.
+    Items live in one of two LRU lists, from least to most recently used:
+      - recent: items requested once since they were added
+      - frequent: items requested again while in the cache
+    Keys discarded from each list are kept, without their items, in a ghost
+    list of the same kind, so the cache tracks up to twice `max_items` keys.
+
+    Adding a key found in `recent_ghosts` raises `target`, the number of
+    items the recent list aims to hold, and adding one found in
+    `frequent_ghosts` lowers it. Victims are taken from the recent list
+    while it is larger than `target`, and from the frequent list otherwise.
+    `target`, `recent_ghost_hits` and `frequent_ghost_hits` show how the
+    cache is adapting. Every operation runs in constant time.
+    """
+
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None,
+                 ttl=None, clock=None, listener=None, sample_every=None):
+        """
+        Initializes the cache.
+
+        Args:
+            max_items (int): Maximum number of items. Defaults to
+            BaseCaching.MAX_ITEMS.
+            max_bytes (int): Maximum total size of the entries, in bytes.
+            Defaults to no limit.
+            sizeof (callable): Size estimator called as `sizeof(key, item)`.
+            Defaults to `base_caching.shallow_size`.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, for TTLs.
+            Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item the cache removes. Defaults to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
+        """
+        super().__init__(max_items, max_bytes, sizeof, ttl, clock, listener,
+                         sample_every)
+        self.recent = OrderedDict()
+        self.frequent = OrderedDict()
+        self.recent_ghosts = OrderedDict()
+        self.frequent_ghosts = OrderedDict()
+        # Target size of the recent list
+        self.target = 0
+        self.recent_ghost_hits = 0
+        self.frequent_ghost_hits = 0
+
+    @synchronized
+    @instrumented
+    def put(self, key, item, ttl=None):
+        """
+        Adds an item to the cache.
+
+        A key that is new, or whose ghost is in `recent_ghosts` or
+        `frequent_ghosts`, makes room for itself by discarding the least
+        recently used item of the recent or the frequent list. A new key
+        enters the recent list; the others enter the frequent list. With a
+        `max_bytes` budget, items are discarded the same way until the
+        entries fit.
+
+        Args:
+            key (str): The key to store the item under.
+            item (any): The value to be associated with the key.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
+
+        Returns:
+            None
+        """
+        if key is None or item is None:
+            return
+
+        # Expired items go first, before any other item is discarded
+        self.purge_expired()
+
+        size = 0
+        if self.max_bytes is not None:
+            size = self.sizeof(key, item)
+        if self.max_items < 1 or (self.max_bytes is not None
+                                  and size > self.max_bytes):
+            if key in self.cache_data:
+                self._discard(key, "rejected")
+            return
+        self._set_expiry(key, ttl)
+
+        capacity = self.max_items
+        if key in self.cache_data:
+            self._hit(key)
+        elif key in self.recent_ghosts:
+            # The recent list was too small to keep this key
+            self.recent_ghost_hits += 1
+            step = max(len(self.frequent_ghosts) / len(self.recent_ghosts), 1)
+            self.target = min(self.target + step, capacity)
+            del self.recent_ghosts[key]
+            self._replace(False)
+            self.frequent[key] = None
+        elif key in self.frequent_ghosts:
+            # The frequent list was too small to keep this key
+            self.frequent_ghost_hits += 1
+            step = max(len(self.recent_ghosts) / len(self.frequent_ghosts), 1)
+            self.target = max(self.target - step, 0)
+            del self.frequent_ghosts[key]
+            self._replace(True)
+            self.frequent[key] = None
+        else:
+            if len(self.recent) + len(self.recent_ghosts) >= capacity:
+                if len(self.recent) < capacity:
+                    self.recent_ghosts.popitem(last=False)
+                    self._replace(False)
+                else:
+                    # Every key of the recent side is cached: forget one
+                    victim = next(iter(self.recent))
+                    self._discard(victim)
+                    self.recent_ghosts.pop(victim, None)
+            else:
+                if (len(self.cache_data) + len(self.recent_ghosts)
+                        + len(self.frequent_ghosts) >= 2 * capacity):
+                    self.frequent_ghosts.popitem(last=False)
+                self._replace(False)
+            self.recent[key] = None
+        self.cache_data[key] = item
+
+        if self.max_bytes is not None:
+            self.used_bytes += size - self.item_sizes.get(key, 0)
+            self.item_sizes[key] = size
+            while self.used_bytes > self.max_bytes:
+                self._discard(self._victim(key))
+
+    @synchronized
+    @instrumented
+    def get(self, key):
+        """
+        Retrieves an item from the cache by its key.
+
+        A found item becomes the most recently used item of the frequent
+        list.
+
+        Args:
+            key (str): The key of the item to retrieve.
+
+        Returns:
+            any: The value associated with the key, or None if the key is not
+            found.
+        """
+        if (key is None or key not in self.cache_data
+                or self._expired(key)):
+            return None
+
+        self._hit(key)
+        return self.cache_data[key]
+
+    def _hit(self, key):
+        """
+        Moves a cached key to the most recently used end of the frequent
+        list.
+        """
+        if key in self.recent:
+            del self.recent[key]
+            self.frequent[key] = None
+        else:
+            self.frequent.move_to_end(key)
+
+    def _replace(self, frequent_ghost):
+        """
+        Discards one item if the cache is full.
+
+        Args:
+            frequent_ghost (bool): Whether the key being added was found
+            in `frequent_ghosts`, which breaks the tie when the recent list
+            is exactly at its target size.
+        """
+        if len(self.cache_data) < self.max_items:
+            return
+        recent = len(self.recent)
+        if recent and (recent > self.target or not self.frequent
+                       or (frequent_ghost and recent == self.target)):
+            self._discard(next(iter(self.recent)))
+        else:
+            self._discard(next(iter(self.frequent)))
+
+    def _make_room_many(self, items):
+        """
+        Makes no room ahead of a batch of items: `put` chooses each victim
+        from the keys' ghosts and adapts `target` as it goes.
+        """
+
+    def _victim(self, key):
+        """
+        Returns the next key to discard to meet the byte budget, other
+        than `key`.
+        """
+        lists = (self.recent, self.frequent)
+        if len(self.recent) <= self.target:
+            lists = (self.frequent, self.recent)
+        for keys in lists:
+            for candidate in keys:
+                if candidate != key:
+                    return candidate
+        return None
+
+    def _snapshot_state(self):
+        """
+        Returns the target size of the recent list, the ghost hit counts
+        and the ghost lists.
+        """
+        return {
+            "target": self.target,
+            "recent_ghost_hits": self.recent_ghost_hits,
+            "frequent_ghost_hits": self.frequent_ghost_hits,
+            "recent_ghosts": list(self.recent_ghosts),
+            "frequent_ghosts": list(self.frequent_ghosts),
+        }
+
+    def _restore_state(self, state):
+        """
+        Restores the state from a snapshot, keeping only the most recent
+        ghosts that fit next to the restored items.
+        """
+        capacity = self.max_items
+        self.target = min(state["target"], capacity)
+        self.recent_ghost_hits = state["recent_ghost_hits"]
+        self.frequent_ghost_hits = state["frequent_ghost_hits"]
+        recent = [key for key in state["recent_ghosts"]
+                  if key not in self.cache_data]
+        room = max(capacity - len(self.recent), 0)
+        self.recent_ghosts = OrderedDict.fromkeys(recent[-room:] if room
+                                                  else [])
+        frequent = [key for key in state["frequent_ghosts"]
+                    if key not in self.cache_data]
+        room = max(2 * capacity - len(self.cache_data)
+                   - len(self.recent_ghosts), 0)
+        self.frequent_ghosts = OrderedDict.fromkeys(frequent[-room:] if room
+                                                    else [])
+
+    def _snapshot_entries(self):
+        """
+        Yields the items with the list holding them: the frequent list
+        first, then the recent list, each from its most recently used item.
+        """
+        for name in ("frequent", "recent"):
+            for key in reversed(getattr(self, name)):
+                yield key, self.cache_data[key], name
+
+    def _restore_entry(self, key, item, name):
+        """
+        Stores an item from a snapshot as the least recently used of its
+        list.
+        """
+        keys = getattr(self, name)
+        self.cache_data[key] = item
+        keys[key] = None
+        keys.move_to_end(key, last=False)
+
+    def _expire(self, key):
+        """
+        Removes an expired item without leaving a ghost, since it was not
+        discarded for lack of room.
+        """
+        super()._expire(key)
+        self.recent_ghosts.pop(key, None)
+        self.frequent_ghosts.pop(key, None)
+
+    def _remove(self, key):
+        """
+        Removes a key from the cache, leaving its ghost in the matching
+        ghost list.
+        """
+        super()._remove(key)
+        if key in self.recent:
+            del self.recent[key]
+            self.recent_ghosts[key] = None
+        else:
+            del self.frequent[key]
+            self.frequent_ghosts[key] = None
+
+        # Keep at most max_items recent and 2 * max_items keys in total
+        capacity = self.max_items
+        while (self.recent_ghosts
+               and len(self.recent) + len(self.recent_ghosts) > capacity):
+            self.recent_ghosts.popitem(last=False)
+        while (self.frequent_ghosts
+               and len(self.cache_data) + len(self.recent_ghosts)
+               + len(self.frequent_ghosts) > 2 * capacity):
+            self.frequent_ghosts.popitem(last=False)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Two Queue (2Q) Caching Module.
+
+This module defines a caching system that keeps new items in a FIFO queue
+and only moves them to an LRU list once they prove to be requested again,
+after they left the queue. The split between the queue and the LRU list
+tunes itself from the requests for recently discarded keys.
+"""
+from collections import OrderedDict
+
+from base_caching import BaseCaching, instrumented, synchronized
+
+
+class TwoQueueCache(BaseCaching):
+    """
+    TwoQueueCache class.
+
+    This class implements the full 2Q eviction policy of Johnson and
+    Shasha, with an adaptive queue size. Items live in one of two places:
+      - recent: a FIFO queue of items added once (A1in)
+      - frequent: an LRU list of items requested after leaving the queue
+        (Am)
+    Keys discarded from each are kept, without their items, in a FIFO ghost
+    queue of at most half of `max_items` keys (A1out for the recent queue).
+    A new key enters the recent queue, and a key found in a ghost queue
+    enters the frequent list. Requests for an item in the recent queue do
+    not promote it, so a burst of requests for a new key is not mistaken
+    for lasting popularity.
+
+    `target` is the size the recent queue may grow to before its oldest
+    item, rather than the frequent list's least recently used one, is
+    discarded. Adding a key found in `recent_ghosts` raises it, and adding
+    one found in `frequent_ghosts` lowers it, as in ARC. `target`,
+    `recent_ghost_hits` and `frequent_ghost_hits` show how the cache is
+    adapting. Every operation runs in constant time.
+    """
+
+    RECENT_RATIO = 0.25
+    GHOST_RATIO = 0.5
+
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None,
+                 ttl=None, clock=None, listener=None, sample_every=None):
+        """
+        Initializes the cache.
+
+        Args:
+            max_items (int): Maximum number of items. Defaults to
+            BaseCaching.MAX_ITEMS.
+            max_bytes (int): Maximum total size of the entries, in bytes.
+            Defaults to no limit.
+            sizeof (callable): Size estimator called as `sizeof(key, item)`.
+            Defaults to `base_caching.shallow_size`.
+            ttl (float): Seconds items stay valid unless `put` is given
+            another TTL. Defaults to forever.
+            clock (callable): Returns the current time in seconds, for TTLs.
+            Defaults to `time.monotonic`.
+            listener (callable): Called as `listener(key, item, reason)` for
+            every item the cache removes. Defaults to none.
+            sample_every (int): Time one `get` or `put` in this many.
+            Defaults to timing none.
+        """
+        super().__init__(max_items, max_bytes, sizeof, ttl, clock, listener,
+                         sample_every)
+        self.recent = OrderedDict()
+        self.frequent = OrderedDict()
+        self.recent_ghosts = OrderedDict()
+        self.frequent_ghosts = OrderedDict()
+        self.ghost_size = max(1, int(self.max_items * self.GHOST_RATIO))
+        # Size of the recent queue beyond which it gives up items first
+        self.target = max(1, int(self.max_items * self.RECENT_RATIO))
+        self.recent_ghost_hits = 0
+        self.frequent_ghost_hits = 0
+
+    @synchronized
+    @instrumented
+    def put(self, key, item, ttl=None):
+        """
+        Adds an item to the cache.
+
+        A key that is not cached makes room for itself by discarding the
+        oldest item of the recent queue if it is larger than `target`, or
+        the least recently used item of the frequent list otherwise. With a
+        `max_bytes` budget, items are discarded the same way until the
+        entries fit.
+
+        Args:
+            key (str): The key to store the item under.
+            item (any): The value to be associated with the key.
+            ttl (float): Seconds the item stays valid. Defaults to the
+            cache's default TTL.
+
+        Returns:
+            None
+        """
+        if key is None or item is None:
+            return
+
+        # Expired items go first, before any other item is discarded
+        self.purge_expired()
+
+        size = 0
+        if self.max_bytes is not None:
+            size = self.sizeof(key, item)
+        if self.max_items < 1 or (self.max_bytes is not None
+                                  and size > self.max_bytes):
+            if key in self.cache_data:
+                self._discard(key, "rejected")
+            return
+        self._set_expiry(key, ttl)
+
+        limit = max(self.max_items - 1, 1)
+        if key in self.cache_data:
+            self._hit(key)
+        elif key in self.recent_ghosts:
+            # The recent queue was too small to keep this key
+            self.recent_ghost_hits += 1
+            step = max(len(self.frequent_ghosts) / len(self.recent_ghosts), 1)
+            self.target = min(self.target + step, limit)
+            del self.recent_ghosts[key]
+            self._reclaim(key)
+            self.frequent[key] = None
+        elif key in self.frequent_ghosts:
+            # The frequent list was too small to keep this key
+            self.frequent_ghost_hits += 1
+            step = max(len(self.recent_ghosts) / len(self.frequent_ghosts), 1)
+            self.target = max(self.target - step, 1)
+            del self.frequent_ghosts[key]
+            self._reclaim(key)
+            self.frequent[key] = None
+        else:
+            self._reclaim(key)
+            self.recent[key] = None
+        self.cache_data[key] = item
+
+        if self.max_bytes is not None:
+            self.used_bytes += size - self.item_sizes.get(key, 0)
+            self.item_sizes[key] = size
+            while self.used_bytes > self.max_bytes:
+                self._discard(self._victim(key))
+
+    @synchronized
+    @instrumented
+    def get(self, key):
+        """
+        Retrieves an item from the cache by its key.
+
+        A found item of the frequent list becomes its most recently used
+        item; items of the recent queue keep their place.
+
+        Args:
+            key (str): The key of the item to retrieve.
+
+        Returns:
+            any: The value associated with the key, or None if the key is not
+            found.
+        """
+        if (key is None or key not in self.cache_data
+                or self._expired(key)):
+            return None
+
+        self._hit(key)
+        return self.cache_data[key]
+
+    def _hit(self, key):
+        """
+        Updates the lists after a request for a cached key.
+        """
+        if key in self.frequent:
+            self.frequent.move_to_end(key)
+
+    def _reclaim(self, key):
+        """
+        Discards one item if the cache is full.
+        """
+        if len(self.cache_data) >= self.max_items:
+            self._discard(self._victim(key))
+
+    def _make_room_many(self, items):
+        """
+        Makes no room ahead of a batch of items: `put` chooses each victim
+        from the keys' ghosts and adapts `target` as it goes.
+        """
+
+    def _victim(self, key):
+        """
+        Returns the next key to discard, other than `key`.
+        """
+        lists = (self.frequent, self.recent)
+        if len(self.recent) > self.target or not self.frequent:
+            lists = (self.recent, self.frequent)
+        for keys in lists:
+            for candidate in keys:
+                if candidate != key:
+                    return candidate
+        return None
+
+    def _snapshot_state(self):
+        """
+        Returns the target size of the recent queue, the ghost hit counts
+        and the ghost queues.
+        """
+        return {
+            "target": self.target,
+            "recent_ghost_hits": self.recent_ghost_hits,
+            "frequent_ghost_hits": self.frequent_ghost_hits,
+            "recent_ghosts": list(self.recent_ghosts),
+            "frequent_ghosts": list(self.frequent_ghosts),
+        }
+
+    def _restore_state(self, state):
+        """
+        Restores the state from a snapshot, keeping only the most recent
+        `ghost_size` keys of each ghost queue.
+        """
+        self.target = min(max(state["target"], 1),
+                          max(self.max_items - 1, 1))
+        self.recent_ghost_hits = state["recent_ghost_hits"]
+        self.frequent_ghost_hits = state["frequent_ghost_hits"]
+        for name in ("recent_ghosts", "frequent_ghosts"):
+            keys = [key for key in state[name] if key not in self.cache_data]
+            setattr(self, name,
+                    OrderedDict.fromkeys(keys[-self.ghost_size:]))
+
+    def _snapshot_entries(self):
+        """
+        Yields the items with the list holding them: the frequent list
+        first, then the recent queue, each from its newest item.
+        """
+        for name in ("frequent", "recent"):
+            for key in reversed(getattr(self, name)):
+                yield key, self.cache_data[key], name
+
+    def _restore_entry(self, key, item, name):
+        """
+        Stores an item from a snapshot as the oldest of its list.
+        """
+        keys = getattr(self, name)
+        self.cache_data[key] = item
+        keys[key] = None
+        keys.move_to_end(key, last=False)
+
+    def _expire(self, key):
+        """
+        Removes an expired item without leaving a ghost, since it was not
+        discarded for lack of room.
+        """
+        super()._expire(key)
+        self.recent_ghosts.pop(key, None)
+        self.frequent_ghosts.pop(key, None)
+
+    def _remove(self, key):
+        """
+        Removes a key from the cache, leaving its ghost in the matching
+        ghost queue.
+        """
+        super()._remove(key)
+        if key in self.recent:
+            del self.recent[key]
+            ghosts = self.recent_ghosts
+        else:
+            del self.frequent[key]
+            ghosts = self.frequent_ghosts
+        ghosts[key] = None
+        if len(ghosts) > self.ghost_size:
+            ghosts.popitem(last=False)
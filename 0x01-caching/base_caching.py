@@ -1,19 +1,268 @@
 #!/usr/bin/python3
 """ BaseCaching module
 """
+import heapq
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from functools import wraps
+from inspect import unwrap
+from itertools import count
+
+# Start of every snapshot file, followed by the format version
+SNAPSHOT_MAGIC = b"ALXCACHE"
+SNAPSHOT_VERSION = 1
+# Number of items pickled together in a snapshot
+SNAPSHOT_CHUNK = 1024
+
+
+def shallow_size(key, item):
+    """ Estimate the size of an entry, in bytes, as the size of its key
+        and item objects, not counting the objects they refer to
+    """
+    return sys.getsizeof(key) + sys.getsizeof(item)
+
+
+def deep_size(key, item):
+    """ Estimate the size of an entry, in bytes, following the contents
+        of containers (dict, list, tuple, set, frozenset) and the
+        attributes of objects, and counting shared objects once
+    """
+    seen = set()
+    pending = [key, item]
+    total = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            pending.append(vars(obj))
+    return total
+
+
+def synchronized(method):
+    """ Make a cache method hold the cache's lock, so it does not run
+        while the expiry reaper (or another thread) changes the cache
+    """
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        """ Call the method holding the lock
+        """
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def instrumented(method):
+    """ Make a cache's `get` or `put` count its outcome in `self.stats`,
+        and time it when latencies are sampled
+    """
+    reading = method.__name__ == "get"
+
+    @wraps(method)
+    def recorded(self, key, *args, **kwargs):
+        """ Call the method and record what it did
+        """
+        stats = self.stats
+        timed = stats.sampled()
+        if timed:
+            start = time.perf_counter_ns()
+        if reading:
+            result = method(self, key, *args, **kwargs)
+            if result is None:
+                stats.misses += 1
+            else:
+                stats.hits += 1
+        else:
+            new = key not in self.cache_data
+            result = method(self, key, *args, **kwargs)
+            if key in self.cache_data:
+                if new:
+                    stats.insertions += 1
+                else:
+                    stats.updates += 1
+        if timed:
+            elapsed = time.perf_counter_ns() - start
+            if reading:
+                stats.get_latency.record(elapsed)
+            else:
+                stats.put_latency.record(elapsed)
+        return result
+    return recorded
+
+
+def print_discard(key, item, reason):
+    """ Eviction listener printing the discarded keys, as the caches used
+        to do themselves
+    """
+    print("DISCARD:", key)
+
+
+class LatencyHistogram():
+    """ LatencyHistogram counts durations in power-of-two buckets of
+        nanoseconds, so recording one is cheap and the memory is fixed
+    """
+    BUCKETS = 64
+
+    def __init__(self):
+        """ Initiliaze
+        """
+        self.buckets = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0
+
+    def record(self, nanoseconds):
+        """ Count one duration
+        """
+        self.buckets[min(nanoseconds.bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += nanoseconds
+
+    def percentile(self, percent):
+        """ Return an upper bound of the given percentile, in nanoseconds
+        """
+        if not self.count:
+            return 0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, number in enumerate(self.buckets):
+            seen += number
+            if seen >= rank and number:
+                return 1 << index
+        return 1 << (self.BUCKETS - 1)
+
+    def snapshot(self):
+        """ Return the histogram as a dictionary
+        """
+        buckets = list(self.buckets)
+        count = sum(buckets)
+        return {
+            "count": count,
+            "mean_ns": self.total / count if count else 0,
+            "p50_ns": self.percentile(50),
+            "p99_ns": self.percentile(99),
+            # Number of durations up to each power of two nanoseconds
+            "buckets": {1 << index: number
+                        for index, number in enumerate(buckets) if number},
+        }
+
+
+class CacheStats():
+    """ CacheStats holds the counters of a cache:
+      - hits and misses of `get`
+      - insertions of new keys and updates of cached keys by `put`
+      - removed items by reason: "evicted" to make room, "expired", or
+        "rejected" when a new item too large for the cache replaced them
+      - optionally, latencies of one `get` or `put` in `sample_every`
+    """
+
+    def __init__(self, sample_every=None):
+        """ Initiliaze
+
+            Args:
+                sample_every (int): Time one operation in this many.
+                Defaults to timing none.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.insertions = 0
+        self.updates = 0
+        self.evictions = {}
+        self.sample_every = sample_every
+        self.operations = 0
+        self.get_latency = LatencyHistogram()
+        self.put_latency = LatencyHistogram()
+
+    def sampled(self):
+        """ Tell whether the next operation should be timed
+        """
+        if not self.sample_every:
+            return False
+        self.operations += 1
+        return self.operations % self.sample_every == 0
+
+    def snapshot(self):
+        """ Return the counters as a dictionary
+
+            The counters are read without locking, so a snapshot taken
+            while the cache is used may be off by the operations in flight.
+        """
+        hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        snapshot = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "insertions": self.insertions,
+            "updates": self.updates,
+            "evictions": dict(self.evictions),
+        }
+        if self.sample_every:
+            snapshot["get_latency"] = self.get_latency.snapshot()
+            snapshot["put_latency"] = self.put_latency.snapshot()
+        return snapshot
 
 
 class BaseCaching():
     """ BaseCaching defines:
       - constants of your caching system
       - where your data are stored (in a dictionary)
+      - how many items, and optionally how many bytes, a cache may hold
+      - how long items stay valid, if they expire
+      - what it did, in `stats`, and who is told of removed items
     """
     MAX_ITEMS = 4
 
-    def __init__(self):
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None,
+                 ttl=None, clock=None, listener=None, sample_every=None):
         """ Initiliaze
+
+            Args:
+                max_items (int): Maximum number of items. Defaults to
+                MAX_ITEMS.
+                max_bytes (int): Maximum total size of the entries, as
+                estimated by `sizeof`. Defaults to no limit.
+                sizeof (callable): Size estimator called as
+                `sizeof(key, item)`. Defaults to `shallow_size`.
+                ttl (float): Seconds an item stays valid after it is put,
+                unless `put` is given another TTL. Defaults to forever.
+                clock (callable): Returns the current time in seconds.
+                Defaults to `time.monotonic`.
+                listener (callable): Called as `listener(key, item, reason)`
+                for every item removed by the cache itself, e.g.
+                `print_discard`. Defaults to telling no one.
+                sample_every (int): Time one `get` or `put` in this many,
+                see `CacheStats`. Defaults to timing none.
         """
         self.cache_data = {}
+        self.max_items = self.MAX_ITEMS if max_items is None else max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or shallow_size
+        self.item_sizes = {}
+        self.used_bytes = 0
+        self.ttl = ttl
+        self.clock = clock or time.monotonic
+        # Deadline of each expiring key, and a heap of (deadline, order,
+        # key) that may still hold outdated deadlines
+        self.expiries = {}
+        self.expiry_heap = []
+        self.expiry_order = count()
+        self.lock = threading.RLock()
+        self.reaper = None
+        self.listener = listener
+        self.stats = CacheStats(sample_every)
 
     def print_cache(self):
         """ Print the cache
@@ -33,3 +282,408 @@ class BaseCaching():
         """
         raise NotImplementedError("get must be implemented in your cache\
                 class")
+
+    def statistics(self):
+        """ Return a snapshot of `stats` with the current number of items
+            and bytes, without waiting for the lock
+
+            Returns:
+                dict: See `CacheStats.snapshot`, plus "size" and "bytes".
+        """
+        snapshot = self.stats.snapshot()
+        snapshot["size"] = len(self.cache_data)
+        snapshot["bytes"] = self.used_bytes
+        return snapshot
+
+    @synchronized
+    def get_many(self, keys):
+        """ Get the items of several keys at once
+
+            Each key is looked up as by `get`, but the lock is taken and
+            `stats` updated once for the whole batch.
+
+            Args:
+                keys (iterable): The keys to look up.
+
+            Returns:
+                dict: The items found, by key. Missing and expired keys are
+                left out.
+        """
+        get = unwrap(type(self).get)
+        found = {}
+        hits = misses = 0
+        for key in keys:
+            item = get(self, key)
+            if item is None:
+                misses += 1
+            else:
+                hits += 1
+                found[key] = item
+        self.stats.hits += hits
+        self.stats.misses += misses
+        return found
+
+    @synchronized
+    def put_many(self, mapping, ttl=None):
+        """ Add several items at once
+
+            Each item is stored as by `put`, but the lock is taken, expired
+            items purged and `stats` updated once for the whole batch, and
+            room is made for all the new keys in a single pass before any
+            item is stored (see `_make_room_many`).
+
+            Args:
+                mapping (dict): The items to add, by key. Pairs with a None
+                key or item are skipped.
+                ttl (float): Seconds the items stay valid. Defaults to the
+                cache's default TTL.
+        """
+        items = [(key, item) for key, item in dict(mapping).items()
+                 if key is not None and item is not None]
+        self.purge_expired()
+        self._make_room_many(items)
+        put = unwrap(type(self).put)
+        insertions = updates = 0
+        for key, item in items:
+            new = key not in self.cache_data
+            put(self, key, item, ttl)
+            if key in self.cache_data:
+                if new:
+                    insertions += 1
+                else:
+                    updates += 1
+        self.stats.insertions += insertions
+        self.stats.updates += updates
+
+    @synchronized
+    def snapshot(self, path):
+        """ Save the items and the policy's state to a file, for `restore`
+            to warm up a cache in another process
+
+            The file holds SNAPSHOT_MAGIC, the format version as a 2-byte
+            big-endian integer, then pickles: a header with the policy and
+            its state, chunks of up to SNAPSHOT_CHUNK items with their
+            remaining TTLs and policy data (recency order, frequencies),
+            and None. Chunks are written as the items are read, so a large
+            cache is never copied in memory. The file is written next to
+            `path` and renamed over it once complete, so a crash never
+            leaves a partial snapshot behind. Expired items are left out.
+
+            Args:
+                path (str): The file to write.
+
+            Returns:
+                int: The number of items saved.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temporary = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(SNAPSHOT_MAGIC)
+                file.write(struct.pack(">H", SNAPSHOT_VERSION))
+                pickler = pickle.Pickler(file, pickle.HIGHEST_PROTOCOL)
+                pickler.dump({"policy": self._policy().__name__,
+                              "state": self._snapshot_state()})
+                saved = 0
+                chunk = []
+                for record in self._snapshot_records():
+                    chunk.append(record)
+                    if len(chunk) == SNAPSHOT_CHUNK:
+                        saved += len(chunk)
+                        pickler.dump(chunk)
+                        # Forget the objects pickled so far
+                        pickler.clear_memo()
+                        chunk = []
+                if chunk:
+                    saved += len(chunk)
+                    pickler.dump(chunk)
+                pickler.dump(None)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return saved
+
+    @synchronized
+    def restore(self, path):
+        """ Load a file written by `snapshot` into this cache, which must
+            be empty
+
+            Items are loaded in the order they were saved, most valuable
+            first for the policies that rank them, while they fit within
+            `max_items` and `max_bytes`. Their TTLs resume with the time
+            they had left. The file is unpickled: only restore snapshots
+            from a trusted source.
+
+            Args:
+                path (str): The file to read.
+
+            Returns:
+                int: The number of items restored.
+
+            Raises:
+                ValueError: If the cache is not empty, or the file is not a
+                snapshot of this format version and policy.
+        """
+        if self.cache_data:
+            raise ValueError("restore needs an empty cache")
+        policy = self._policy()
+        with open(path, "rb") as file:
+            prefix = file.read(len(SNAPSHOT_MAGIC) + 2)
+            if prefix[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError("{} is not a cache snapshot".format(path))
+            version, = struct.unpack(">H", prefix[len(SNAPSHOT_MAGIC):])
+            if version != SNAPSHOT_VERSION:
+                raise ValueError("unsupported snapshot version {}"
+                                 .format(version))
+            unpickler = pickle.Unpickler(file)
+            header = unpickler.load()
+            if header["policy"] not in {cls.__name__ for cls in policy.mro()}:
+                raise ValueError("snapshot of a {} cannot be restored in a {}"
+                                 .format(header["policy"], policy.__name__))
+            restored = 0
+            chunk = unpickler.load()
+            while chunk is not None:
+                for key, item, ttl, data in chunk:
+                    restored += self._restore_record(key, item, ttl, data)
+                chunk = unpickler.load()
+        self._restore_state(header["state"])
+        return restored
+
+    def purge_expired(self):
+        """ Remove every expired item
+
+            Items are found from a heap of deadlines, so each removal
+            costs O(log n) and nothing is scanned when no item expired.
+
+            Returns:
+                int: The number of items removed.
+        """
+        heap = self.expiry_heap
+        if not heap or heap[0][0] > self.clock():
+            return 0
+        with self.lock:
+            now = self.clock()
+            removed = 0
+            while heap and heap[0][0] <= now:
+                deadline, _, key = heapq.heappop(heap)
+                if self.expiries.get(key) == deadline:
+                    self._expire(key)
+                    removed += 1
+            return removed
+
+    def start_reaper(self, interval=1.0):
+        """ Start a daemon thread calling `purge_expired` every `interval`
+            seconds, so expired items are removed even when the cache is
+            not used. The thread stops by itself once the cache is garbage
+            collected.
+        """
+        if self.reaper is not None:
+            return
+        stop = threading.Event()
+        cache_ref = weakref.ref(self)
+
+        def reap():
+            """ Purge the cache until stopped or collected
+            """
+            while not stop.wait(interval):
+                cache = cache_ref()
+                if cache is None:
+                    return
+                cache.purge_expired()
+                del cache
+
+        thread = threading.Thread(target=reap, name="cache-reaper",
+                                  daemon=True)
+        self.reaper = (thread, stop)
+        thread.start()
+
+    def stop_reaper(self):
+        """ Stop the thread started by `start_reaper`
+        """
+        if self.reaper is not None:
+            thread, stop = self.reaper
+            self.reaper = None
+            stop.set()
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _set_expiry(self, key, ttl=None):
+        """ Set the deadline of a key that was just put, from `ttl` or the
+            default TTL
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            self.expiries.pop(key, None)
+            return
+        deadline = self.clock() + ttl
+        self.expiries[key] = deadline
+        heap = self.expiry_heap
+        heapq.heappush(heap, (deadline, next(self.expiry_order), key))
+        # Drop outdated deadlines once they make up most of the heap
+        if len(heap) > 2 * len(self.expiries) + 64:
+            heap[:] = [(deadline, next(self.expiry_order), key)
+                       for key, deadline in self.expiries.items()]
+            heapq.heapify(heap)
+
+    def _policy(self):
+        """ Return the class whose items and state `snapshot` saves
+        """
+        return type(self)
+
+    def _snapshot_state(self):
+        """ Return the policy's state besides its items, for `snapshot`
+        """
+        return {}
+
+    def _restore_state(self, state):
+        """ Apply a state from `_snapshot_state`, once the items are
+            restored
+        """
+
+    def _snapshot_entries(self):
+        """ Yield (key, item, data) for every item, in the order
+            `_restore_entry` must see them, with any data the policy keeps
+            about the key
+        """
+        cache_data = self.cache_data
+        for key in cache_data:
+            yield key, cache_data[key], None
+
+    def _restore_entry(self, key, item, data):
+        """ Store an item read by `restore`, after the ones read before it
+        """
+        self.cache_data[key] = item
+
+    def _snapshot_records(self):
+        """ Yield (key, item, ttl, data) for every unexpired item, where
+            `ttl` is the time it has left, or None
+        """
+        now = self.clock()
+        expiries = self.expiries
+        for key, item, data in self._snapshot_entries():
+            deadline = expiries.get(key)
+            if deadline is None:
+                yield key, item, None, data
+            elif deadline > now:
+                yield key, item, deadline - now, data
+
+    def _restore_record(self, key, item, ttl, data):
+        """ Restore an item from `_snapshot_records` if it fits
+
+            Returns:
+                bool: Whether the item was restored.
+        """
+        if len(self.cache_data) >= self.max_items:
+            return False
+        if self.max_bytes is not None:
+            size = self.sizeof(key, item)
+            if self.used_bytes + size > self.max_bytes:
+                return False
+            self.item_sizes[key] = size
+            self.used_bytes += size
+        self._restore_entry(key, item, data)
+        if ttl is not None:
+            self._set_expiry(key, ttl)
+        return True
+
+    def _expired(self, key):
+        """ Tell whether a cached key has expired, removing it if so
+        """
+        deadline = self.expiries.get(key)
+        if deadline is None or deadline > self.clock():
+            return False
+        self._expire(key)
+        return True
+
+    def _expire(self, key):
+        """ Remove an expired item
+        """
+        self._discard(key, "expired")
+
+    def _victim(self, key):
+        """ Return the key of the next item to discard, other than `key`
+        """
+        raise NotImplementedError("_victim must be implemented in your\
+                cache class")
+
+    def _remove(self, key):
+        """ Remove an item from the cache
+        """
+        del self.cache_data[key]
+        self.used_bytes -= self.item_sizes.pop(key, 0)
+        self.expiries.pop(key, None)
+
+    def _discard(self, key, reason="evicted"):
+        """ Remove an item to make room for another, or for `reason`, and
+            report it to `stats` and the listener
+        """
+        item = self.cache_data.get(key)
+        self._remove(key)
+        evictions = self.stats.evictions
+        evictions[reason] = evictions.get(reason, 0) + 1
+        if self.listener is not None:
+            self.listener(key, item, reason)
+
+    def _make_room(self, key, item):
+        """ Discard items, in the order given by `_victim`, until `item`
+            can be stored under `key` within `max_items` and `max_bytes`,
+            and account for its size
+
+            Returns:
+                bool: False if the item cannot fit even in an empty cache.
+                Nothing is discarded then, except an older item under
+                `key`, and the item must not be stored.
+        """
+        size = 0
+        if self.max_bytes is not None:
+            size = self.sizeof(key, item)
+        if self.max_items < 1 or (self.max_bytes is not None
+                                  and size > self.max_bytes):
+            if key in self.cache_data:
+                self._discard(key, "rejected")
+            return False
+
+        count = len(self.cache_data) + (key not in self.cache_data)
+        while count > self.max_items:
+            self._discard(self._victim(key))
+            count -= 1
+        if self.max_bytes is not None:
+            self.used_bytes += size - self.item_sizes.get(key, 0)
+            self.item_sizes[key] = size
+            while self.used_bytes > self.max_bytes:
+                self._discard(self._victim(key))
+        return True
+
+    def _make_room_many(self, items):
+        """ Discard items, in the order given by `_victim`, until the new
+            keys of `items`, a list of (key, item) pairs, fit within
+            `max_items` and `max_bytes`
+
+            All the victims are chosen before any of the items is stored,
+            so items of the batch are not discarded to make room for each
+            other unless the batch alone is larger than the cache. A cached
+            key of the batch chosen as a victim counts as a new key.
+        """
+        batch = dict(items)
+        cache_data = self.cache_data
+        new = sum(1 for key in batch if key not in cache_data)
+        extra = 0
+        if self.max_bytes is not None:
+            for key, item in batch.items():
+                size = self.sizeof(key, item)
+                # Items too large for the cache are rejected by `put`
+                if size <= self.max_bytes:
+                    extra += size - self.item_sizes.get(key, 0)
+        while cache_data and (len(cache_data) + new > self.max_items
+                              or (self.max_bytes is not None
+                                  and self.used_bytes + extra
+                                  > self.max_bytes)):
+            victim = self._victim(None)
+            if victim in batch:
+                new += 1
+                extra += self.item_sizes.get(victim, 0)
+            self._discard(victim)